@@ -21,11 +21,13 @@ import requests
 import os
 from datetime import datetime, timedelta
 
+from http_cassette import transport_from_env
+
 
 class PesapalAuth:
     """Handles Pesapal authentication"""
     
-    def __init__(self, consumer_key, consumer_secret, environment='sandbox'):
+    def __init__(self, consumer_key, consumer_secret, environment='sandbox', transport=None):
         """
         Initialize authentication handler
         
@@ -33,9 +35,12 @@ class PesapalAuth:
             consumer_key (str): Your Pesapal consumer key
             consumer_secret (str): Your Pesapal consumer secret
             environment (str): 'sandbox' or 'live'
+            transport: HTTP layer with post()/get() (defaults to the requests
+                       module; pass a CassetteTransport to run offline)
         """
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
+        self.http = transport or requests
         
         # TODO 1: Set the correct base_url based on environment
         # Sandbox: https://cybqa.pesapal.com/pesapalv3
@@ -74,7 +79,8 @@ class PesapalAuth:
         try:
             # TODO 5: Make a POST request
             # Hint: Use requests.post() with url, json=payload, headers=headers
-            response = requests.post(url, json=payload, headers=headers)
+            # (self.http is the requests module unless a cassette was passed in)
+            response = self.http.post(url, json=payload, headers=headers)
             
             # Check if request was successful
             response.raise_for_status()
@@ -149,17 +155,25 @@ class PesapalAuth:
 # ============================================
 
 def test_authentication():
-    """Test authentication with sandbox credentials"""
+    """
+    Test authentication with sandbox credentials
+    
+    Set PESAPAL_CASSETTE=auth.jsonl.gz to record the sandbox responses once
+    and replay them offline afterwards (see http_cassette.py).
+    """
     
     print("=" * 60)
     print("TESTING AUTHENTICATION")
     print("=" * 60)
     
+    transport = transport_from_env()
+    
     # Use Tanzania sandbox credentials
     auth = PesapalAuth(
         consumer_key="ngW+UEcnDhltUc5fxPfrCD987xMh3Lx8",
         consumer_secret="q27RChYs5UkypdcNYKzuUw460Dg=",
-        environment='sandbox'
+        environment='sandbox',
+        transport=transport
     )
     
     # Test 1: First authentication
@@ -188,6 +202,10 @@ def test_authentication():
     else:
         print("❌ Test 3 failed! Should return same token")
     
+    if transport is not None:
+        transport.save()
+        print(f"\n📼 Cassette ({transport.mode}): {transport.path}")
+    
     print("\n" + "=" * 60)
     print("ALL TESTS COMPLETED!")
     print("=" * 60)
@@ -18,7 +18,10 @@ TIME: 30-40 minutes
 """
 
 import json
-from datetime import datetime
+import time
+
+from payment_record import PaymentRecord, to_minor_units
+from profiling import profiler_from_env
 
 
 class MockRequest:
@@ -35,6 +38,7 @@ class MockRequest:
 class MockDatabase:
     """
     Simulates database for testing
+    (payments are stored as compact PaymentRecord objects)
     """
     def __init__(self):
         self.payments = {}
@@ -45,26 +49,22 @@ class MockDatabase:
     
     def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
         """Update payment status"""
-        if order_tracking_id in self.payments:
-            self.payments[order_tracking_id].update({
-                'status': status,
-                'payment_method': payment_method,
-                'confirmation_code': confirmation_code,
-                'updated_at': datetime.now()
-            })
+        payment = self.payments.get(order_tracking_id)
+        if payment is not None:
+            payment.apply_status(status, payment_method, confirmation_code)
             return True
         return False
     
     def create_payment(self, order_tracking_id, merchant_ref, amount):
         """Create new payment record"""
-        self.payments[order_tracking_id] = {
-            'order_tracking_id': order_tracking_id,
-            'merchant_reference': merchant_ref,
-            'amount': amount,
-            'status': 'PENDING',
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
-        }
+        now = int(time.time())
+        self.payments[order_tracking_id] = PaymentRecord(
+            order_tracking_id,
+            merchant_ref,
+            to_minor_units(amount),
+            created_at=now,
+            updated_at=now
+        )
 
 
 class MockPesapalAPI:
@@ -206,17 +206,17 @@ class IPNHandler:
         (Simplified for this exercise)
         
         Args:
-            payment (dict): Payment details
+            payment (PaymentRecord): Payment details
         """
         # TODO 5: Implement email sending logic
         # For now, just print what would be sent
         
-        if payment['status'] == 'Completed':
-            print(f"📧 Sending confirmation email for {payment['merchant_reference']}")
-            print(f"   Amount: {payment['amount']}")
-            print(f"   Status: {payment['status']}")
-        elif payment['status'] == 'Failed':
-            print(f"📧 Sending failure notification for {payment['merchant_reference']}")
+        if payment.status == 'Completed':
+            print(f"📧 Sending confirmation email for {payment.merchant_reference}")
+            print(f"   Amount: {payment.amount:.2f}")
+            print(f"   Status: {payment.status}")
+        elif payment.status == 'Failed':
+            print(f"📧 Sending failure notification for {payment.merchant_reference}")
     
     def create_ipn_response(self, order_tracking_id, merchant_ref, notification_type, success):
         """
@@ -318,6 +318,10 @@ def test_ipn_handler():
     api = MockPesapalAPI()
     handler = IPNHandler(db, api)
     
+    # PESAPAL_PROFILE=1 profiles every handle_ipn call (see profiling.py)
+    profiler = profiler_from_env()
+    profiler.instrument(handler, ['handle_ipn'])
+    
     # Create test payment
     db.create_payment('TRACK-001', 'TOUR-12345', 1500.00)
     
@@ -345,10 +349,10 @@ def test_ipn_handler():
     
     # Verify database was updated
     payment = db.get_payment('TRACK-001')
-    if payment['status'] == 'Completed':
+    if payment.status == 'Completed':
         print("✅ Database updated correctly!")
     else:
-        print(f"❌ Database not updated! Status: {payment['status']}")
+        print(f"❌ Database not updated! Status: {payment.status}")
     
     # Test 2: GET IPN for failed payment
     print("\n📝 Test 2: GET IPN - Failed Payment")
@@ -374,10 +378,10 @@ def test_ipn_handler():
     
     # Check failed payment status
     payment = db.get_payment('TRACK-002')
-    if payment['status'] == 'Failed':
+    if payment.status == 'Failed':
         print("✅ Failed payment status recorded correctly!")
     else:
-        print(f"❌ Wrong status! Expected 'Failed', got '{payment['status']}'")
+        print(f"❌ Wrong status! Expected 'Failed', got '{payment.status}'")
     
     # Test 3: IPN for non-existent payment
     print("\n📝 Test 3: IPN - Non-existent Payment")
@@ -399,6 +403,9 @@ def test_ipn_handler():
     else:
         print("❌ Test 3 failed! Should return 500 for non-existent payment")
     
+    if profiler.enabled:
+        profiler.report()
+    
     print("\n" + "=" * 60)
     print("ALL TESTS COMPLETED!")
     print("=" * 60)
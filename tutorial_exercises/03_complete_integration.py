@@ -16,11 +16,16 @@ DIFFICULTY: Advanced ⭐⭐⭐
 TIME: 60-90 minutes
 """
 
-import requests
-import json
-import sqlite3
-from datetime import datetime
-from pathlib import Path
+import _thread
+import os
+
+from lazy_imports import lazy_import
+
+# Heavy modules are imported on first use so the menu appears quickly
+# (run `python lazy_imports.py` to check startup time)
+requests = lazy_import('requests')
+json = lazy_import('json')
+sqlite3 = lazy_import('sqlite3')
 
 
 # ============================================
@@ -105,11 +110,15 @@ class PaymentDatabase:
     def get_payment_by_tracking_id(self, order_tracking_id):
         """Get payment by order tracking ID"""
         # TODO 4: Implement query
+        # Hint: from payment_record import PaymentRecord, SELECT_PAYMENT_COLUMNS
+        #       SELECT {SELECT_PAYMENT_COLUMNS} FROM payments WHERE ...
+        #       then return PaymentRecord.from_row(row) (or None)
         pass
     
     def get_all_payments(self):
         """Get all payments"""
         # TODO 5: Implement query
+        # Hint: return [PaymentRecord.from_row(row) for row in cursor]
         pass
 
 
@@ -122,10 +131,16 @@ class PesapalService:
     Complete Pesapal integration service
     """
     
-    def __init__(self, consumer_key, consumer_secret, environment='sandbox'):
+    def __init__(self, consumer_key, consumer_secret, environment='sandbox', transport=None,
+                 database=None):
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
         
+        # All HTTP calls go through self.http (self.http.post / self.http.get).
+        # It is the requests module unless a CassetteTransport is passed in
+        # for offline tests and benchmarks - see http_cassette.py
+        self.http = transport or requests
+        
         if environment == 'sandbox':
             self.base_url = "https://cybqa.pesapal.com/pesapalv3"
         else:
@@ -133,7 +148,23 @@ class PesapalService:
         
         self.token = None
         self.token_expiry = None
-        self.db = PaymentDatabase()
+        self.ipn_id = None          # set by register_ipn(); see warm_start.py
+        
+        # Any object with the PaymentDatabase methods works here, e.g. a
+        # pooled SQLitePaymentStore / SQLPaymentStore - see storage_backends.py
+        self._db = database
+        # _thread rather than threading: built in, so free at startup
+        self._db_lock = _thread.allocate_lock()
+    
+    @property
+    def db(self):
+        """Payment database, opened (and schema created) on first use"""
+        if self._db is None:
+            # Import workers can get here at the same time: open it once
+            with self._db_lock:
+                if self._db is None:
+                    self._db = PaymentDatabase()
+        return self._db
     
     def authenticate(self):
         """Get authentication token"""
@@ -197,6 +228,49 @@ class PesapalService:
         # TODO 11: Implement status check
         pass
     
+    def request_refund(self, confirmation_code, amount, username, remarks,
+                       idempotency_key=None):
+        """
+        Ask Pesapal to refund a completed payment
+        
+        Args:
+            confirmation_code (str): From GetTransactionStatus
+            amount (float): Amount to refund (at most the amount paid)
+            username (str): Who is requesting the refund
+            remarks (str): Reason for the refund
+            idempotency_key (str): Sent as Idempotency-Key (see bulk_refunds.py)
+            
+        Returns:
+            dict: Pesapal response, {'status': '200', 'message': ...} if accepted
+        """
+        url = f"{self.base_url}/api/Transactions/RefundRequest"
+        payload = {
+            "confirmation_code": confirmation_code,
+            "amount": str(amount),
+            "username": username,
+            "remarks": remarks,
+        }
+        headers = dict(self.get_headers())
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        response = self.http.post(url, json=payload, headers=headers, timeout=30)
+        return response.json()
+    
+    def cancel_order(self, order_tracking_id, idempotency_key=None):
+        """
+        Cancel an order that hasn't been paid yet
+        
+        Returns:
+            dict: Pesapal response, {'status': '200', 'message': ...} if cancelled
+        """
+        url = f"{self.base_url}/api/Transactions/CancelOrder"
+        headers = dict(self.get_headers())
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        response = self.http.post(url, json={"order_tracking_id": order_tracking_id},
+                                  headers=headers, timeout=30)
+        return response.json()
+    
     def handle_ipn(self, ipn_data):
         """
         Handle IPN notification
@@ -221,8 +295,18 @@ class TourBookingCLI:
     Interactive command-line interface for tour booking
     """
     
-    def __init__(self, pesapal_service):
+    def __init__(self, pesapal_service, reference_generator=None):
         self.service = pesapal_service
+        self._references = reference_generator
+        self._search = None         # CustomerSearch, opened on first search
+    
+    @property
+    def references(self):
+        """Merchant reference generator, created on first booking"""
+        if self._references is None:
+            from reference_ids import MerchantReferenceGenerator
+            self._references = MerchantReferenceGenerator(prefix='TOUR')
+        return self._references
     
     def display_menu(self):
         """Display main menu"""
@@ -234,7 +318,8 @@ class TourBookingCLI:
         print("3. View All Bookings")
         print("4. Register IPN URL")
         print("5. Simulate IPN Call (Testing)")
-        print("6. Exit")
+        print("6. Search Customers")
+        print("7. Exit")
         print("=" * 60)
     
     def book_tour(self):
@@ -250,7 +335,8 @@ class TourBookingCLI:
         # - Customer phone
         
         # Generate merchant reference
-        merchant_ref = f"TOUR-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # (time-ordered and unique across processes - see reference_ids.py)
+        merchant_ref = self.references.next_reference()
         
         # TODO 14: Call self.service.create_order()
         # Get redirect URL
@@ -280,6 +366,36 @@ class TourBookingCLI:
         
         pass
     
+    def search_customers(self):
+        """Find bookings by customer email, phone or name"""
+        from customer_search import CustomerSearch
+        
+        print("\n🔎 SEARCH CUSTOMERS")
+        print("-" * 60)
+        
+        db_path = getattr(self.service.db, 'db_path', None)
+        if db_path is None:
+            print("❌ Search needs an SQLite payments database")
+            return
+        if self._search is None:
+            self._search = CustomerSearch(db_path)
+            self._search.install()      # first run backfills existing bookings
+        
+        query = input("Email, phone or name: ").strip()
+        if not query:
+            return
+        
+        page = self._search.search(query)
+        while True:
+            for payment in page['results']:
+                print(f"{payment.merchant_reference:<22}{payment.customer_name or '':<22}"
+                      f"{payment.customer_phone or '':<16}{payment.status}")
+            if not page['results']:
+                print("No matching bookings")
+            if not page['next_cursor'] or input("More? [y/N]: ").strip().lower() != 'y':
+                break
+            page = self._search.search(query, cursor=page['next_cursor'])
+    
     def register_ipn_url(self):
         """Register IPN URL"""
         print("\n📡 REGISTER IPN URL")
@@ -314,15 +430,64 @@ class TourBookingCLI:
         
         pass
     
+    def import_bookings(self, input_path, callback_url, ipn_id, concurrency=8):
+        """
+        Book every row of a partner CSV/JSONL file (non-interactive)
+        
+        Args:
+            input_path (str): Bookings file (see booking_import.py for columns)
+            callback_url (str): Where Pesapal sends customers after paying
+            ipn_id (str): Registered IPN ID
+            concurrency (int): Orders submitted at once
+        """
+        print(f"\n📦 IMPORTING BOOKINGS FROM {input_path}")
+        print("-" * 60)
+        
+        from booking_import import BookingImporter, print_summary
+        
+        importer = BookingImporter(self.service, callback_url, ipn_id, concurrency)
+        summary = importer.run(input_path)
+        print_summary(summary, importer.results_path)
+        return summary
+    
+    def bulk_action(self, action, tour, batch_id=None, rate=10):
+        """
+        Refund or cancel every booking of a tour (non-interactive)
+        
+        Rerunning the same command resumes the batch; nothing is
+        refunded twice (see bulk_refunds.py).
+        
+        Args:
+            action (str): 'refund' or 'cancel'
+            tour (str): Tour name, as stored in the payment description
+            batch_id (str): Defaults to '<action>-<tour>'
+            rate (float): Pesapal requests per second
+        """
+        from bulk_refunds import BulkActionProcessor, print_summary
+        
+        batch_id = batch_id or f"{action}-{tour}"
+        print(f"\n💸 BULK {action.upper()}: {tour} (batch {batch_id})")
+        print("-" * 60)
+        
+        processor = BulkActionProcessor(self.service, self.service.db.db_path, rate=rate)
+        plan = processor.plan(batch_id, action, tour=tour)
+        print(f"   Planned {plan['planned']:,} new item(s), "
+              f"{plan['already_claimed']:,} already in a batch")
+        summary = processor.run(batch_id)
+        print_summary(summary, processor.status(batch_id))
+        processor.close()
+        return summary
+    
     def run(self):
         """Main loop"""
         # TODO 19: Authenticate on startup
         print("🔐 Authenticating with Pesapal...")
         # Call authentication
+        # (a warm start may already have restored a valid self.service.token)
         
         while True:
             self.display_menu()
-            choice = input("\nSelect option [1-6]: ").strip()
+            choice = input("\nSelect option [1-7]: ").strip()
             
             if choice == '1':
                 self.book_tour()
@@ -335,6 +500,8 @@ class TourBookingCLI:
             elif choice == '5':
                 self.simulate_ipn()
             elif choice == '6':
+                self.search_customers()
+            elif choice == '7':
                 print("\n👋 Goodbye!")
                 break
             else:
@@ -347,18 +514,48 @@ class TourBookingCLI:
 
 def main():
     """Main entry point"""
+    import argparse
+    from profiling import profiler_from_env
+    from warm_start import WarmStartSnapshot
     
     print("=" * 60)
     print("PESAPAL TOUR BOOKING SYSTEM")
     print("=" * 60)
     
+    # Non-interactive bulk import:
+    #   --import FILE --ipn-id ID --callback-url URL [--concurrency N]
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--import', dest='import_path')
+    parser.add_argument('--ipn-id')
+    parser.add_argument('--callback-url')
+    parser.add_argument('--concurrency', type=int, default=8)
+    # Bulk refund/cancel for a cancelled tour:
+    #   --bulk refund|cancel --tour NAME [--rate N]
+    parser.add_argument('--bulk', choices=['refund', 'cancel'])
+    parser.add_argument('--tour')
+    parser.add_argument('--rate', type=float, default=10)
+    parser.add_argument('--consumer-key', default=os.environ.get('PESAPAL_CONSUMER_KEY'))
+    parser.add_argument('--consumer-secret', default=os.environ.get('PESAPAL_CONSUMER_SECRET'))
+    args, _ = parser.parse_known_args()
+    if args.import_path and not (args.ipn_id and args.callback_url):
+        parser.error("--import needs --ipn-id and --callback-url")
+    if args.bulk and not args.tour:
+        parser.error("--bulk needs --tour")
+    interactive = not (args.import_path or args.bulk)
+    
     # TODO 20: Load credentials
     # Option 1: From environment variables
     # Option 2: From .env file
     # Option 3: From user input
     
-    consumer_key = input("\nConsumer Key: ").strip()
-    consumer_secret = input("Consumer Secret: ").strip()
+    # Batch runs have no one at the keyboard: --consumer-key/--consumer-secret
+    # or PESAPAL_CONSUMER_KEY/PESAPAL_CONSUMER_SECRET only
+    consumer_key = (args.consumer_key or '').strip()
+    consumer_secret = (args.consumer_secret or '').strip()
+    if interactive and not consumer_key:
+        consumer_key = input("\nConsumer Key: ").strip()
+    if interactive and not consumer_secret:
+        consumer_secret = input("Consumer Secret: ").strip()
     
     if not consumer_key or not consumer_secret:
         print("❌ Credentials required!")
@@ -367,9 +564,38 @@ def main():
     # Initialize service
     service = PesapalService(consumer_key, consumer_secret, environment='sandbox')
     
+    # Warm start: reuse the token and IPN id saved by the last run
+    snapshot = WarmStartSnapshot('warm_start.json')
+    report = snapshot.restore(service=service)
+    if report['loaded']:
+        print(f"♻️  Warm start: restored {report['tokens']} token(s), "
+              f"{report['ipn_ids']} IPN id(s)")
+    snapshot.start(service=service)
+    
     # Run CLI
     cli = TourBookingCLI(service)
-    cli.run()
+    
+    # Profiling mode: PESAPAL_PROFILE=1 or --profile (see profiling.py)
+    profiler = profiler_from_env()
+    profiler.instrument(service, ['authenticate', 'register_ipn', 'create_order',
+                                  'get_transaction_status', 'handle_ipn'])
+    profiler.instrument(cli, ['book_tour', 'check_status', 'view_bookings',
+                              'register_ipn_url', 'simulate_ipn', 'import_bookings',
+                              'search_customers', 'bulk_action'])
+    
+    if args.import_path:
+        # TODO 19 applies here too: authenticate before submitting orders
+        cli.import_bookings(args.import_path, args.callback_url, args.ipn_id,
+                            args.concurrency)
+    elif args.bulk:
+        cli.bulk_action(args.bulk, args.tour, rate=args.rate)
+    else:
+        cli.run()
+    
+    snapshot.stop()
+    
+    if profiler.enabled:
+        profiler.report()
 
 
 if __name__ == "__main__":
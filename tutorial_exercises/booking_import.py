@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Bulk Booking Import
+===================
+
+Non-interactive version of TourBookingCLI.book_tour() for partner
+batches: stream bookings from a CSV or JSONL file, validate them, submit
+orders concurrently and write a results file.
+
+- Validation uses precompiled email, phone and amount patterns
+  (the "input validation" bonus challenge from Exercise 3)
+- At most `concurrency` orders are in flight at once
+- Results are written in input order, one JSON line per row:
+      {"line": 12, "merchant_reference": "...", "status": "ok",
+       "order_tracking_id": "...", "redirect_url": "...", "errors": []}
+- Resumable: rerunning with the same results file skips rows already
+  written. Rows without a merchant_reference get a deterministic one
+  (batch id + line number), so a row that was in flight when the import
+  was interrupted is rejected as a duplicate instead of booked twice
+- Bounded memory: rows are streamed, and at most concurrency * 4 rows
+  are held between reading and writing their result
+
+Input columns (CSV header or JSONL keys):
+    tour, amount, customer_name, customer_email, customer_phone,
+    currency (default KES), merchant_reference (optional)
+
+USAGE:
+    python 03_complete_integration.py --import partners.csv \\
+        --ipn-id <IPN_ID> --callback-url https://example.com/callback
+
+    importer = BookingImporter(service, callback_url, ipn_id, concurrency=8)
+    summary = importer.run('partners.csv', 'partners.results.jsonl')
+"""
+
+import csv
+import json
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+EMAIL_RE = re.compile(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$')
+PHONE_RE = re.compile(r'^\+?[0-9]{9,15}$')
+PHONE_SEPARATORS_RE = re.compile(r'[\s().-]')
+AMOUNT_RE = re.compile(r'^[0-9]{1,9}(\.[0-9]{1,2})?$')
+CURRENCY_RE = re.compile(r'^[A-Z]{3}$')
+
+# Pesapal limits merchant references to 50 characters
+MAX_REFERENCE_LENGTH = 50
+
+# Read size when looking back from the end of a results file
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+def validate_booking(row):
+    """
+    Validate and normalize one booking row
+
+    Args:
+        row (dict): Raw CSV/JSONL row
+
+    Returns:
+        tuple: (booking dict, list of error strings)
+    """
+    errors = []
+
+    def field(name):
+        value = row.get(name)
+        return '' if value is None else str(value).strip()
+
+    tour = field('tour')
+    name = field('customer_name')
+    email = field('customer_email').lower()
+    phone = PHONE_SEPARATORS_RE.sub('', field('customer_phone'))
+    amount = field('amount')
+    currency = (field('currency') or 'KES').upper()
+
+    if not tour:
+        errors.append('tour is required')
+    if not name:
+        errors.append('customer_name is required')
+    if not EMAIL_RE.match(email):
+        errors.append(f'invalid email: {email!r}')
+    if not PHONE_RE.match(phone):
+        errors.append(f'invalid phone: {phone!r}')
+    if not AMOUNT_RE.match(amount) or float(amount) <= 0:
+        errors.append(f'invalid amount: {amount!r}')
+    if not CURRENCY_RE.match(currency):
+        errors.append(f'invalid currency: {currency!r}')
+
+    booking = {
+        'merchant_reference': field('merchant_reference'),
+        'description': tour,
+        'amount': amount,
+        'currency': currency,
+        'customer_name': name,
+        'customer_email': email,
+        'customer_phone': phone,
+    }
+    return booking, errors
+
+
+def read_bookings(path):
+    """
+    Stream rows from a CSV or JSONL file
+
+    Yields:
+        tuple: (line number, row dict); unparseable JSONL lines yield None
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+        else:
+            # Line 1 is the header
+            for line_number, row in enumerate(csv.DictReader(f), 2):
+                yield line_number, row
+
+
+def count_results(results_path):
+    """Number of rows already written to a results file (resume point)"""
+    if not os.path.exists(results_path):
+        return 0
+    count = 0
+    with open(results_path, 'rb') as f:
+        for line in f:
+            # A partly written last line (crash mid-write) doesn't count
+            if line.endswith(b'\n'):
+                count += 1
+    return count
+
+
+class BookingImporter:
+    """
+    Validates and submits bookings from a file with bounded concurrency
+    """
+
+    def __init__(self, pesapal_service, callback_url, ipn_id, concurrency=8,
+                 batch_id=None, scheduler=None):
+        """
+        Initialize importer
+
+        Args:
+            pesapal_service: PesapalService (anything with create_order())
+            callback_url (str): Where Pesapal sends customers after paying
+            ipn_id (str): Registered IPN ID
+            concurrency (int): Orders in flight at once
+            batch_id (str): Prefix for generated merchant references
+                            (defaults to the input file name)
+            scheduler: Optional PriorityScheduler; orders are then submitted
+                       as BATCH traffic so checkouts keep priority
+        """
+        self.service = pesapal_service
+        self.callback_url = callback_url
+        self.ipn_id = ipn_id
+        self.concurrency = concurrency
+        self.batch_id = batch_id
+        self.scheduler = scheduler
+        self.results_path = None    # set by run()
+
+    def _reference(self, batch_id, line_number):
+        return f"{batch_id[:MAX_REFERENCE_LENGTH - 9]}-{line_number:08d}"
+
+    def _submit(self, line_number, booking):
+        """Create one order (runs on a worker thread)"""
+        result = {
+            'line': line_number,
+            'merchant_reference': booking['merchant_reference'],
+            'status': 'ok',
+            'order_tracking_id': None,
+            'redirect_url': None,
+            'errors': [],
+        }
+        try:
+            order = self.service.create_order(
+                merchant_reference=booking['merchant_reference'],
+                amount=booking['amount'],
+                currency=booking['currency'],
+                description=booking['description'],
+                customer_name=booking['customer_name'],
+                customer_email=booking['customer_email'],
+                customer_phone=booking['customer_phone'],
+                callback_url=self.callback_url,
+                ipn_id=self.ipn_id,
+            )
+        except Exception as e:
+            order = None
+            result['errors'].append(str(e))
+        if not order or not order.get('redirect_url'):
+            result['status'] = 'error'
+            if not result['errors']:
+                error = (order or {}).get('error') or 'order was not created'
+                result['errors'].append(error if isinstance(error, str) else json.dumps(error))
+        else:
+            result['order_tracking_id'] = order.get('order_tracking_id')
+            result['redirect_url'] = order['redirect_url']
+        return result
+
+    def _start(self, executor, line_number, booking):
+        if self.scheduler is not None:
+            from request_scheduler import BATCH
+            return self.scheduler.submit(BATCH, self._submit, line_number, booking)
+        return executor.submit(self._submit, line_number, booking)
+
+    def run(self, input_path, results_path=None, progress_every=1000):
+        """
+        Import every booking in a file
+
+        Args:
+            input_path (str): CSV or JSONL bookings
+            results_path (str): JSONL results (default: <input>.results.jsonl)
+            progress_every (int): Print progress every N rows
+
+        Returns:
+            dict: rows, skipped (already done), ok, invalid, errors
+        """
+        results_path = results_path or os.path.splitext(input_path)[0] + '.results.jsonl'
+        self.results_path = results_path
+        batch_id = self.batch_id or os.path.splitext(os.path.basename(input_path))[0]
+        done = count_results(results_path)
+        if os.path.exists(results_path):
+            # Even with no complete row, a crash can leave half a first line
+            self._truncate_partial_line(results_path)
+        if done:
+            print(f"↩️  Resuming: {done:,} rows already in {results_path}")
+
+        summary = {'rows': 0, 'skipped': done, 'ok': 0, 'invalid': 0, 'errors': 0}
+        window = self.concurrency * 4
+        in_flight = {}      # future -> row index
+        finished = {}       # row index -> result, waiting for earlier rows
+        next_to_write = done
+
+        with open(results_path, 'a', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency,
+                                   thread_name_prefix='booking-import') as executor:
+
+            def write_ready():
+                nonlocal next_to_write
+                while next_to_write in finished:
+                    result = finished.pop(next_to_write)
+                    out.write(json.dumps(result) + '\n')
+                    next_to_write += 1
+                    summary['rows'] += 1
+                    if result['status'] == 'ok':
+                        summary['ok'] += 1
+                    elif result['status'] == 'invalid':
+                        summary['invalid'] += 1
+                    else:
+                        summary['errors'] += 1
+                    if summary['rows'] % progress_every == 0:
+                        out.flush()
+                        print(f"   ... {summary['rows']:,} rows "
+                              f"({summary['ok']:,} ok, {summary['invalid']:,} invalid, "
+                              f"{summary['errors']:,} errors)")
+
+            def collect(block):
+                if not in_flight:
+                    return
+                completed, _ = wait(list(in_flight), timeout=None if block else 0,
+                                    return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished[in_flight.pop(future)] = future.result()
+                write_ready()
+
+            for index, (line_number, row) in enumerate(read_bookings(input_path)):
+                if index < done:
+                    continue
+
+                if row is None:
+                    booking, errors = {'merchant_reference': ''}, ['unparseable line']
+                else:
+                    booking, errors = validate_booking(row)
+                if not booking['merchant_reference']:
+                    booking['merchant_reference'] = self._reference(batch_id, line_number)
+
+                if errors:
+                    finished[index] = {
+                        'line': line_number,
+                        'merchant_reference': booking['merchant_reference'],
+                        'status': 'invalid',
+                        'order_tracking_id': None,
+                        'redirect_url': None,
+                        'errors': errors,
+                    }
+                    write_ready()
+                    continue
+
+                # Bounded memory: wait while too many rows are in flight
+                # or waiting on a slow earlier row
+                while len(in_flight) >= self.concurrency or len(in_flight) + len(finished) >= window:
+                    collect(block=True)
+                in_flight[self._start(executor, line_number, booking)] = index
+                collect(block=False)
+
+            while in_flight:
+                collect(block=True)
+            write_ready()
+
+        return summary
+
+    @staticmethod
+    def _truncate_partial_line(results_path):
+        """Drop a half-written final line left by a crash"""
+        with open(results_path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b'\n':
+                return
+            # Walk back a block at a time to the last complete line
+            position = end
+            while position > 0:
+                start = max(0, position - TAIL_BLOCK_BYTES)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b'\n')
+                if newline != -1:
+                    f.truncate(start + newline + 1)
+                    return
+                position = start
+            f.truncate(0)
+
+
+def print_summary(summary, results_path):
+    print("\n📦 IMPORT SUMMARY")
+    print(f"   Imported: {summary['rows']:,} rows (skipped {summary['skipped']:,} done earlier)")
+    print(f"   ✅ OK:       {summary['ok']:,}")
+    print(f"   ⚠️  Invalid: {summary['invalid']:,}")
+    print(f"   ❌ Errors:   {summary['errors']:,}")
+    print(f"   Results: {results_path}")
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FakeService:
+    """create_order() with a little latency and Pesapal's duplicate check"""
+
+    def __init__(self, latency=0.001, fail_after=None, remember=True):
+        self.latency = latency
+        self.fail_after = fail_after
+        self.remember = remember
+        self.orders = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create_order(self, merchant_reference, **details):
+        import time
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.fail_after is not None and self.calls > self.fail_after:
+                raise KeyboardInterrupt
+            if merchant_reference in self.orders:
+                return {'error': {'code': 'duplicate_reference'}}
+            tracking_id = f"TRACK-{self.calls:06d}"
+            if self.remember:
+                self.orders[merchant_reference] = tracking_id
+        return {
+            'order_tracking_id': tracking_id,
+            'merchant_reference': merchant_reference,
+            'redirect_url': f"https://pay.pesapal.com/iframe?OrderTrackingId={tracking_id}",
+        }
+
+
+def _write_csv(path, rows, bad_every=0):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['tour', 'amount', 'customer_name', 'customer_email', 'customer_phone'])
+        for i in range(rows):
+            email = 'not-an-email' if bad_every and i % bad_every == 0 else f"guest{i}@example.com"
+            writer.writerow(['Maasai Mara Safari', '1500.00', f"Guest {i}",
+                             email, '+254 712 345 678'])
+
+
+def test_validators():
+    """Precompiled validators accept good rows and explain bad ones"""
+    print("\n📝 Test 1: Validators")
+
+    good, good_errors = validate_booking({
+        'tour': 'Diani Beach', 'amount': '2500.50', 'customer_name': 'Jane Doe',
+        'customer_email': 'Jane@Example.com', 'customer_phone': '+254 (712) 345-678',
+    })
+    _, bad_errors = validate_booking({
+        'tour': '', 'amount': '-5', 'customer_name': 'X',
+        'customer_email': 'jane@', 'customer_phone': '12', 'currency': 'shillings',
+    })
+
+    if (not good_errors and good['customer_phone'] == '+254712345678'
+            and good['customer_email'] == 'jane@example.com' and len(bad_errors) == 5):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! {good_errors} / {bad_errors}")
+
+
+def test_resume_after_interruption(rows=2_000):
+    """An interrupted import resumes without booking anything twice"""
+    import tempfile
+
+    print(f"\n📝 Test 2: Interrupt after ~600 orders, then resume ({rows:,} rows)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'partner.csv')
+        results_path = os.path.join(tmp, 'partner.results.jsonl')
+        _write_csv(input_path, rows, bad_every=100)
+
+        service = _FakeService(fail_after=600)
+        try:
+            BookingImporter(service, 'https://example.com/cb', 'IPN-1').run(input_path)
+        except KeyboardInterrupt:
+            pass
+        first_pass = count_results(results_path)
+
+        service.fail_after = None
+        summary = BookingImporter(service, 'https://example.com/cb', 'IPN-1').run(input_path)
+
+        with open(results_path) as f:
+            results = [json.loads(line) for line in f]
+
+        # A crash while writing the very first row leaves half a line
+        short_path = os.path.join(tmp, 'short.csv')
+        _write_csv(short_path, 5)
+        with open(os.path.join(tmp, 'short.results.jsonl'), 'w') as f:
+            f.write('{"line": 2, "merchant_ref')
+        importer = BookingImporter(_FakeService(), 'https://example.com/cb', 'IPN-1')
+        importer.run(short_path)
+        with open(importer.results_path) as f:
+            short = [json.loads(line) for line in f]
+
+        # ...and a partial last line can be longer than one tail block
+        long_path = os.path.join(tmp, 'long.results.jsonl')
+        with open(long_path, 'w') as f:
+            f.write('{"line": 2}\n{"line": 3}\n{"line": 4, "errors": ["' + 'x' * 200_000)
+        BookingImporter._truncate_partial_line(long_path)
+        with open(long_path) as f:
+            truncated = f.read()
+
+    lines = [r['line'] for r in results]
+    statuses = [r['status'] for r in results]
+    valid = rows - rows // 100
+    print(f"   First pass wrote {first_pass} rows, resume wrote {summary['rows']}")
+    print(f"   {len(service.orders)} orders created for {valid} valid rows, "
+          f"{statuses.count('error')} in-flight rows reported as duplicates")
+
+    checks = [
+        lines == sorted(lines) and len(lines) == rows,
+        len(service.orders) == valid,
+        statuses.count('invalid') == rows // 100,
+        statuses.count('ok') + statuses.count('error') == valid,
+        statuses.count('error') <= 8 * 4,
+        all(r['redirect_url'] for r in results if r['status'] == 'ok'),
+        [r['line'] for r in short] == [2, 3, 4, 5, 6],
+        truncated == '{"line": 2}\n{"line": 3}\n',
+    ]
+    if all(checks):
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! Checks: {checks}")
+
+
+def test_bounded_memory(rows=100_000):
+    """100k rows import in bounded memory"""
+    import tempfile
+    import time
+    import tracemalloc
+
+    print(f"\n📝 Test 3: {rows:,} rows, JSONL input, concurrency 16")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'partner.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for i in range(rows):
+                f.write(json.dumps({
+                    'tour': 'Amboseli Day Trip', 'amount': 900, 'customer_name': f"Guest {i}",
+                    'customer_email': f"guest{i}@example.com", 'customer_phone': '0712345678',
+                }) + '\n')
+
+        service = _FakeService(latency=0, remember=False)
+        tracemalloc.start()
+        start = time.perf_counter()
+        summary = BookingImporter(service, 'https://example.com/cb', 'IPN-1',
+                                  concurrency=16).run(input_path, progress_every=50_000)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"   {summary['ok']:,} ok in {elapsed:.1f}s, peak {peak / 1024 / 1024:.1f} MB traced")
+    if summary['ok'] == rows and peak < 16 * 1024 * 1024:
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! {summary}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING BULK BOOKING IMPORT")
+    print("=" * 60)
+
+    test_validators()
+    test_resume_after_interruption()
+    test_bounded_memory()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
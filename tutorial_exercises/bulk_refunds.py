@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Bulk Refunds and Cancellations
+==============================
+
+When a tour is cancelled, every booking for it has to be refunded
+(paid) or cancelled (still pending) - often hundreds at once. This
+module does that from the `payments` table:
+
+1. plan():  select the affected payments into bulk_action_items, one
+            row per payment with its own state and idempotency key
+2. run():   submit RefundRequest / CancelOrder calls concurrently under
+            a rate limit, recording every state change durably
+
+Never refund twice:
+- bulk_action_items is UNIQUE on (action, merchant_reference), so a
+  payment can only be planned once, whichever batch plans it
+- Each item is marked 'submitting' (and committed) by its worker right
+  before its request is sent, so at most one item per worker is in
+  doubt after a crash; items of the chunk that were never sent are
+  still 'pending' and simply run on resume. A 'submitting' refund may
+  or may not have reached Pesapal: it is checked with
+  GetTransactionStatus and marked done if the payment shows as
+  Reversed, otherwise 'needs_review'. It is never resubmitted
+  automatically. Cancellations are safe to repeat and simply go back
+  to 'pending'
+- Each request carries an Idempotency-Key header derived from
+  (action, merchant_reference), identical on every attempt
+- The claim only succeeds on a 'pending' item, so two runs of the same
+  batch (say, two operators resuming it) never send the same item twice
+
+Work is done in chunks: submit a chunk concurrently (one small commit
+per item as it is claimed), then record the outcomes and update
+`payments` in one transaction per chunk.
+
+Item states:
+    pending -> submitting -> done | failed | needs_review
+
+USAGE:
+    python 03_complete_integration.py --bulk refund --tour "Maasai Mara Safari"
+
+    processor = BulkActionProcessor(service, 'payments.db', rate=10)
+    processor.plan('refund-mara-2024-06', 'refund', tour='Maasai Mara Safari')
+    summary = processor.run('refund-mara-2024-06')   # rerun to resume
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from merchant_registry import TokenBucket
+
+
+ACTIONS = ('refund', 'cancel')
+
+# Which payments each action applies to, and their status afterwards
+ELIGIBLE_STATUS = {'refund': 'Completed', 'cancel': 'PENDING'}
+RESULT_STATUS = {'refund': 'Reversed', 'cancel': 'Cancelled'}
+
+CHUNK_SIZE = 50
+
+BULK_ITEMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS bulk_action_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        action TEXT NOT NULL,
+        merchant_reference TEXT NOT NULL,
+        order_tracking_id TEXT,
+        confirmation_code TEXT,
+        amount REAL,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        response TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (action, merchant_reference)
+    )
+'''
+BULK_ITEMS_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_bulk_items_batch ON bulk_action_items(batch_id, state)
+'''
+
+
+def idempotency_key(action, merchant_reference):
+    """Same key for every attempt at the same action on the same payment"""
+    digest = hashlib.sha256(f"{action}:{merchant_reference}".encode()).hexdigest()
+    return f"{action}-{digest[:32]}"
+
+
+def _succeeded(response):
+    """Pesapal answers {"status": "200", "message": ...} when it accepts"""
+    return isinstance(response, dict) and str(response.get('status')) == '200'
+
+
+class BulkActionProcessor:
+    """
+    Plans and runs bulk refunds/cancellations with durable per-item state
+    """
+
+    def __init__(self, pesapal_service, db_path='payments.db', rate=10, concurrency=8,
+                 chunk_size=CHUNK_SIZE, username='admin', remarks='Tour cancelled',
+                 max_attempts=3, events=None):
+        """
+        Initialize processor
+
+        Args:
+            pesapal_service: Anything with request_refund(), cancel_order()
+                             and get_transaction_status()
+            db_path (str): SQLite database with the payments table
+            rate (float): Upstream requests per second
+            concurrency (int): Requests in flight at once
+            chunk_size (int): Items claimed and recorded per transaction
+            username (str): Reported to Pesapal as the refund requester
+            remarks (str): Refund reason sent to Pesapal
+            max_attempts (int): Tries per cancellation before it fails
+            events: Optional EventSourcedPaymentDatabase; finished items are
+                    also recorded there as 'refunded'/'cancelled' events
+        """
+        self.service = pesapal_service
+        self.db_path = db_path
+        self.rate_limiter = TokenBucket(rate, capacity=max(1, min(rate, concurrency)))
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.username = username
+        self.remarks = remarks
+        self.max_attempts = max_attempts
+        self.events = events
+
+        # Workers claim their items on this connection too, under _lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        with self.conn:
+            self.conn.execute(BULK_ITEMS_TABLE_SQL)
+            self.conn.execute(BULK_ITEMS_INDEX_SQL)
+
+    # ----------------------------------------
+    # Planning
+    # ----------------------------------------
+
+    def plan(self, batch_id, action, tour=None, merchant_references=None):
+        """
+        Select the affected payments into a batch
+
+        Args:
+            batch_id (str): Name for this batch (reuse it to resume)
+            action (str): 'refund' (Completed payments) or 'cancel' (PENDING)
+            tour (str): Match payments whose description is this tour
+            merchant_references (list): Or/also match these references
+
+        Returns:
+            dict: planned (new items), already_claimed (payments planned
+                  by this or another batch before)
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"action must be one of {ACTIONS}, got {action!r}")
+        if tour is None and not merchant_references:
+            raise ValueError("give a tour or merchant references")
+
+        filters, params = [], [ELIGIBLE_STATUS[action]]
+        if tour is not None:
+            filters.append('description = ?')
+            params.append(tour)
+        if merchant_references:
+            marks = ', '.join('?' * len(merchant_references))
+            filters.append(f'merchant_reference IN ({marks})')
+            params.extend(merchant_references)
+
+        rows = self.conn.execute(f'''
+            SELECT merchant_reference, order_tracking_id, confirmation_code, amount
+            FROM payments
+            WHERE status = ? AND ({' OR '.join(filters)})
+        ''', params).fetchall()
+
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO bulk_action_items
+                    (batch_id, action, merchant_reference, order_tracking_id,
+                     confirmation_code, amount, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(batch_id, action, ref, tracking_id, code, amount,
+                   idempotency_key(action, ref))
+                  for ref, tracking_id, code, amount in rows])
+            planned = self.conn.total_changes - before
+        return {'planned': planned, 'already_claimed': len(rows) - planned}
+
+    # ----------------------------------------
+    # Running
+    # ----------------------------------------
+
+    def _call(self, item):
+        """
+        Claim and send one request (runs on a worker thread)
+
+        Returns:
+            tuple: (item, response, error), or None if another run
+                   claimed the item first
+        """
+        item_id, action, _, tracking_id, code, amount, key, _ = item
+        self.rate_limiter.acquire()
+        # Write-ahead: the claim is durable before the request is sent
+        with self._lock, self.conn:
+            claimed = self.conn.execute('''
+                UPDATE bulk_action_items
+                SET state = 'submitting', attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND state = 'pending'
+            ''', (item_id,)).rowcount
+        if not claimed:
+            return None
+        try:
+            if action == 'refund':
+                response = self.service.request_refund(
+                    confirmation_code=code, amount=amount, username=self.username,
+                    remarks=self.remarks, idempotency_key=key)
+            else:
+                response = self.service.cancel_order(tracking_id, idempotency_key=key)
+        except Exception as e:
+            return item, None, str(e)
+        return item, response, None
+
+    def _outcome(self, item, response, error):
+        """
+        Decide an item's next state from its response
+
+        Returns:
+            str: 'done', 'failed', 'needs_review' or 'pending' (retry)
+        """
+        action, attempts = item[1], item[-1]
+        if error is None:
+            return 'done' if _succeeded(response) else 'failed'
+        if action == 'refund':
+            # The refund may have been accepted before the error; asking
+            # again could refund twice
+            return 'needs_review'
+        return 'pending' if attempts < self.max_attempts else 'failed'
+
+    def _recover(self, batch_id):
+        """
+        Settle items left 'submitting' by a crash
+
+        Returns:
+            int: Items recovered
+        """
+        stuck = self.conn.execute('''
+            SELECT id, action, merchant_reference, order_tracking_id FROM bulk_action_items
+            WHERE batch_id = ? AND state = 'submitting'
+        ''', (batch_id,)).fetchall()
+        updates, finished = [], []
+        for item_id, action, ref, tracking_id in stuck:
+            if action == 'cancel':
+                updates.append(('pending', None, item_id))
+                continue
+            try:
+                status = self.service.get_transaction_status(tracking_id) or {}
+            except Exception:
+                status = {}
+            if status.get('payment_status_description') == RESULT_STATUS['refund']:
+                updates.append(('done', json.dumps({'recovered': status}), item_id))
+                finished.append((action, ref, tracking_id))
+            else:
+                updates.append(('needs_review', json.dumps({'recovered': status}), item_id))
+        with self.conn:
+            # A run still working on the item records its own outcome
+            self.conn.executemany('''
+                UPDATE bulk_action_items SET state = ?, response = COALESCE(?, response),
+                       updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND state = 'submitting'
+            ''', updates)
+            self._mark_payments(finished)
+        return len(updates)
+
+    def _mark_payments(self, finished):
+        """
+        Set payments.status for finished items (caller holds the transaction)
+
+        Args:
+            finished (list): (action, merchant_reference, order_tracking_id)
+        """
+        self.conn.executemany('''
+            UPDATE payments SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE merchant_reference = ?
+        ''', [(RESULT_STATUS[action], ref) for action, ref, _ in finished])
+        if self.events is not None:
+            # Otherwise the next compaction could put back an older status
+            for action, _, tracking_id in finished:
+                self.events.record('refunded' if action == 'refund' else 'cancelled',
+                                   tracking_id, status=RESULT_STATUS[action])
+
+    def run(self, batch_id, progress_every=100):
+        """
+        Process every unfinished item of a batch
+
+        Args:
+            batch_id (str): Batch created by plan()
+            progress_every (int): Print progress every N items
+
+        Returns:
+            dict: done, failed, needs_review, recovered, submitted, seconds,
+                  per_second
+        """
+        summary = {'done': 0, 'failed': 0, 'needs_review': 0, 'recovered': 0,
+                   'submitted': 0}
+        summary['recovered'] = self._recover(batch_id)
+        if summary['recovered']:
+            print(f"↩️  Recovered {summary['recovered']} item(s) interrupted mid-request")
+
+        start = time.perf_counter()
+        reported = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix='bulk-refund') as executor:
+            while True:
+                chunk = self.conn.execute('''
+                    SELECT id, action, merchant_reference, order_tracking_id,
+                           confirmation_code, amount, idempotency_key, attempts + 1
+                    FROM bulk_action_items
+                    WHERE batch_id = ? AND state = 'pending'
+                    ORDER BY id LIMIT ?
+                ''', (batch_id, self.chunk_size)).fetchall()
+                if not chunk:
+                    break
+
+                outcomes, finished = [], []
+                for result in executor.map(self._call, chunk):
+                    if result is None:
+                        continue
+                    item, response, error = result
+                    state = self._outcome(item, response, error)
+                    outcomes.append((state, json.dumps(response if error is None
+                                                       else {'error': error}), item[0]))
+                    summary['submitted'] += 1
+                    if state != 'pending':
+                        summary[state] += 1
+                    if state == 'done':
+                        finished.append((item[1], item[2], item[3]))
+
+                with self._lock, self.conn:
+                    self.conn.executemany('''
+                        UPDATE bulk_action_items SET state = ?, response = ?,
+                               updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ?
+                    ''', outcomes)
+                    self._mark_payments(finished)
+
+                if summary['submitted'] - reported >= progress_every:
+                    reported = summary['submitted']
+                    elapsed = time.perf_counter() - start
+                    print(f"   ... {summary['submitted']:,} submitted, "
+                          f"{summary['done']:,} done, {summary['failed']:,} failed, "
+                          f"{summary['needs_review']:,} to review "
+                          f"({summary['submitted'] / elapsed:.1f}/s)")
+
+        summary['seconds'] = time.perf_counter() - start
+        summary['per_second'] = summary['submitted'] / summary['seconds'] if summary['seconds'] else 0.0
+        return summary
+
+    def status(self, batch_id):
+        """
+        Returns:
+            dict: state -> item count for a batch
+        """
+        return dict(self.conn.execute('''
+            SELECT state, COUNT(*) FROM bulk_action_items WHERE batch_id = ? GROUP BY state
+        ''', (batch_id,)).fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def print_summary(summary, counts):
+    print("\n💸 BULK ACTION SUMMARY")
+    print(f"   Submitted: {summary['submitted']:,} in {summary['seconds']:.1f}s "
+          f"({summary['per_second']:.1f}/s)")
+    print(f"   ✅ Done:          {counts.get('done', 0):,}")
+    print(f"   ❌ Failed:        {counts.get('failed', 0):,}")
+    print(f"   🔍 Needs review:  {counts.get('needs_review', 0):,}")
+    if counts.get('pending'):
+        print(f"   ⏳ Still pending: {counts['pending']:,} (rerun to continue)")
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FakePesapal:
+    """
+    RefundRequest / CancelOrder / GetTransactionStatus with latency
+
+    crash_after: raise KeyboardInterrupt *after* accepting that many
+    requests, like a process dying before it sees the response.
+    """
+
+    def __init__(self, latency=0.002, crash_after=None, flaky_cancels=0):
+        self.latency = latency
+        self.crash_after = crash_after
+        self.flaky_cancels = flaky_cancels
+        self.refunds = {}           # confirmation code -> times refunded
+        self.cancels = {}
+        self.keys = set()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _accept(self, ledger, key, idem_key):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            ledger[key] = ledger.get(key, 0) + 1
+            self.keys.add(idem_key)
+            if self.crash_after is not None and self.calls > self.crash_after:
+                raise KeyboardInterrupt
+        return {'status': '200', 'message': 'Request accepted'}
+
+    def request_refund(self, confirmation_code, amount, username, remarks, idempotency_key=None):
+        return self._accept(self.refunds, confirmation_code, idempotency_key)
+
+    def cancel_order(self, order_tracking_id, idempotency_key=None):
+        with self._lock:
+            if self.flaky_cancels:
+                self.flaky_cancels -= 1
+                raise ConnectionError('connection reset')
+        return self._accept(self.cancels, order_tracking_id, idempotency_key)
+
+    def get_transaction_status(self, order_tracking_id):
+        refunded = f"CODE-{order_tracking_id}" in self.refunds
+        return {'payment_status_description': 'Reversed' if refunded else 'Completed'}
+
+
+def _populate(db_path, paid=300, pending=100, other_tour=50):
+    from payment_record import PAYMENTS_TABLE_SQL
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(PAYMENTS_TABLE_SQL)
+    rows = []
+    for i in range(paid + pending + other_tour):
+        tour = 'Maasai Mara Safari' if i < paid + pending else 'Amboseli Day Trip'
+        status = 'PENDING' if paid <= i < paid + pending else 'Completed'
+        rows.append((f"TOUR-{i:06d}", f"T{i:06d}", 1500.0, 'KES', tour, status,
+                     f"CODE-T{i:06d}" if status == 'Completed' else None))
+    with conn:
+        conn.executemany('''
+            INSERT INTO payments (merchant_reference, order_tracking_id, amount, currency,
+                                  description, status, confirmation_code)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    conn.close()
+
+
+def _statuses(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = dict(conn.execute('SELECT status, COUNT(*) FROM payments GROUP BY status'))
+    conn.close()
+    return counts
+
+
+def test_refund_and_cancel_tour():
+    """Every booking of the tour is refunded or cancelled exactly once, at the rate limit"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 1: Refund and cancel a whole tour")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        _populate(db_path)
+        fake = _FakePesapal()
+        processor = BulkActionProcessor(fake, db_path, rate=200, concurrency=8)
+
+        refunds = processor.plan('mara', 'refund', tour='Maasai Mara Safari')
+        cancels = processor.plan('mara', 'cancel', tour='Maasai Mara Safari')
+        again = processor.plan('mara-again', 'refund', tour='Maasai Mara Safari')
+        summary = processor.run('mara', progress_every=10_000)
+        counts = processor.status('mara')
+        processor.close()
+        statuses = _statuses(db_path)
+
+    checks = {
+        'planned': refunds['planned'] == 300 and cancels['planned'] == 100,
+        'no double plan': again == {'planned': 0, 'already_claimed': 300},
+        'done': counts == {'done': 400},
+        'once': max(fake.refunds.values()) == 1 and len(fake.refunds) == 300 and
+                len(fake.keys) == 400,
+        'payments': statuses == {'Reversed': 300, 'Cancelled': 100, 'Completed': 50},
+        'rate': summary['per_second'] <= 200 * 1.1,
+    }
+    print(f"   {summary['submitted']} requests in {summary['seconds']:.2f}s "
+          f"({summary['per_second']:.0f}/s, limit 200/s)")
+    if all(checks.values()):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! {checks}")
+
+
+def test_resume_after_crash():
+    """A crash mid-chunk never leads to a second refund"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 2: Resume after a crash without double refunds")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        _populate(db_path, paid=300, pending=0)
+        fake = _FakePesapal(crash_after=137)
+
+        processor = BulkActionProcessor(fake, db_path, rate=1000, concurrency=8, chunk_size=40)
+        processor.plan('mara', 'refund', tour='Maasai Mara Safari')
+        try:
+            processor.run('mara', progress_every=10_000)
+            crashed = False
+        except KeyboardInterrupt:
+            crashed = True
+        processor.close()
+
+        fake.crash_after = None
+        processor = BulkActionProcessor(fake, db_path, rate=1000, concurrency=8, chunk_size=40)
+        summary = processor.run('mara', progress_every=10_000)
+        counts = processor.status('mara')
+        processor.close()
+        statuses = _statuses(db_path)
+
+    # Requests accepted upstream but whose responses were lost are
+    # recognized as Reversed; the rest of the interrupted chunk was
+    # never sent (nor claimed), so it simply runs on resume
+    checks = {
+        'crashed': crashed,
+        'no double refund': max(fake.refunds.values()) == 1,
+        'recovered': summary['recovered'] > 0,
+        'accounted': counts == {'done': 300} and len(fake.refunds) == 300,
+        'payments': statuses.get('Reversed') == 300,
+    }
+    print(f"   Recovered {summary['recovered']}, refunded {len(fake.refunds)}, "
+          f"{counts.get('needs_review', 0)} flagged for review")
+    if all(checks.values()):
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! {checks} {counts}")
+
+
+def test_cancellations_retry():
+    """Transient cancellation errors are retried; repeated failures give up"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 3: Cancellation retries")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        _populate(db_path, paid=0, pending=20, other_tour=0)
+        fake = _FakePesapal(flaky_cancels=5)
+        processor = BulkActionProcessor(fake, db_path, rate=1000, max_attempts=3)
+        processor.plan('mara', 'cancel', tour='Maasai Mara Safari')
+        processor.run('mara', progress_every=10_000)
+        counts = processor.status('mara')
+
+        stubborn = _FakePesapal(flaky_cancels=10_000)
+        processor.service = stubborn
+        processor.conn.execute("UPDATE bulk_action_items SET state = 'pending', attempts = 0")
+        processor.conn.commit()
+        processor.run('mara', progress_every=10_000)
+        failed = processor.status('mara')
+        processor.close()
+
+    if counts == {'done': 20} and failed == {'failed': 20}:
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! {counts} / {failed}")
+
+
+def test_concurrent_runs():
+    """Two runs of the same batch split the items instead of both sending them"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 4: Two concurrent runs of one batch")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        _populate(db_path, paid=200, pending=0, other_tour=0)
+        fake = _FakePesapal()
+        processors = [BulkActionProcessor(fake, db_path, rate=1000, concurrency=8, chunk_size=20)
+                      for _ in range(2)]
+        processors[0].plan('mara', 'refund', tour='Maasai Mara Safari')
+
+        summaries = [None, None]
+
+        def run(n):
+            summaries[n] = processors[n].run('mara', progress_every=10_000)
+
+        runners = [threading.Thread(target=run, args=(n,)) for n in range(2)]
+        for runner in runners:
+            runner.start()
+        for runner in runners:
+            runner.join()
+        counts = processors[0].status('mara')
+        for processor in processors:
+            processor.close()
+        statuses = _statuses(db_path)
+
+    submitted = [summary['submitted'] for summary in summaries]
+    checks = {
+        'once': max(fake.refunds.values()) == 1 and len(fake.refunds) == 200,
+        'split': sum(submitted) == 200,
+        'done': counts == {'done': 200} and statuses == {'Reversed': 200},
+    }
+    print(f"   Runs submitted {submitted[0]} + {submitted[1]}, "
+          f"{sum(fake.refunds.values())} refunds for 200 payments")
+    if all(checks.values()):
+        print("✅ Test 4 passed!")
+    else:
+        print(f"❌ Test 4 failed! {checks} {counts}")
+
+
+def main():
+    print("=" * 60)
+    print("TESTING BULK REFUNDS")
+    print("=" * 60)
+
+    test_refund_and_cancel_tour()
+    test_resume_after_crash()
+    test_cancellations_retry()
+    test_concurrent_runs()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+IPN Traffic Recorder and Replay Tool
+====================================
+
+Record real notification storms, then replay them to size capacity.
+
+RECORDING:
+    Wrap any IPN handler (IPNHandler, SimulatedIPNHandler, ...):
+
+        handler = RecordingIPNHandler(IPNHandler(db, api), 'ipn-traffic.log')
+
+    or start the server with:  python ipn_server.py serve --record ipn-traffic.log
+
+    Each notification is appended to the log as one compact JSON line:
+        [arrival_epoch, "GET"|"POST", {params}, latency_ms, http_status]
+
+REPLAY:
+    python ipn_replay.py ipn-traffic.log --speed 1         # real time
+    python ipn_replay.py ipn-traffic.log --speed 10        # 10x faster
+    python ipn_replay.py ipn-traffic.log --speed max       # as fast as possible
+    python ipn_replay.py ipn-traffic.log --target http://localhost:8000/ipn
+
+Gaps between notifications are divided by the speed factor, so bursts keep
+their shape. The report compares throughput, error rate and latency
+percentiles against the recorded baseline:
+
+- handler ms:    time inside handle_ipn() - recorded, and replayed
+                 when the target is a handler object
+- round trip ms: client send -> response, when the target is a URL
+- response ms:   from the time the request was *due* to its response,
+                 so requests that waited for a free worker (or fell
+                 behind schedule) count their wait too
+- dispatch lag:  how late requests were handed to a worker
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from ipn_server import IPNRequest
+
+
+# ============================================
+# RECORDING
+# ============================================
+
+class IPNTrafficLog:
+    """
+    Append-only log of IPN notifications
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, arrival, method, params, latency_ms, status):
+        """
+        Append one notification
+
+        Args:
+            arrival (float): Epoch seconds when the request arrived
+            method (str): 'GET' or 'POST'
+            params (dict): IPN parameters
+            latency_ms (float): Time the handler took
+            status (int): HTTP status returned
+        """
+        line = json.dumps(
+            [round(arrival, 6), method, params, round(latency_ms, 3), status],
+            separators=(',', ':')
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def read(path):
+        """
+        Iterate over a traffic log
+
+        Yields:
+            tuple: (arrival, method, params, latency_ms, status)
+        """
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    arrival, method, params, latency_ms, status = json.loads(line)
+                    yield arrival, method, params, latency_ms, status
+
+
+class RecordingIPNHandler:
+    """
+    Wraps an IPN handler and records every notification it handles
+    """
+
+    def __init__(self, handler, log_path):
+        self.handler = handler
+        self.log = IPNTrafficLog(log_path)
+
+    @staticmethod
+    def _params(request):
+        if request.method == 'POST':
+            try:
+                return json.loads(request.body)
+            except ValueError:
+                return {}
+        return dict(request.GET)
+
+    def handle_ipn(self, request):
+        arrival = time.time()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response, status = self.handler.handle_ipn(request)
+            return response, status
+        finally:
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.log.append(arrival, request.method, self._params(request), latency_ms, status)
+
+    def __getattr__(self, name):
+        # Anything else (db, api, ready, ...) comes from the wrapped handler
+        return getattr(self.handler, name)
+
+
+# ============================================
+# REPLAY
+# ============================================
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+
+    def pick(pct):
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    return {'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99)}
+
+
+def _summarize(latencies_ms, errors, duration, prefix=''):
+    summary = {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'error_rate': errors / len(latencies_ms) if latencies_ms else 0.0,
+        'duration_s': duration,
+        'requests_per_sec': len(latencies_ms) / duration if duration > 0 else 0.0,
+    }
+    summary.update({prefix + key: value for key, value in _percentiles(latencies_ms).items()})
+    return summary
+
+
+def baseline_from_log(path):
+    """
+    Summarize the recorded traffic
+
+    Returns:
+        dict: requests, errors, error_rate, duration_s, requests_per_sec,
+              handler_p50_ms, handler_p95_ms, handler_p99_ms
+    """
+    latencies, errors, first, last = [], 0, None, None
+    for arrival, _method, _params, latency_ms, status in IPNTrafficLog.read(path):
+        latencies.append(latency_ms)
+        errors += status != 200
+        first = arrival if first is None else first
+        last = arrival
+    duration = (last - first) if latencies else 0.0
+    # Recorded latencies are handler times, measured inside the server
+    return _summarize(latencies, errors, duration, prefix='handler_')
+
+
+class _HTTPTarget:
+    """Sends IPNs to an HTTP endpoint over per-thread keep-alive connections"""
+
+    measures = 'round_trip'
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.path = parts.path or '/'
+        self._local = threading.local()
+
+    def _connection(self):
+        import http.client
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def send(self, method, params):
+        conn = self._connection()
+        try:
+            if method == 'POST':
+                conn.request('POST', self.path, body=json.dumps(params),
+                             headers={'Content-Type': 'application/json'})
+            else:
+                conn.request('GET', f"{self.path}?{urlencode(params)}")
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except Exception:
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+class _HandlerTarget:
+    """Calls handle_ipn() directly, building the same request objects as ipn_server"""
+
+    measures = 'handler'
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def send(self, method, params):
+        if method == 'POST':
+            request = IPNRequest('POST', '/ipn', '', json.dumps(params).encode(), {})
+        else:
+            request = IPNRequest('GET', '/ipn', urlencode(params), b'', {})
+        _response, status = self.handler.handle_ipn(request)
+        return status
+
+
+def replay(log_path, target, speed=1.0, concurrency=32):
+    """
+    Re-send recorded IPNs against a handler or HTTP endpoint
+
+    Args:
+        log_path (str): Traffic log written by RecordingIPNHandler
+        target: Handler object with handle_ipn(), or an 'http://...' URL
+        speed (float or 'max'): Time scale (1 = as recorded, 10 = 10x faster)
+        concurrency (int): Maximum requests in flight
+
+    Returns:
+        dict: requests, errors, error_rate, duration_s, requests_per_sec,
+              p50_ms, p95_ms, p99_ms (response time from when each request
+              was due), handler_* or round_trip_* percentiles (time in
+              send), lag_p50_ms, lag_p99_ms, lag_max_ms (dispatch lag)
+
+    Raises:
+        ValueError: speed is not 'max' or a number above 0
+    """
+    as_fast_as_possible = speed == 'max'
+    if not as_fast_as_possible:
+        speed = float(speed)
+        if not speed > 0:
+            raise ValueError(f"speed must be above 0 or 'max', got {speed:g}")
+    sender = _HTTPTarget(target) if isinstance(target, str) else _HandlerTarget(target)
+
+    responses, services, lags = [], [], []
+    errors = [0]
+    lock = threading.Lock()
+    # Don't queue more than this ahead of the workers, so 'max' speed
+    # stays bounded in memory on huge logs. Time spent waiting here is
+    # part of the response time and the dispatch lag, not hidden.
+    in_flight = threading.BoundedSemaphore(concurrency * 4)
+
+    def fire(method, params, due):
+        # Timed from `due`, not from when a worker got to it: otherwise
+        # a backlog would hide exactly the delay a burst causes
+        sent = time.perf_counter()
+        try:
+            status = sender.send(method, params)
+        except Exception:
+            status = 0
+        done = time.perf_counter()
+        with lock:
+            responses.append((done - due) * 1000)
+            services.append((done - sent) * 1000)
+            lags.append((sent - due) * 1000)
+            if status != 200:
+                errors[0] += 1
+        in_flight.release()
+
+    first_arrival = None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for arrival, method, params, _latency, _status in IPNTrafficLog.read(log_path):
+            if first_arrival is None:
+                first_arrival = arrival
+            if as_fast_as_possible:
+                due = time.perf_counter()
+            else:
+                due = start + (arrival - first_arrival) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            in_flight.acquire()
+            pool.submit(fire, method, params, due)
+    duration = time.perf_counter() - start
+
+    summary = _summarize(responses, errors[0], duration)
+    summary.update({f"{sender.measures}_{key}": value
+                    for key, value in _percentiles(services).items()})
+    lag = _percentiles(lags)
+    summary.update({'lag_p50_ms': lag['p50_ms'], 'lag_p99_ms': lag['p99_ms'],
+                    'lag_max_ms': max(lags, default=0.0)})
+    return summary
+
+
+def print_comparison(baseline, result):
+    """
+    Print replay results next to the recorded baseline
+
+    Only like is compared with like: the recorded handler times line up
+    with replayed handler times (a handler target), never with round
+    trips. A figure that wasn't measured on one side shows as '-'.
+    """
+    print(f"   {'':<20}{'recorded':>12}{'replayed':>12}")
+    rows = [('requests', '{:,.0f}'), ('requests_per_sec', '{:,.1f}'),
+            ('error_rate', '{:.2%}')]
+    for measure in ('handler', 'round_trip'):
+        if any(f"{measure}_p50_ms" in side for side in (baseline, result)):
+            rows += [(f"{measure}_{pct}_ms", '{:.2f}') for pct in ('p50', 'p95', 'p99')]
+    rows += [('p50_ms', '{:.2f}'), ('p99_ms', '{:.2f}'),
+             ('lag_p99_ms', '{:.2f}'), ('lag_max_ms', '{:.2f}')]
+    labels = {'p50_ms': 'response_p50_ms', 'p99_ms': 'response_p99_ms'}
+    for key, fmt in rows:
+        values = [fmt.format(side[key]) if key in side else '-' for side in (baseline, result)]
+        print(f"   {labels.get(key, key):<20}{values[0]:>12}{values[1]:>12}")
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _write_storm(path, bursts=5, per_burst=200, gap=0.5):
+    """Record synthetic bursts through a RecordingIPNHandler"""
+    from ipn_server import SimulatedIPNHandler
+
+    handler = RecordingIPNHandler(SimulatedIPNHandler(), path)
+    base = time.time()
+    for burst in range(bursts):
+        for i in range(per_burst):
+            params = {
+                'OrderTrackingId': f"TRACK-{burst}-{i}",
+                'OrderMerchantReference': f"TOUR-{burst}-{i}",
+                'OrderNotificationType': 'IPNCHANGE',
+            }
+            # Arrival times are faked so the storm shape doesn't depend on
+            # how fast this loop runs
+            handler.log.append(base + burst * gap + i * 0.0005, 'POST' if i % 2 else 'GET',
+                               params, 0.2, 200)
+    handler.log.close()
+
+
+def test_record_and_replay():
+    """A recorded storm replays against a handler and an HTTP endpoint"""
+    import asyncio
+    import os
+    import tempfile
+
+    from ipn_server import IPNServer, SimulatedIPNHandler, _new_event_loop
+
+    print("\n📝 Test 1: Record, then replay at max speed and 10x")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'ipn.log')
+
+        # Real recording path: requests go through the wrapper
+        recorder = RecordingIPNHandler(SimulatedIPNHandler(), log_path)
+        recorder.handle_ipn(IPNRequest('GET', '/ipn', 'OrderTrackingId=TRACK-X', b'', {}))
+        recorder.log.close()
+        recorded = list(IPNTrafficLog.read(log_path))
+        os.remove(log_path)
+
+        _write_storm(log_path)
+        baseline = baseline_from_log(log_path)
+
+        direct = replay(log_path, SimulatedIPNHandler(), speed='max')
+
+        loop = _new_event_loop()
+        server = IPNServer(SimulatedIPNHandler(), offload=False)
+        loop.run_until_complete(server.start('127.0.0.1', 0))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            http = replay(log_path, f"http://127.0.0.1:{server.port}/ipn", speed=10)
+        finally:
+            asyncio.run_coroutine_threadsafe(server.drain(), loop).result(10)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+
+    print_comparison(baseline, http)
+
+    expected_span = baseline['duration_s'] / 10
+    checks = [
+        len(recorded) == 1 and recorded[0][2] == {'OrderTrackingId': 'TRACK-X'},
+        direct['requests'] == baseline['requests'] == 1000,
+        direct['errors'] == 0 and http['errors'] == 0,
+        # 10x replay of a ~2s storm should take ~0.2s, not run flat out or in real time
+        expected_span * 0.8 <= http['duration_s'] <= expected_span + 2,
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+class _SlowHandler:
+    """Takes `delay` seconds per IPN"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def handle_ipn(self, request):
+        time.sleep(self.delay)
+        return {'status': 200}, 200
+
+
+def test_backlog_is_measured():
+    """Requests queued behind a slow handler count their wait; bad speeds are rejected"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 2: Backlog shows up in response time and dispatch lag")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'ipn.log')
+        # 100 IPNs 1 ms apart against one worker taking 5 ms each:
+        # the last one is due at ~0.1s but only starts at ~0.5s
+        _write_storm(log_path, bursts=1, per_burst=100)
+        result = replay(log_path, _SlowHandler(0.005), speed=0.5, concurrency=1)
+        rejected = []
+        for speed in (0, -1, 'nan'):
+            try:
+                replay(log_path, _SlowHandler(0), speed=speed)
+            except ValueError:
+                rejected.append(speed)
+
+    print(f"   handler p99 {result['handler_p99_ms']:.1f} ms, response p99 "
+          f"{result['p99_ms']:.1f} ms, dispatch lag max {result['lag_max_ms']:.1f} ms")
+    checks = [
+        result['handler_p99_ms'] < 20,
+        result['p99_ms'] > 200 and result['lag_max_ms'] > 200,
+        'round_trip_p50_ms' not in result,
+        rejected == [0, -1, 'nan'],
+    ]
+    if all(checks):
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! Checks: {checks}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded IPN traffic')
+    parser.add_argument('log', nargs='?', help='Traffic log to replay')
+    parser.add_argument('--target', help="URL to replay against (default: local simulator)")
+    parser.add_argument('--speed', default='1', help="Time scale, e.g. 1, 10 or 'max'")
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    if not args.log:
+        print("=" * 60)
+        print("TESTING IPN RECORD / REPLAY")
+        print("=" * 60)
+
+        test_record_and_replay()
+        test_backlog_is_measured()
+
+        print("\n" + "=" * 60)
+        print("ALL TESTS COMPLETED!")
+        print("=" * 60)
+        return
+
+    if args.target:
+        target = args.target
+    else:
+        from ipn_server import SimulatedIPNHandler
+        target = SimulatedIPNHandler()
+
+    try:
+        speed = args.speed if args.speed == 'max' else float(args.speed)
+    except ValueError:
+        speed = None
+    if speed is None or (speed != 'max' and not speed > 0):
+        parser.error(f"--speed must be above 0 or 'max', got {args.speed}")
+    label = 'max speed' if speed == 'max' else f"{speed:g}x"
+    print(f"🔁 Replaying {args.log} at {label} ...")
+    result = replay(args.log, target, speed=speed, concurrency=args.concurrency)
+    print_comparison(baseline_from_log(args.log), result)
+
+
+if __name__ == "__main__":
+    main()
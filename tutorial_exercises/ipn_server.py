@@ -0,0 +1,740 @@
+#!/usr/bin/env python3
+"""
+IPN HTTP Server
+===============
+
+A small, dependency-free HTTP/1.1 server for the IPN endpoint, so you
+don't need Flask/Django glue just to receive Pesapal notifications.
+
+- GET  /ipn?OrderTrackingId=...&OrderMerchantReference=...&OrderNotificationType=...
+- POST /ipn  with a JSON body
+- GET  /health  (liveness)  and  GET /ready  (readiness, 503 while draining)
+
+Both request styles are turned into an IPNRequest object with the same
+`.method`, `.GET` and `.body` attributes as MockRequest, so
+IPNHandler.extract_ipn_parameters() works unchanged.
+
+Performance features:
+- asyncio event loop (uses uvloop automatically if it is installed)
+- HTTP keep-alive with an idle timeout
+- Header and body size limits (431 / 413 responses)
+- Pre-fork workers sharing one listening socket (--workers N)
+- Blocking handlers (IPNHandler calls Pesapal) run in a thread pool
+
+USAGE:
+    python ipn_server.py serve --port 8000 --workers 4
+    python ipn_server.py serve --record ipn-traffic.log
+    python ipn_server.py serve --profile      # see profiling.py
+    python ipn_server.py loadtest --seconds 10 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 15  # seconds a keep-alive connection may sit idle
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class IPNRequest:
+    """
+    Request object passed to IPNHandler.handle_ipn()
+    (same attributes as MockRequest in Exercise 2)
+    """
+
+    __slots__ = ('method', 'path', 'GET', 'POST', 'body', 'headers')
+
+    def __init__(self, method, path, query, body, headers):
+        self.method = method
+        self.path = path
+        self.GET = {key: values[0] for key, values in parse_qs(query).items()}
+        self.body = body.decode('utf-8') if body else '{}'
+        self.headers = headers
+        try:
+            self.POST = json.loads(self.body) if method == 'POST' else {}
+        except ValueError:
+            self.POST = {}
+
+
+class SimulatedIPNHandler:
+    """
+    Local stand-in for IPNHandler + Pesapal, used by the load test
+
+    Every tracking ID "exists" and verifies as Completed.
+    """
+
+    def __init__(self):
+        from payment_repository import InMemoryPaymentRepository
+        self.db = InMemoryPaymentRepository()
+        self._lock = threading.Lock()
+
+    def handle_ipn(self, request):
+        if request.method == 'POST':
+            data = json.loads(request.body)
+        else:
+            data = request.GET
+
+        tracking_id = data.get('OrderTrackingId')
+        merchant_ref = data.get('OrderMerchantReference')
+        response = {
+            'orderNotificationType': data.get('OrderNotificationType'),
+            'orderTrackingId': tracking_id,
+            'orderMerchantReference': merchant_ref,
+            'status': 200,
+        }
+        if not tracking_id:
+            response['status'] = 500
+            return response, 500
+
+        with self._lock:
+            if tracking_id not in self.db:
+                self.db.create_payment(tracking_id, merchant_ref, 1500.0)
+            self.db.update_payment(tracking_id, 'Completed', 'M-Pesa', 'SIM123')
+        return response, 200
+
+
+class IPNServer:
+    """
+    asyncio HTTP/1.1 server wrapping an IPN handler
+    """
+
+    def __init__(self, handler, ipn_path='/ipn', max_body=MAX_BODY_BYTES,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT, offload=True, threads=32):
+        """
+        Initialize server
+
+        Args:
+            handler: Object with handle_ipn(request) -> (dict, status_code)
+            ipn_path (str): URL path Pesapal calls
+            max_body (int): Largest accepted request body in bytes
+            keep_alive_timeout (float): Idle seconds before closing a connection
+            offload (bool): Run the handler in a thread pool (True for
+                            handlers that make blocking network/database calls)
+            threads (int): Thread pool size when offload is True
+        """
+        self.handler = handler
+        self.ipn_path = ipn_path
+        self.max_body = max_body
+        self.keep_alive_timeout = keep_alive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads) if offload else None
+
+        self.ready = False
+        self.requests_served = 0
+        self._server = None
+        self._connections = {}      # writer -> True while it is handling a request
+        self._drained = None        # set by the last connection to close while draining
+
+    # ----------------------------------------
+    # HTTP plumbing
+    # ----------------------------------------
+
+    @staticmethod
+    def _encode_response(status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        ).encode()
+        return head + body
+
+    async def _read_request(self, reader):
+        """
+        Read one request from the connection
+
+        Returns:
+            tuple: (method, target, version, headers, body), None on EOF,
+                   or an int HTTP error status
+        """
+        try:
+            raw = await asyncio.wait_for(
+                reader.readuntil(b'\r\n\r\n'), self.keep_alive_timeout
+            )
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            return 431
+
+        try:
+            lines = raw[:-4].decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            return 400
+
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            return 411
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400
+        if length > self.max_body:
+            return 413
+
+        body = b''
+        if length:
+            try:
+                body = await asyncio.wait_for(
+                    reader.readexactly(length), self.keep_alive_timeout
+                )
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                return None
+
+        return method.upper(), target, version, headers, body
+
+    async def _dispatch(self, method, target, headers, body):
+        """Route one request, returning (payload, status)"""
+        url = urlsplit(target)
+
+        if url.path == '/health':
+            return {'status': 'ok'}, 200
+        if url.path == '/ready':
+            if self.ready:
+                return {'status': 'ready', 'served': self.requests_served}, 200
+            return {'status': 'draining'}, 503
+        if url.path != self.ipn_path:
+            return {'error': 'not found'}, 404
+        if method not in ('GET', 'POST'):
+            return {'error': 'method not allowed'}, 405
+
+        request = IPNRequest(method, url.path, url.query, body, headers)
+        if self.executor is None:
+            response, status = self.handler.handle_ipn(request)
+        else:
+            loop = asyncio.get_running_loop()
+            response, status = await loop.run_in_executor(
+                self.executor, self.handler.handle_ipn, request
+            )
+        self.requests_served += 1
+        return response, status
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = False
+        try:
+            while True:
+                parsed = await self._read_request(reader)
+                if parsed is None:
+                    break
+                self._connections[writer] = True
+                if isinstance(parsed, int):
+                    writer.write(self._encode_response(parsed, {'error': REASONS[parsed]}, False))
+                    await writer.drain()
+                    break
+
+                method, target, version, headers, body = parsed
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    keep_alive = connection == 'keep-alive'
+                else:
+                    keep_alive = connection != 'close'
+
+                try:
+                    payload, status = await self._dispatch(method, target, headers, body)
+                except Exception as e:
+                    print(f"❌ IPN server error: {str(e)}")
+                    payload, status = {'error': str(e), 'status': 500}, 500
+
+                # Checked after dispatch so a drain that began mid-request closes it
+                keep_alive = keep_alive and self.ready
+
+                writer.write(self._encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+                self._connections[writer] = False
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._connections.pop(writer, None)
+            if self._drained is not None and not self._connections:
+                self._drained.set()
+
+    # ----------------------------------------
+    # Lifecycle
+    # ----------------------------------------
+
+    async def start(self, host='127.0.0.1', port=8000, sock=None):
+        """Start accepting connections (on `sock` if given, else host:port)"""
+        if sock is not None:
+            self._server = await asyncio.start_server(
+                self._handle_connection, sock=sock, limit=MAX_HEADER_BYTES
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, host, port,
+                limit=MAX_HEADER_BYTES, reuse_address=True
+            )
+        self.ready = True
+        return self._server
+
+    @property
+    def port(self):
+        """Port actually bound (useful with port=0)"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def drain(self, grace_period=5.0):
+        """
+        Stop accepting, report not-ready, and let in-flight requests finish
+
+        Idle keep-alive connections are closed at once; busy ones answer
+        their current request with `Connection: close`. Whatever is still
+        open after `grace_period` seconds is aborted. The handler thread
+        pool is shut down last, once nothing can dispatch to it.
+        """
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+            for writer, busy in list(self._connections.items()):
+                if not busy:
+                    writer.close()
+            if self._connections:
+                self._drained = asyncio.Event()
+                try:
+                    await asyncio.wait_for(self._drained.wait(), grace_period)
+                except asyncio.TimeoutError:
+                    for writer in list(self._connections):
+                        writer.transport.abort()
+            try:
+                # On 3.12+ this also waits for every connection to close
+                await asyncio.wait_for(self._server.wait_closed(), grace_period)
+            except asyncio.TimeoutError:
+                pass
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    async def serve_forever(self, host='127.0.0.1', port=8000, sock=None):
+        """Run until SIGINT/SIGTERM, then drain"""
+        await self.start(host, port, sock)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows, or not the main thread
+        await stop.wait()
+        await self.drain()
+
+
+def _new_event_loop():
+    """Use uvloop when available, asyncio otherwise"""
+    try:
+        import uvloop
+        return uvloop.new_event_loop()
+    except ImportError:
+        return asyncio.new_event_loop()
+
+
+def _run_worker(handler_factory, sock, server_options):
+    loop = _new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = IPNServer(handler_factory(), **server_options)
+    try:
+        loop.run_until_complete(server.serve_forever(sock=sock))
+    finally:
+        loop.close()
+
+
+def run_server(handler_factory, host='0.0.0.0', port=8000, workers=1, **server_options):
+    """
+    Run the IPN server, optionally as a pre-fork pool
+
+    Args:
+        handler_factory (callable): Returns a handler; called once per
+                                    worker so each has its own connections
+        host (str): Interface to bind
+        port (int): Port to bind
+        workers (int): Number of worker processes sharing the socket
+        **server_options: Passed to IPNServer
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+
+    print(f"📡 IPN server listening on http://{host}:{port} ({workers} worker(s))")
+
+    if workers <= 1 or not hasattr(os, 'fork'):
+        _run_worker(handler_factory, sock, server_options)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(handler_factory, sock, server_options)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def forward(signum, _frame):
+        for child in children:
+            try:
+                os.kill(child, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for child in children:
+        os.waitpid(child, 0)
+    sock.close()
+
+
+# ============================================
+# LOAD TEST
+# ============================================
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+async def _client(host, port, deadline, latencies, errors, worker_id):
+    """One keep-alive connection sending POST and GET IPNs until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = 0
+    try:
+        while time.perf_counter() < deadline:
+            tracking_id = f"TRACK-{worker_id}-{sent}"
+            if sent % 2:
+                body = json.dumps({
+                    'OrderTrackingId': tracking_id,
+                    'OrderMerchantReference': f"TOUR-{worker_id}-{sent}",
+                    'OrderNotificationType': 'IPNCHANGE',
+                }).encode()
+                request = (
+                    f"POST /ipn HTTP/1.1\r\nHost: {host}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n"
+                ).encode() + body
+            else:
+                request = (
+                    f"GET /ipn?OrderTrackingId={tracking_id}"
+                    f"&OrderMerchantReference=TOUR-{worker_id}-{sent}"
+                    f"&OrderNotificationType=IPNCHANGE HTTP/1.1\r\nHost: {host}\r\n\r\n"
+                ).encode()
+
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+
+            if not head.startswith(b'HTTP/1.1 200'):
+                errors.append(head.split(b'\r\n', 1)[0])
+            sent += 1
+    finally:
+        writer.close()
+
+
+def load_test(seconds=5.0, concurrency=16, handler=None, offload=False):
+    """
+    Measure sustained IPN requests/sec against a local simulator
+
+    Args:
+        seconds (float): How long to send traffic
+        concurrency (int): Number of keep-alive connections
+        handler: IPN handler (defaults to SimulatedIPNHandler)
+        offload (bool): Run the handler in the server's thread pool
+
+    Returns:
+        dict: requests, errors, requests_per_sec, p50_ms, p99_ms
+    """
+    handler = handler or SimulatedIPNHandler()
+
+    async def run():
+        server = IPNServer(handler, offload=offload)
+        await server.start('127.0.0.1', 0)
+        latencies, errors = [], []
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _client('127.0.0.1', server.port, deadline, latencies, errors, i)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+        await server.drain()
+        return latencies, errors, elapsed
+
+    loop = _new_event_loop()
+    try:
+        latencies, errors, elapsed = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+    print(f"   {result['requests']:,} requests in {elapsed:.1f}s "
+          f"({result['requests_per_sec']:,.0f} req/sec), "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+          f"{result['errors']} errors")
+    return result
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _raw_exchange(port, payload):
+    """Send raw bytes, return the full response"""
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as conn:
+        conn.sendall(payload)
+        chunks = []
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def test_server():
+    """GET/POST IPNs, readiness, and the body size limit"""
+    print("\n📝 Test 1: IPN endpoint, readiness and limits")
+
+    handler = SimulatedIPNHandler()
+    loop = _new_event_loop()
+    server = IPNServer(handler, max_body=1024)
+    loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    body = json.dumps({
+        'OrderTrackingId': 'TRACK-001',
+        'OrderMerchantReference': 'TOUR-001',
+        'OrderNotificationType': 'IPNCHANGE',
+    }).encode()
+    post = _raw_exchange(server.port, (
+        f"POST /ipn HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode() + body)
+    get = _raw_exchange(server.port, (
+        b"GET /ipn?OrderTrackingId=TRACK-002&OrderMerchantReference=TOUR-002"
+        b"&OrderNotificationType=IPNCHANGE HTTP/1.0\r\n\r\n"
+    ))
+    ready = _raw_exchange(server.port, b"GET /ready HTTP/1.0\r\n\r\n")
+    too_big = _raw_exchange(server.port, b"POST /ipn HTTP/1.1\r\nContent-Length: 999999\r\n\r\n")
+
+    asyncio.run_coroutine_threadsafe(server.drain(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+    checks = [
+        post.startswith(b'HTTP/1.1 200') and b'"orderTrackingId": "TRACK-001"' in post,
+        get.startswith(b'HTTP/1.1 200'),
+        ready.startswith(b'HTTP/1.1 200'),
+        too_big.startswith(b'HTTP/1.1 413'),
+        handler.db.get_payment('TRACK-002').status == 'Completed',
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+class _SlowHandler(SimulatedIPNHandler):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def handle_ipn(self, request):
+        time.sleep(self.delay)
+        return super().handle_ipn(request)
+
+
+def _drain_during_request(delay, grace_period):
+    """
+    Drain while one keep-alive connection is idle and another is mid-request
+
+    Returns:
+        tuple: (idle connection's read after drain, in-flight response,
+                seconds drain took, drain exception or None)
+    """
+    loop = _new_event_loop()
+    server = IPNServer(_SlowHandler(delay), offload=True)
+    loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    request = (b"GET /ipn?OrderTrackingId=TRACK-1&OrderMerchantReference=TOUR-1 HTTP/1.1\r\n"
+               b"Host: test\r\n\r\n")
+    idle = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    idle.sendall(request)
+    idle.recv(65536)                          # answered; connection stays open
+    busy = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    busy.sendall(request)
+    time.sleep(0.1)                           # the handler is now sleeping
+
+    start = time.perf_counter()
+    error = None
+    try:
+        asyncio.run_coroutine_threadsafe(server.drain(grace_period), loop).result(10)
+    except Exception as exc:
+        error = exc
+    took = time.perf_counter() - start
+
+    try:
+        idle_read = idle.recv(65536)
+    except OSError:
+        idle_read = b''
+    chunks = []
+    try:
+        while chunk := busy.recv(65536):
+            chunks.append(chunk)
+    except OSError:
+        pass
+    idle.close()
+    busy.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    return idle_read, b''.join(chunks), took, error
+
+
+def test_drain():
+    """Draining closes idle keep-alive connections and finishes in-flight ones"""
+    print("\n📝 Test 2: Graceful drain with keep-alive connections")
+
+    idle_read, response, took, error = _drain_during_request(delay=0.5, grace_period=5)
+    # A handler slower than the grace period: the connection is aborted,
+    # drain still returns and the pool is shut down
+    _, aborted, slow_took, slow_error = _drain_during_request(delay=1.5, grace_period=0.3)
+
+    checks = [
+        idle_read == b'' and error is None,
+        response.startswith(b'HTTP/1.1 200') and b'Connection: close' in response,
+        took < 2,
+        slow_error is None and aborted == b'' and slow_took < 3,
+    ]
+
+    if all(checks):
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! Checks: {checks} {error} {slow_error}")
+
+
+def test_load(seconds=3.0, concurrency=16):
+    """Sustained requests/sec against the simulator"""
+    print(f"\n📝 Test 3: Load test ({concurrency} connections, {seconds:.0f}s)")
+
+    result = load_test(seconds=seconds, concurrency=concurrency)
+
+    if result['errors'] == 0 and result['requests'] > 0:
+        print("✅ Test 3 passed!")
+    else:
+        print("❌ Test 3 failed!")
+
+
+def _load_handler_factory(spec):
+    """Turn 'module:callable' into a handler factory"""
+    if not spec:
+        return SimulatedIPNHandler
+    import importlib
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pesapal IPN HTTP server')
+    sub = parser.add_subparsers(dest='command')
+
+    serve = sub.add_parser('serve', help='Run the IPN server')
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    serve.add_argument('--handler', help="Handler factory as 'module:callable' "
+                                         "(default: local simulator)")
+    serve.add_argument('--max-body', type=int, default=MAX_BODY_BYTES)
+    serve.add_argument('--record', metavar='LOG',
+                       help='Append every IPN to a traffic log (see ipn_replay.py)')
+    serve.add_argument('--profile', action='store_true',
+                       help='Profile handle_ipn calls (see profiling.py)')
+
+    load = sub.add_parser('loadtest', help='Measure requests/sec locally')
+    load.add_argument('--seconds', type=float, default=10)
+    load.add_argument('--concurrency', type=int, default=32)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        handler_factory = _load_handler_factory(args.handler)
+        if args.record:
+            from ipn_replay import RecordingIPNHandler
+            base_factory = handler_factory
+
+            def handler_factory():
+                return RecordingIPNHandler(base_factory(), args.record)
+
+        if args.profile or os.environ.get('PESAPAL_PROFILE'):
+            from profiling import profiler_from_env
+            unprofiled_factory = handler_factory
+
+            def handler_factory():
+                # One profiler per worker process
+                profiler = profiler_from_env(['--profile'])
+                return profiler.instrument(unprofiled_factory(), ['handle_ipn'])
+
+        run_server(handler_factory, args.host, args.port,
+                   args.workers, max_body=args.max_body)
+    elif args.command == 'loadtest':
+        load_test(args.seconds, args.concurrency)
+    else:
+        print("=" * 60)
+        print("TESTING IPN SERVER")
+        print("=" * 60)
+
+        test_server()
+        test_drain()
+        test_load()
+
+        print("\n" + "=" * 60)
+        print("ALL TESTS COMPLETED!")
+        print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Lazy Imports and Startup Benchmark
+==================================
+
+Short-lived workers and cron jobs pay the full import cost of the CLI
+on every start. lazy_import() returns a module object whose real
+import happens on first attribute access, so code like
+`requests.post(...)` or `sqlite3.connect(...)` stays unchanged:
+
+    from lazy_imports import lazy_import
+    requests = lazy_import('requests')     # nothing imported yet
+    sqlite3 = lazy_import('sqlite3')
+
+The first access is thread-safe: if many threads touch a lazy module at
+once (e.g. worker threads of a bulk import), one runs the import and
+the others wait for it.
+
+Lazy modules are not put in sys.modules, so a plain `import json` or
+`import json.decoder` elsewhere still imports the real thing (once);
+the lazy module then picks that up on first use.
+
+The startup benchmark runs each entry point in a fresh interpreter with
+`-X importtime` and measures:
+
+- import time (sum of top-level cumulative import times)
+- time to first operation (e.g. the CLI menu on screen)
+- which heavy modules were actually loaded by then
+
+and compares them with startup_baseline.json. It exits non-zero on a
+regression, so it can run in CI.
+
+USAGE:
+    python lazy_imports.py                     # benchmark + regression check
+    python lazy_imports.py --update-baseline   # accept the current numbers
+"""
+
+import _thread
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class _MissingModule(types.ModuleType):
+    """Stands in for an uninstalled module until something uses it"""
+
+    def __getattr__(self, attribute):
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'", name=self.__name__)
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Placeholder that imports the real module on first attribute access
+
+    importlib.util.LazyLoader isn't safe here: on 3.11 a second thread
+    touching the module mid-import sees it half-initialized and gets an
+    AttributeError. This runs the import through the normal (locked)
+    import system instead, behind a per-module lock, then copies the
+    real module's attributes so later lookups never reach __getattr__.
+
+    It stays out of sys.modules: a placeholder there would be found as
+    the parent by `import pkg.sub`, which then either loads pkg halfway
+    through pkg.sub or runs pkg.sub a second time when pkg imports it.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        # _thread, not threading: it is built in, so it costs no startup time
+        self.__dict__['_lazy_lock'] = _thread.RLock()
+        self.__dict__['_lazy_module'] = None
+
+    def _lazy_load(self):
+        namespace = self.__dict__
+        with namespace['_lazy_lock']:
+            module = namespace['_lazy_module']
+            if module is None:
+                module = importlib.import_module(self.__name__)
+                namespace.update(module.__dict__)
+                namespace['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        # Only called for names not (yet) copied from the real module
+        return getattr(self._lazy_load(), attribute)
+
+
+# name -> _LazyModule, so every caller shares one placeholder (and one lock)
+_lazy_modules = {}
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access
+
+    Args:
+        name (str): Module name, e.g. 'requests'
+
+    Returns:
+        module: Already-imported module, a lazy module, or (if the module
+                isn't installed) a placeholder that raises
+                ModuleNotFoundError when used
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if name in _lazy_modules:
+        return _lazy_modules[name]
+    if importlib.util.find_spec(name) is None:
+        return _MissingModule(name)
+    return _lazy_modules.setdefault(name, _LazyModule(name))
+
+
+def is_loaded(name):
+    """True if a module has really been imported (not just lazily requested)"""
+    module = sys.modules.get(name)
+    return type(module) is types.ModuleType
+
+
+# ============================================
+# STARTUP BENCHMARK
+# ============================================
+
+BASELINE_FILE = 'startup_baseline.json'
+
+# Modules that must not be loaded before an entry point's first operation
+HEAVY_MODULES = ('requests', 'sqlite3', 'csv', 'concurrent.futures', 'json', 'argparse')
+
+# Code timed in a fresh interpreter: import the entry point, then do
+# the first thing a user sees
+ENTRY_POINTS = {
+    '03_complete_integration': (
+        "import importlib\n"
+        "m = importlib.import_module('03_complete_integration')\n"
+        "cli = m.TourBookingCLI(m.PesapalService('key', 'secret'))\n"
+        "cli.display_menu()\n"
+    ),
+}
+
+# Only builtins are used before the heavy-module check, so the harness
+# itself doesn't load anything it is looking for
+_CHILD = '''
+import io, sys, time, types
+start = time.perf_counter()
+_stdout, sys.stdout = sys.stdout, io.StringIO()
+{code}
+first_op_ms = (time.perf_counter() - start) * 1000
+sys.stdout = _stdout
+heavy = [name for name in {heavy!r} if type(sys.modules.get(name)) is types.ModuleType]
+print(repr({{'first_op_ms': first_op_ms, 'heavy': heavy}}))
+'''
+
+
+def _parse_importtime(stderr):
+    """
+    Returns:
+        tuple: (total import ms, [(ms, module)] slowest top-level imports)
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that imported them
+        if not name[1:].startswith(' '):
+            top_level.append((int(cumulative) / 1000, name.strip()))
+    top_level.sort(reverse=True)
+    return sum(ms for ms, _ in top_level), top_level[:5]
+
+
+def measure(entry_point, runs=5):
+    """
+    Benchmark one entry point in fresh interpreters
+
+    Returns:
+        dict: import_ms and first_op_ms (medians), heavy modules loaded,
+              slowest top-level imports
+    """
+    import ast
+    import os
+    import statistics
+    import subprocess
+
+    code = _CHILD.format(code=ENTRY_POINTS[entry_point], heavy=HEAVY_MODULES)
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_ms, first_op_ms = [], []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=here, capture_output=True, text=True, check=True)
+        total, slowest = _parse_importtime(result.stderr)
+        child = ast.literal_eval(result.stdout.strip().splitlines()[-1])
+        import_ms.append(total)
+        first_op_ms.append(child['first_op_ms'])
+
+    return {
+        'import_ms': statistics.median(import_ms),
+        'first_op_ms': statistics.median(first_op_ms),
+        'heavy': child['heavy'],
+        'slowest': slowest,
+    }
+
+
+def check_regressions(results, baseline, tolerance=0.5, slack_ms=10.0):
+    """
+    Compare results with the baseline
+
+    A timing regresses when it exceeds baseline * (1 + tolerance) + slack_ms
+    (generous, because timings are noisy). Loading any heavy module
+    before the first operation is always a regression.
+
+    Returns:
+        list: Regression messages (empty = OK)
+    """
+    problems = []
+    for entry_point, result in results.items():
+        if result['heavy']:
+            problems.append(f"{entry_point}: loads {', '.join(result['heavy'])} at startup")
+        expected = baseline.get(entry_point)
+        if not expected:
+            continue
+        for metric in ('import_ms', 'first_op_ms'):
+            limit = expected[metric] * (1 + tolerance) + slack_ms
+            if result[metric] > limit:
+                problems.append(f"{entry_point}: {metric} {result[metric]:.1f} ms "
+                                f"> limit {limit:.1f} ms (baseline {expected[metric]:.1f})")
+    return problems
+
+
+def run_benchmark(update_baseline=False, runs=5):
+    """
+    Benchmark every entry point and check for regressions
+
+    Returns:
+        int: Exit code (0 = no regressions)
+    """
+    import json
+    import os
+
+    baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE)
+    try:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    print("=" * 60)
+    print("STARTUP BENCHMARK")
+    print("=" * 60)
+
+    results = {}
+    for entry_point in ENTRY_POINTS:
+        result = measure(entry_point, runs)
+        results[entry_point] = result
+        before = baseline.get(entry_point, {})
+        print(f"\n🚀 {entry_point}")
+        print(f"   Imports:         {result['import_ms']:6.1f} ms "
+              f"(baseline {before.get('import_ms', 0):.1f})")
+        print(f"   First operation: {result['first_op_ms']:6.1f} ms "
+              f"(baseline {before.get('first_op_ms', 0):.1f})")
+        print(f"   Heavy modules loaded: {', '.join(result['heavy']) or 'none'}")
+        for ms, module in result['slowest']:
+            print(f"      {ms:6.1f} ms  {module}")
+
+    if update_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump({name: {'import_ms': round(r['import_ms'], 1),
+                              'first_op_ms': round(r['first_op_ms'], 1)}
+                       for name, r in results.items()}, f, indent=2)
+            f.write('\n')
+        print(f"\n📝 Baseline written to {baseline_path}")
+        return 0
+
+    problems = check_regressions(results, baseline)
+    print()
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✅ No startup regressions")
+    return 1 if problems else 0
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def test_lazy_import():
+    """Nothing is executed until first use; missing modules fail late"""
+    print("\n📝 Test 1: lazy_import")
+
+    sys.modules.pop('tabnanny', None)
+    module = lazy_import('tabnanny')
+    before = is_loaded('tabnanny')
+    module.NannyNag          # first attribute access runs the import
+    after = is_loaded('tabnanny')
+
+    missing = lazy_import('no_such_module_here')
+    try:
+        missing.anything
+        raised = False
+    except ModuleNotFoundError:
+        raised = True
+
+    if not before and after and raised:
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! before={before} after={after} raised={raised}")
+
+
+_RACE = '''
+import sys, threading
+from lazy_imports import lazy_import
+errors = []
+for name, attribute in {targets!r}:
+    if name in sys.modules:
+        continue
+    module = lazy_import(name)
+    barrier = threading.Barrier(16)
+    def touch():
+        barrier.wait()
+        try:
+            getattr(module, attribute)
+        except Exception as e:
+            errors.append(repr(e))
+    threads = [threading.Thread(target=touch) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+print(len(errors))
+'''
+
+
+def test_first_use_from_threads():
+    """16 threads touching a lazy module at once all get the real attribute"""
+    import os
+    import subprocess
+
+    print("\n📝 Test 2: First use from 16 threads at once")
+
+    targets = [('sqlite3', 'connect'), ('csv', 'reader'), ('decimal', 'Decimal'),
+               ('fractions', 'Fraction'), ('statistics', 'median'),
+               ('difflib', 'SequenceMatcher'), ('calendar', 'monthrange'),
+               ('zipfile', 'ZipFile'), ('plistlib', 'loads'), ('smtplib', 'SMTP')]
+    here = os.path.dirname(os.path.abspath(__file__))
+    # A fresh interpreter, so none of the targets is imported yet
+    result = subprocess.run([sys.executable, '-c', _RACE.format(targets=targets)],
+                            cwd=here, capture_output=True, text=True, check=True)
+    errors = int(result.stdout.strip().splitlines()[-1])
+
+    if errors == 0:
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! {errors} of {len(targets) * 16} accesses raised")
+
+
+def test_regression_check():
+    """Slow startups and eager heavy imports are reported"""
+    print("\n📝 Test 3: Regression check")
+
+    baseline = {'cli': {'import_ms': 20.0, 'first_op_ms': 25.0}}
+    ok = check_regressions({'cli': {'import_ms': 24.0, 'first_op_ms': 30.0, 'heavy': []}},
+                           baseline)
+    slow = check_regressions({'cli': {'import_ms': 80.0, 'first_op_ms': 30.0, 'heavy': []}},
+                             baseline)
+    eager = check_regressions({'cli': {'import_ms': 20.0, 'first_op_ms': 25.0,
+                                       'heavy': ['requests']}}, baseline)
+
+    if not ok and len(slow) == 1 and len(eager) == 1:
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! {ok} / {slow} / {eager}")
+
+
+_SUBMODULE = '''
+import sys
+from lazy_imports import lazy_import
+json = lazy_import('json')
+import json.decoder
+decoder = sys.modules['json.decoder']
+json.loads('{}')
+import json as real
+print(repr([json.JSONDecoder is decoder.JSONDecoder, real.decoder is decoder,
+            lazy_import('json') is real]))
+'''
+
+
+def test_submodule_import():
+    """`import pkg.sub` next to a lazy pkg runs pkg.sub exactly once"""
+    import ast
+    import os
+    import subprocess
+
+    print("\n📝 Test 4: Importing a submodule of a lazy package")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    # A fresh interpreter, so json isn't imported yet
+    result = subprocess.run([sys.executable, '-c', _SUBMODULE],
+                            cwd=here, capture_output=True, text=True)
+    if result.returncode:
+        print(f"❌ Test 4 failed! {result.stderr.strip().splitlines()[-1]}")
+        return
+    same_class, bound, shared = ast.literal_eval(result.stdout.strip().splitlines()[-1])
+
+    if same_class and bound and shared:
+        print("✅ Test 4 passed!")
+    else:
+        print(f"❌ Test 4 failed! same JSONDecoder={same_class} "
+              f"json.decoder bound={bound} real module shared={shared}")
+
+
+if __name__ == "__main__":
+    if '--test' in sys.argv:
+        print("=" * 60)
+        print("TESTING LAZY IMPORTS")
+        print("=" * 60)
+
+        test_lazy_import()
+        test_first_use_from_threads()
+        test_regression_check()
+        test_submodule_import()
+
+        print("\n" + "=" * 60)
+        print("ALL TESTS COMPLETED!")
+        print("=" * 60)
+    else:
+        sys.exit(run_benchmark(update_baseline='--update-baseline' in sys.argv))
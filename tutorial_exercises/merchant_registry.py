@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Multi-Merchant Client Registry
+==============================
+
+One process, many merchants, each with its own consumer_key/secret.
+
+Creating a PesapalService per merchant would give every merchant its own
+PaymentDatabase, token and connection setup. MerchantRegistry instead
+shares the expensive parts and keeps only a tiny context per merchant:
+
+    Shared by all merchants            Per merchant (MerchantContext)
+    ---------------------------        ------------------------------
+    HTTP connection pool (Session)     consumer_key / consumer_secret
+    Rate-limit budget (TokenBucket)    token + expiry
+    Payment database                   IPN id
+                                       last used time
+
+Contexts are built lazily on first use and evicted least-recently-used
+when there are more than `max_tenants`, or when idle for too long.
+
+USAGE:
+    registry = MerchantRegistry(load_credentials, db=payment_db)
+    client = registry.client('merchant-42')
+    client.submit_order(order_payload)
+"""
+
+import copy
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from payment_record import to_epoch
+
+
+SANDBOX_URL = "https://cybqa.pesapal.com/pesapalv3"
+LIVE_URL = "https://pay.pesapal.com/v3"
+
+TOKEN_REFRESH_BUFFER = 30  # seconds, same safety margin as Exercise 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every merchant
+
+    `rate` requests per second on average, bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount=1, keep=0):
+        """
+        Take tokens without waiting
+
+        Args:
+            amount (float): Tokens needed
+            keep (float): Tokens that must remain afterwards (lets a
+                          caller reserve part of the budget for others)
+
+        Returns:
+            bool: True if the tokens were available
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens - amount >= keep:
+                self.tokens -= amount
+                return True
+            return False
+
+    def time_until(self, amount=1, keep=0):
+        """Seconds until try_acquire(amount, keep) could succeed"""
+        with self._lock:
+            self._refill()
+            missing = amount + keep - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def acquire(self, amount=1, timeout=None):
+        """
+        Take tokens, waiting for the bucket to refill if needed
+
+        Returns:
+            bool: False if `timeout` seconds passed first
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class MerchantContext:
+    """
+    Per-merchant state, kept deliberately small
+    """
+
+    __slots__ = ('merchant_id', 'consumer_key', 'consumer_secret',
+                 'token', 'token_expiry', 'ipn_id', 'last_used')
+
+    def __init__(self, merchant_id, consumer_key, consumer_secret, ipn_id=None):
+        self.merchant_id = merchant_id
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.token = None
+        self.token_expiry = 0.0
+        self.ipn_id = ipn_id
+        self.last_used = 0.0
+
+    def token_is_valid(self, now=None):
+        now = time.time() if now is None else now
+        return self.token is not None and now < self.token_expiry - TOKEN_REFRESH_BUFFER
+
+
+class MerchantRegistry:
+    """
+    Lazily builds merchant contexts that share one connection pool,
+    one rate budget and one database
+    """
+
+    def __init__(self, credential_loader, environment='sandbox', transport=None,
+                 db=None, rate_limiter=None, max_tenants=10_000, idle_seconds=None,
+                 lock_stripes=64):
+        """
+        Initialize registry
+
+        Args:
+            credential_loader (callable): merchant_id -> dict with
+                consumer_key, consumer_secret and optional ipn_id
+                (or None if the merchant is unknown)
+            environment (str): 'sandbox' or 'live'
+            transport: requests-style HTTP layer shared by every merchant
+                       (defaults to one requests.Session = one connection pool)
+            db: Shared payment database (PaymentDatabase or compatible)
+            rate_limiter (TokenBucket): Shared upstream budget (None = unlimited)
+            max_tenants (int): Contexts kept before LRU eviction
+            idle_seconds (float): Evict contexts unused for this long
+            lock_stripes (int): Locks shared by hashing merchant IDs, so
+                                10k merchants don't need 10k locks
+        """
+        self.credential_loader = credential_loader
+        self.base_url = SANDBOX_URL if environment == 'sandbox' else LIVE_URL
+        self.db = db
+        self.rate_limiter = rate_limiter
+        self.max_tenants = max_tenants
+        self.idle_seconds = idle_seconds
+
+        self._transport = transport
+        self._contexts = OrderedDict()
+        # IPN ids registered at runtime, by merchant. Kept outside the
+        # contexts so an evicted and rebuilt context still has its id
+        # (one short string per merchant that registered one).
+        self._ipn_ids = {}
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+
+        self.evictions = 0
+        self.authentications = 0
+
+    @property
+    def transport(self):
+        """Shared HTTP layer (created on first use)"""
+        if self._transport is None:
+            import requests
+            self._transport = requests.Session()
+        return self._transport
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def _stripe(self, merchant_id):
+        return self._stripes[zlib.crc32(merchant_id.encode()) % len(self._stripes)]
+
+    # ----------------------------------------
+    # Context lifecycle
+    # ----------------------------------------
+
+    def context(self, merchant_id):
+        """
+        Get (or lazily build) a merchant's context
+
+        Raises:
+            KeyError: If the credential loader doesn't know the merchant
+        """
+        now = time.time()
+        with self._lock:
+            context = self._contexts.get(merchant_id)
+            if context is not None:
+                self._contexts.move_to_end(merchant_id)
+                context.last_used = now
+                return context
+
+        credentials = self.credential_loader(merchant_id)
+        if not credentials:
+            raise KeyError(f"Unknown merchant: {merchant_id}")
+
+        with self._lock:
+            context = self._contexts.get(merchant_id)
+            if context is None:
+                context = MerchantContext(
+                    merchant_id,
+                    credentials['consumer_key'],
+                    credentials['consumer_secret'],
+                    self._ipn_ids.get(merchant_id) or credentials.get('ipn_id'),
+                )
+                self._contexts[merchant_id] = context
+                while len(self._contexts) > self.max_tenants:
+                    self._contexts.popitem(last=False)
+                    self.evictions += 1
+            context.last_used = now
+            return context
+
+    def remember_ipn_id(self, context, ipn_id):
+        """Set a merchant's IPN id, keeping it across eviction of its context"""
+        with self._lock:
+            self._ipn_ids[context.merchant_id] = ipn_id
+            context.ipn_id = ipn_id
+
+    def snapshot(self):
+        """
+        Copy every context, for saving warm state
+
+        Returns:
+            list: MerchantContext copies, least recently used first
+        """
+        with self._lock:
+            return [copy.copy(context) for context in self._contexts.values()]
+
+    def evict_idle(self, now=None):
+        """
+        Drop contexts that haven't been used for `idle_seconds`
+
+        Returns:
+            int: Number of contexts evicted
+        """
+        if self.idle_seconds is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            # Oldest first, so we can stop at the first recent one
+            while self._contexts:
+                merchant_id, context = next(iter(self._contexts.items()))
+                if context.last_used >= cutoff:
+                    break
+                del self._contexts[merchant_id]
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def client(self, merchant_id):
+        """
+        Get a lightweight API client for one merchant
+
+        Returns:
+            MerchantClient
+        """
+        return MerchantClient(self, self.context(merchant_id))
+
+    # ----------------------------------------
+    # Shared request path
+    # ----------------------------------------
+
+    def request(self, method, path, **kwargs):
+        """Send one request through the shared rate limit and connection pool"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self.transport.request(method, f"{self.base_url}{path}", **kwargs)
+
+    def token_for(self, context):
+        """
+        Return a valid token for a merchant, authenticating if needed
+
+        Only one thread per lock stripe authenticates at a time, so a burst
+        of requests for the same merchant triggers a single RequestToken call.
+        """
+        if context.token_is_valid():
+            return context.token
+
+        with self._stripe(context.merchant_id):
+            if context.token_is_valid():
+                return context.token
+
+            response = self.request(
+                'POST', '/api/Auth/RequestToken',
+                json={
+                    'consumer_key': context.consumer_key,
+                    'consumer_secret': context.consumer_secret,
+                },
+                headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+            )
+            response.raise_for_status()
+            data = response.json()
+            if data.get('status') != '200':
+                raise RuntimeError(
+                    f"Authentication failed for {context.merchant_id}: {data.get('message')}"
+                )
+
+            token = data.get('token')
+            expiry = float(to_epoch(data.get('expiryDate')))
+            with self._lock:
+                # Together, so snapshot() never pairs a token with another's expiry
+                context.token, context.token_expiry = token, expiry
+            self.authentications += 1
+            return token
+
+
+class MerchantClient:
+    """
+    Pesapal API calls on behalf of one merchant
+
+    Cheap to create: it only holds references to the registry and context.
+    """
+
+    __slots__ = ('registry', 'context')
+
+    def __init__(self, registry, context):
+        self.registry = registry
+        self.context = context
+
+    @property
+    def db(self):
+        return self.registry.db
+
+    def get_headers(self):
+        return {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Authorization': f"Bearer {self.registry.token_for(self.context)}",
+        }
+
+    def _call(self, method, path, **kwargs):
+        response = self.registry.request(method, path, headers=self.get_headers(), **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def register_ipn(self, ipn_url, notification_type='POST'):
+        """Register an IPN URL and remember its id for this merchant"""
+        data = self._call('POST', '/api/URLSetup/RegisterIPN', json={
+            'url': ipn_url,
+            'ipn_notification_type': notification_type,
+        })
+        if data.get('ipn_id'):
+            self.registry.remember_ipn_id(self.context, data['ipn_id'])
+        return data
+
+    def submit_order(self, order_payload):
+        """Submit an order, filling in this merchant's IPN id if missing"""
+        payload = dict(order_payload)
+        payload.setdefault('notification_id', self.context.ipn_id)
+        return self._call('POST', '/api/Transactions/SubmitOrderRequest', json=payload)
+
+    def get_transaction_status(self, order_tracking_id):
+        return self._call('GET', '/api/Transactions/GetTransactionStatus',
+                          params={'orderTrackingId': order_tracking_id})
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class _FakeTransport:
+    """Counts requests and hands out one-hour tokens"""
+
+    def __init__(self):
+        self.requests = 0
+        self.token_requests = 0
+        self.last_json = None
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        self.last_json = kwargs.get('json')
+        if url.endswith('/api/Auth/RequestToken'):
+            self.token_requests += 1
+            expiry = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+            return _FakeResponse({
+                'token': f"token-{kwargs['json']['consumer_key']}",
+                'expiryDate': expiry,
+                'status': '200',
+            })
+        if url.endswith('/api/URLSetup/RegisterIPN'):
+            return _FakeResponse({'ipn_id': 'IPN-001', 'status': '200'})
+        return _FakeResponse({'status': '200', 'payment_status_description': 'Completed'})
+
+
+def _load_fake_credentials(merchant_id):
+    return {'consumer_key': f"key-{merchant_id}", 'consumer_secret': f"secret-{merchant_id}"}
+
+
+def test_shared_resources():
+    """Merchants share the transport and database, but not tokens"""
+    print("\n📝 Test 1: Shared pool, separate tokens")
+
+    transport = _FakeTransport()
+    shared_db = object()
+    registry = MerchantRegistry(_load_fake_credentials, transport=transport, db=shared_db)
+
+    a = registry.client('merchant-a')
+    b = registry.client('merchant-b')
+    for _ in range(5):
+        a.get_transaction_status('TRACK-1')
+        b.get_transaction_status('TRACK-2')
+    a.register_ipn('https://example.com/ipn')
+
+    checks = [
+        transport.token_requests == 2,
+        a.context.token != b.context.token,
+        a.context.ipn_id is not None and b.context.ipn_id is None,
+        a.db is b.db is shared_db,
+        registry.client('merchant-a').context is a.context,
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def test_eviction():
+    """LRU and idle eviction keep the registry bounded"""
+    print("\n📝 Test 2: LRU and idle eviction")
+
+    registry = MerchantRegistry(_load_fake_credentials, transport=_FakeTransport(),
+                                max_tenants=3, idle_seconds=60)
+    for name in ('m1', 'm2', 'm3'):
+        registry.context(name)
+    registry.context('m1')               # m2 is now least recently used
+    registry.context('m4')
+
+    registry.context('m3').last_used -= 120
+    registry._contexts.move_to_end('m3', last=False)
+    idle = registry.evict_idle()
+
+    if 'm2' not in registry._contexts and idle == 1 and len(registry) == 2:
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! Contexts: {list(registry._contexts)}")
+
+
+def test_memory_per_tenant(tenants=10_000):
+    """10k authenticated merchants fit comfortably in memory"""
+    import tracemalloc
+
+    print(f"\n📝 Test 3: Memory for {tenants:,} merchants")
+
+    registry = MerchantRegistry(_load_fake_credentials, transport=_FakeTransport(),
+                                max_tenants=tenants)
+    tracemalloc.start()
+    for i in range(tenants):
+        registry.token_for(registry.context(f"merchant-{i}"))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_tenant = used / tenants
+    print(f"   {used / 1024 / 1024:.1f} MB total, {per_tenant:.0f} bytes per merchant")
+
+    if per_tenant < 2048 and len(registry) == tenants:
+        print("✅ Test 3 passed!")
+    else:
+        print("❌ Test 3 failed!")
+
+
+def test_rate_limit():
+    """The shared bucket caps requests across all merchants"""
+    print("\n📝 Test 4: Shared rate limit")
+
+    bucket = TokenBucket(rate=200, capacity=20)
+    registry = MerchantRegistry(_load_fake_credentials, transport=_FakeTransport(),
+                                rate_limiter=bucket)
+    start = time.perf_counter()
+    for i in range(60):
+        registry.client(f"m{i % 10}").get_transaction_status('TRACK-1')
+    elapsed = time.perf_counter() - start
+
+    # 60 status calls + 10 token calls = 70 requests, 20 free, 50 at 200/sec
+    if elapsed >= 0.2:
+        print(f"✅ Test 4 passed! ({elapsed:.2f}s)")
+    else:
+        print(f"❌ Test 4 failed! Finished too quickly ({elapsed:.2f}s)")
+
+
+def test_ipn_id_survives_eviction():
+    """An IPN id registered at runtime is still used after the context is evicted"""
+    print("\n📝 Test 5: IPN id across eviction")
+
+    transport = _FakeTransport()
+    registry = MerchantRegistry(_load_fake_credentials, transport=transport,
+                                max_tenants=2, idle_seconds=60)
+    registry.client('m1').register_ipn('https://example.com/ipn')
+    registry.context('m2')
+    registry.context('m3')                    # evicts m1 (LRU)
+    lru_evicted = 'm1' not in registry._contexts
+    registry.client('m1').submit_order({'id': 'TOUR-1'})
+    after_lru = transport.last_json.get('notification_id')
+
+    registry.context('m1').last_used -= 120
+    registry._contexts.move_to_end('m1', last=False)
+    registry.evict_idle()
+    idle_evicted = 'm1' not in registry._contexts
+    registry.client('m1').submit_order({'id': 'TOUR-2'})
+    after_idle = transport.last_json.get('notification_id')
+
+    if lru_evicted and idle_evicted and after_lru == after_idle == 'IPN-001':
+        print("✅ Test 5 passed!")
+    else:
+        print(f"❌ Test 5 failed! {lru_evicted} {idle_evicted} {after_lru} {after_idle}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING MERCHANT REGISTRY")
+    print("=" * 60)
+
+    test_shared_resources()
+    test_eviction()
+    test_memory_per_tenant()
+    test_rate_limit()
+    test_ipn_id_survives_eviction()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
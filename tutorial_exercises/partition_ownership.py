@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Partitioned Work Ownership
+==========================
+
+Lets several nodes run IPN or reconciliation workers against the same
+`payments` data without duplicating upstream calls or racing on
+update_payment().
+
+- Every tracking ID hashes onto one of a fixed number of partitions
+- Nodes claim partitions through a lease table in the shared database
+- Each node heartbeats; its fair share is ceil(partitions / live nodes)
+- When a node joins, the others release partitions above their share
+- When a node dies, its leases expire and the survivors claim them
+
+A node only processes an order if it holds the lease for the order's
+partition, so each order is handled by exactly one node at a time.
+
+Leases move while work is in flight, so writes are fenced: every claim
+bumps the partition's epoch, fenced() hands out (partition, owner, epoch)
+with each tracking ID, and a write guarded by FENCE_SQL only lands if
+that lease is still current. A batch picked before a rebalance can't
+overwrite the new owner's work.
+
+USAGE:
+    leases = PartitionLeaseManager('payments.db', node_id='worker-a')
+    leases.start()                       # background lease renewal
+
+    for tracking_id, fence in leases.fenced(pending_tracking_ids):
+        status = reconcile(tracking_id)
+        conn.execute("UPDATE payments SET status = ? "
+                     "WHERE order_tracking_id = ? AND " + FENCE_SQL,
+                     (status, tracking_id) + fence)   # rowcount 0: lease lost
+
+    leases.stop()                        # hand partitions back
+"""
+
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+
+NUM_PARTITIONS = 64
+LEASE_SECONDS = 10.0
+
+LEASES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS partition_leases (
+        partition INTEGER PRIMARY KEY,
+        owner TEXT,
+        expires_at REAL NOT NULL DEFAULT 0,
+        epoch INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# Condition for a fenced write; parameters are a fence from fenced()
+FENCE_SQL = ('EXISTS (SELECT 1 FROM partition_leases '
+             'WHERE partition = ? AND owner = ? AND epoch = ?)')
+
+NODES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS partition_nodes (
+        node_id TEXT PRIMARY KEY,
+        last_seen REAL NOT NULL
+    )
+'''
+
+
+def partition_for(order_tracking_id, partitions=NUM_PARTITIONS):
+    """
+    Map a tracking ID to its partition (stable across processes and hosts)
+
+    Args:
+        order_tracking_id (str): Pesapal tracking ID
+        partitions (int): Number of partitions
+
+    Returns:
+        int: Partition number in [0, partitions)
+    """
+    return zlib.crc32(order_tracking_id.encode('utf-8')) % partitions
+
+
+class PartitionLeaseManager:
+    """
+    Claims, renews and releases partition leases for one node
+    """
+
+    def __init__(self, db_path, node_id=None, partitions=NUM_PARTITIONS,
+                 lease_seconds=LEASE_SECONDS, clock=time.time):
+        """
+        Initialize lease manager
+
+        Args:
+            db_path (str): SQLite database shared by all nodes
+            node_id (str): Unique node name (defaults to host:pid)
+            partitions (int): Number of partitions (must match on every node)
+            lease_seconds (float): Lease length; renewed every lease_seconds / 3
+            clock (callable): Wall-clock time source
+        """
+        self.db_path = db_path
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.partitions = partitions
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+        self.owned = frozenset()
+        self.epochs = {}                # owned partition -> lease epoch
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(LEASES_TABLE_SQL)
+                conn.execute(NODES_TABLE_SQL)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO partition_leases (partition) VALUES (?)",
+                    [(p,) for p in range(partitions)],
+                )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    # ----------------------------------------
+    # Leases
+    # ----------------------------------------
+
+    def heartbeat(self):
+        """
+        Renew leases and rebalance in one transaction
+
+        Returns:
+            frozenset: Partitions this node owns afterwards (their epochs
+                       are in self.epochs)
+        """
+        now = self.clock()
+        expires_at = now + self.lease_seconds
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "INSERT INTO partition_nodes (node_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (self.node_id, now),
+            )
+            conn.execute("DELETE FROM partition_nodes WHERE last_seen < ?",
+                         (now - self.lease_seconds,))
+            live_nodes = conn.execute("SELECT COUNT(*) FROM partition_nodes").fetchone()[0]
+            share = math.ceil(self.partitions / max(live_nodes, 1))
+
+            owned = [row[0] for row in conn.execute(
+                "SELECT partition FROM partition_leases "
+                "WHERE owner = ? AND expires_at > ? ORDER BY partition",
+                (self.node_id, now),
+            )]
+
+            # Over our share (a node joined): hand back the highest partitions
+            released = owned[share:]
+            owned = owned[:share]
+            conn.executemany(
+                "UPDATE partition_leases SET owner = NULL, expires_at = 0 "
+                "WHERE partition = ? AND owner = ?",
+                [(p, self.node_id) for p in released],
+            )
+
+            # Under our share: take free or expired partitions (a node died)
+            if len(owned) < share:
+                free = [row[0] for row in conn.execute(
+                    "SELECT partition FROM partition_leases "
+                    "WHERE owner IS NULL OR expires_at <= ? ORDER BY partition LIMIT ?",
+                    (now, share - len(owned)),
+                )]
+                conn.executemany(
+                    "UPDATE partition_leases SET owner = ?, epoch = epoch + 1 "
+                    "WHERE partition = ?",
+                    [(self.node_id, p) for p in free],
+                )
+                owned.extend(free)
+
+            conn.executemany(
+                "UPDATE partition_leases SET expires_at = ? WHERE partition = ? AND owner = ?",
+                [(expires_at, p, self.node_id) for p in owned],
+            )
+            epochs = dict(conn.execute(
+                "SELECT partition, epoch FROM partition_leases WHERE owner = ?",
+                (self.node_id,),
+            ))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        self.epochs = epochs
+        self.owned = frozenset(owned)
+        # Stop trusting our leases a little before the database expires them
+        self._valid_until = now + self.lease_seconds * 0.8
+        return self.owned
+
+    def owns(self, order_tracking_id):
+        """
+        Check whether this node should process an order
+
+        Args:
+            order_tracking_id (str): Pesapal tracking ID
+
+        Returns:
+            bool: True while this node holds a live lease on the order's partition
+        """
+        return (self.clock() < self._valid_until and
+                partition_for(order_tracking_id, self.partitions) in self.owned)
+
+    def filter(self, tracking_ids):
+        """
+        Keep only the tracking IDs this node owns
+
+        Returns:
+            list: Owned tracking IDs, in input order
+        """
+        return [tracking_id for tracking_id in tracking_ids if self.owns(tracking_id)]
+
+    def fenced(self, tracking_ids):
+        """
+        Keep only the tracking IDs this node owns, each with its fence
+
+        Args:
+            tracking_ids (iterable): Candidate tracking IDs
+
+        Returns:
+            list: (tracking_id, fence) pairs in input order, where fence is
+                  the (partition, owner, epoch) parameter tuple for FENCE_SQL
+        """
+        if self.clock() >= self._valid_until:
+            return []
+        owned, epochs = self.owned, self.epochs
+        result = []
+        for tracking_id in tracking_ids:
+            partition = partition_for(tracking_id, self.partitions)
+            if partition in owned:
+                result.append((tracking_id, (partition, self.node_id, epochs[partition])))
+        return result
+
+    def release(self):
+        """Give every partition back and leave the cluster"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("UPDATE partition_leases SET owner = NULL, expires_at = 0 "
+                         "WHERE owner = ?", (self.node_id,))
+            conn.execute("DELETE FROM partition_nodes WHERE node_id = ?", (self.node_id,))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        self.owned = frozenset()
+        self.epochs = {}
+        self._valid_until = 0.0
+
+    # ----------------------------------------
+    # Background renewal
+    # ----------------------------------------
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                print(f"❌ Lease renewal failed: {str(e)}")
+
+    def start(self):
+        """Heartbeat now and keep renewing in a background thread"""
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._renew_loop,
+                                        name='partition-leases', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop renewing and release all partitions"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.release()
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rebalance_on_join_and_death():
+    """Partitions move when a node joins and when one dies"""
+    import tempfile
+
+    print("\n📝 Test 1: Rebalancing on join and on death")
+
+    clock = _FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'payments.db')
+        a = PartitionLeaseManager(path, 'node-a', partitions=16, lease_seconds=10, clock=clock)
+        b = PartitionLeaseManager(path, 'node-b', partitions=16, lease_seconds=10, clock=clock)
+
+        alone = len(a.heartbeat())
+
+        b.heartbeat()            # B joins, everything is still leased to A
+        clock.now += 1
+        a.heartbeat()            # A sees two nodes and releases half
+        b.heartbeat()            # B claims the released half
+        split = (len(a.owned), len(b.owned), a.owned.isdisjoint(b.owned))
+
+        clock.now += 11          # B dies (stops heartbeating)
+        a.heartbeat()
+        after_death = len(a.owned)
+
+    print(f"   Alone: {alone}, after join: {split[:2]}, after death: {after_death}")
+    if alone == 16 and split == (8, 8, True) and after_death == 16:
+        print("✅ Test 1 passed!")
+    else:
+        print("❌ Test 1 failed!")
+
+
+def _worker_process(db_path, node_id, lease_seconds, work_seconds, out_path):
+    """One 'node': heartbeat, process owned PENDING orders, repeat"""
+    leases = PartitionLeaseManager(db_path, node_id, lease_seconds=lease_seconds)
+    conn = sqlite3.connect(db_path, timeout=30)
+    processed = []
+    idle_rounds = 0
+
+    while idle_rounds < 3:
+        leases.heartbeat()
+        pending = [row[0] for row in conn.execute(
+            "SELECT order_tracking_id FROM payments WHERE status = 'PENDING'")]
+        if not pending:
+            idle_rounds += 1
+            time.sleep(0.05)
+            continue
+        idle_rounds = 0
+
+        batch = leases.fenced(pending)[:100]
+        for _ in batch:
+            time.sleep(work_seconds)      # stands in for GetTransactionStatus
+        with conn:
+            for tracking_id, fence in batch:
+                written = conn.execute(
+                    "UPDATE payments SET status = 'Completed' "
+                    "WHERE order_tracking_id = ? AND " + FENCE_SQL,
+                    (tracking_id,) + fence,
+                ).rowcount
+                if written:
+                    processed.append(tracking_id)
+        if not batch:
+            time.sleep(0.02)
+
+    conn.close()
+    leases.release()
+    with open(out_path, 'w') as f:
+        f.write('\n'.join(processed))
+
+
+def _run_nodes(tmp, nodes, orders, work_seconds, stagger=0.0):
+    import multiprocessing
+    from payment_record import PAYMENTS_TABLE_SQL
+
+    db_path = os.path.join(tmp, f'payments-{nodes}.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(PAYMENTS_TABLE_SQL)
+    conn.executemany(
+        "INSERT INTO payments (merchant_reference, order_tracking_id, amount, currency) "
+        "VALUES (?, ?, ?, 'KES')",
+        [(f"TOUR-{i}", f"TRACK-{i:06d}", 1500.0) for i in range(orders)],
+    )
+    conn.commit()
+    conn.close()
+    PartitionLeaseManager(db_path)   # create lease tables before the race
+
+    start = time.perf_counter()
+    processes = []
+    for n in range(nodes):
+        out_path = os.path.join(tmp, f'processed-{nodes}-{n}.txt')
+        process = multiprocessing.Process(
+            target=_worker_process,
+            args=(db_path, f'node-{n}', 5.0, work_seconds, out_path),
+        )
+        process.start()
+        processes.append((process, out_path))
+        time.sleep(stagger)
+    for process, _ in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    processed = []
+    for _, out_path in processes:
+        with open(out_path) as f:
+            processed.extend(line for line in f.read().split('\n') if line)
+    return processed, elapsed
+
+
+def test_multiprocess_exactly_once(orders=1500, work_seconds=0.001):
+    """Each order handled by exactly one process; more nodes -> faster"""
+    import tempfile
+
+    print(f"\n📝 Test 2: {orders} orders across 1 and 3 local processes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single, single_seconds = _run_nodes(tmp, 1, orders, work_seconds)
+        multi, multi_seconds = _run_nodes(tmp, 3, orders, work_seconds, stagger=0.1)
+
+    speedup = single_seconds / multi_seconds
+    print(f"   1 node:  {single_seconds:.2f}s")
+    print(f"   3 nodes: {multi_seconds:.2f}s (x{speedup:.1f}, one joining every 0.1s)")
+
+    duplicates = len(multi) - len(set(multi))
+    if len(single) == orders and len(set(multi)) == orders and duplicates == 0 and speedup > 1.5:
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! processed={len(set(multi))}, duplicates={duplicates}")
+
+
+def test_rebalance_during_batch():
+    """A batch picked before a rebalance can't write to partitions it lost"""
+    import tempfile
+    from payment_record import PAYMENTS_TABLE_SQL
+
+    print("\n📝 Test 3: Rebalance while a batch is in flight")
+
+    clock = _FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'payments.db')
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute(PAYMENTS_TABLE_SQL)
+        conn.executemany(
+            "INSERT INTO payments (merchant_reference, order_tracking_id, amount, currency) "
+            "VALUES (?, ?, 100, 'KES')",
+            [(f"TOUR-{i}", f"TRACK-{i:04d}") for i in range(200)],
+        )
+        a = PartitionLeaseManager(path, 'node-a', partitions=16, lease_seconds=10, clock=clock)
+        b = PartitionLeaseManager(path, 'node-b', partitions=16, lease_seconds=10, clock=clock)
+        tracking_ids = [f"TRACK-{i:04d}" for i in range(200)]
+
+        def write(batch, status):
+            written = []
+            for tracking_id, fence in batch:
+                cursor = conn.execute(
+                    "UPDATE payments SET status = ? WHERE order_tracking_id = ? AND " + FENCE_SQL,
+                    (status, tracking_id) + fence,
+                )
+                if cursor.rowcount:
+                    written.append(tracking_id)
+            return written
+
+        a.heartbeat()
+        in_flight = a.fenced(tracking_ids)   # A picks everything...
+        b.heartbeat()
+        clock.now += 1
+        a.heartbeat()                        # ...then hands half to B
+        b.heartbeat()
+
+        by_b = write(b.fenced(tracking_ids), 'Completed')
+        by_a = write(in_flight, 'Failed')    # A's stale batch finishes late
+        final = dict(conn.execute("SELECT order_tracking_id, status FROM payments"))
+
+        # Lost and won back: the old batch still carries the old epoch
+        b.release()
+        clock.now += 1
+        a.heartbeat()
+        lost = set(by_b)
+        reclaimed = write([(t, fence) for t, fence in in_flight if t in lost], 'Reversed')
+        conn.close()
+
+    checks = [
+        len(in_flight) == 200,
+        set(by_a).isdisjoint(by_b) and len(by_a) + len(by_b) == 200,
+        all(final[t] == 'Completed' for t in by_b),
+        all(final[t] == 'Failed' for t in by_a),
+        len(a.owned) == 16 and reclaimed == [],
+    ]
+
+    print(f"   Stale batch from A: {len(by_a)} written, {200 - len(by_a)} fenced off")
+    if all(checks):
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! Checks: {checks}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PARTITIONED OWNERSHIP")
+    print("=" * 60)
+
+    test_rebalance_on_join_and_death()
+    test_multiprocess_exactly_once()
+    test_rebalance_during_batch()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
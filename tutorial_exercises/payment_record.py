@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Compact Payment Record
+======================
+
+A slotted, typed replacement for the per-payment dicts passed between
+MockDatabase, IPNHandler, PaymentDatabase and the CLI.
+
+- Amounts are stored as integers in minor units (cents): 1500.00 -> 150000
+- Timestamps are stored as integer seconds since the epoch (UTC)
+- No per-instance __dict__, so each record costs a fraction of a dict
+
+Converters:
+    PaymentRecord.from_row(row)      # sqlite3 row in PAYMENT_COLUMNS order
+    PaymentRecord.from_api(data)     # GetTransactionStatus JSON
+    PaymentRecord.from_dict(data)    # legacy dict representation
+"""
+
+import time
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+
+# Column order used by every `SELECT ... FROM payments` in this project
+PAYMENT_COLUMNS = (
+    'id',
+    'merchant_reference',
+    'order_tracking_id',
+    'amount',
+    'currency',
+    'customer_name',
+    'customer_email',
+    'customer_phone',
+    'description',
+    'status',
+    'payment_method',
+    'confirmation_code',
+    'created_at',
+    'updated_at',
+)
+
+PAYMENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        merchant_reference TEXT UNIQUE NOT NULL,
+        order_tracking_id TEXT,
+        amount REAL NOT NULL,
+        currency TEXT NOT NULL,
+        customer_name TEXT,
+        customer_email TEXT,
+        customer_phone TEXT,
+        description TEXT,
+        status TEXT DEFAULT 'PENDING',
+        payment_method TEXT,
+        confirmation_code TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+SELECT_PAYMENT_COLUMNS = ', '.join(PAYMENT_COLUMNS)
+
+# Payments in these states never change again
+TERMINAL_STATUSES = frozenset({'Completed', 'Failed', 'Reversed', 'Invalid'})
+
+
+def to_minor_units(amount):
+    """
+    Convert an amount to integer minor units
+
+    Args:
+        amount: float, int, Decimal or numeric string (e.g. 1500.5)
+
+    Returns:
+        int: Amount in cents (e.g. 150050), rounded half up
+    """
+    if amount is None or amount == '':
+        return 0
+    # Via the decimal string, so 2.675 is 268 (float math gives 267.49...)
+    cents = Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return int(cents * 100)
+
+
+def to_epoch(value):
+    """
+    Convert a timestamp to integer epoch seconds
+
+    Args:
+        value: int/float epoch, datetime, SQLite 'YYYY-MM-DD HH:MM:SS'
+               string or ISO 8601 string from the Pesapal API
+
+    Returns:
+        int: Seconds since the epoch (UTC), or 0 if missing
+    """
+    if value is None or value == '':
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        # SQLite CURRENT_TIMESTAMP is UTC but carries no timezone
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class PaymentRecord:
+    """
+    One payment, stored compactly
+
+    Mutable on purpose: databases update status fields in place.
+    """
+
+    __slots__ = (
+        'order_tracking_id',
+        'merchant_reference',
+        'amount_minor',
+        'currency',
+        'customer_name',
+        'customer_email',
+        'customer_phone',
+        'description',
+        'status',
+        'payment_method',
+        'confirmation_code',
+        'created_at',
+        'updated_at',
+        'id',
+    )
+
+    def __init__(self, order_tracking_id, merchant_reference, amount_minor=0,
+                 currency='KES', customer_name=None, customer_email=None,
+                 customer_phone=None, description=None, status='PENDING',
+                 payment_method=None, confirmation_code=None,
+                 created_at=0, updated_at=0, id=None):
+        self.order_tracking_id = order_tracking_id
+        self.merchant_reference = merchant_reference
+        self.amount_minor = amount_minor
+        self.currency = currency
+        self.customer_name = customer_name
+        self.customer_email = customer_email
+        self.customer_phone = customer_phone
+        self.description = description
+        self.status = status
+        self.payment_method = payment_method
+        self.confirmation_code = confirmation_code
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.id = id
+
+    @property
+    def amount(self):
+        """Amount in major units (e.g. 1500.0), as sent to Pesapal"""
+        return self.amount_minor / 100
+
+    @property
+    def is_terminal(self):
+        """True once the payment can no longer change status"""
+        return self.status in TERMINAL_STATUSES
+
+    def apply_status(self, status, payment_method, confirmation_code, updated_at=None):
+        """
+        Apply a status update (from an IPN or a status poll)
+
+        Args:
+            status (str): Payment status description
+            payment_method (str): e.g. 'M-Pesa'
+            confirmation_code (str): Pesapal confirmation code
+            updated_at (int): Epoch seconds (defaults to now)
+        """
+        self.status = status
+        self.payment_method = payment_method
+        self.confirmation_code = confirmation_code
+        self.updated_at = int(time.time()) if updated_at is None else updated_at
+
+    # ----------------------------------------
+    # Converters
+    # ----------------------------------------
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build a record from a `payments` row
+
+        Args:
+            row: tuple or sqlite3.Row in PAYMENT_COLUMNS order
+
+        Returns:
+            PaymentRecord
+        """
+        (id_, merchant_reference, order_tracking_id, amount, currency,
+         customer_name, customer_email, customer_phone, description,
+         status, payment_method, confirmation_code, created_at,
+         updated_at) = row
+
+        return cls(
+            order_tracking_id, merchant_reference, to_minor_units(amount),
+            currency, customer_name, customer_email, customer_phone,
+            description, status, payment_method, confirmation_code,
+            to_epoch(created_at), to_epoch(updated_at), id_,
+        )
+
+    @classmethod
+    def from_api(cls, data, order_tracking_id=None):
+        """
+        Build a record from a GetTransactionStatus response
+
+        Args:
+            data (dict): JSON response from Pesapal
+            order_tracking_id (str): Tracking ID (not always in the response)
+
+        Returns:
+            PaymentRecord
+        """
+        created_at = to_epoch(data.get('created_date'))
+        return cls(
+            order_tracking_id or data.get('order_tracking_id'),
+            data.get('merchant_reference'),
+            to_minor_units(data.get('amount')),
+            data.get('currency') or 'KES',
+            description=data.get('description'),
+            status=data.get('payment_status_description') or 'PENDING',
+            payment_method=data.get('payment_method'),
+            confirmation_code=data.get('confirmation_code'),
+            created_at=created_at,
+            updated_at=created_at or int(time.time()),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a record from the legacy dict representation
+
+        Args:
+            data (dict): Payment dict (amount in major units)
+
+        Returns:
+            PaymentRecord
+        """
+        return cls(
+            data.get('order_tracking_id'),
+            data.get('merchant_reference'),
+            to_minor_units(data.get('amount')),
+            data.get('currency') or 'KES',
+            data.get('customer_name'),
+            data.get('customer_email'),
+            data.get('customer_phone'),
+            data.get('description'),
+            data.get('status') or 'PENDING',
+            data.get('payment_method'),
+            data.get('confirmation_code'),
+            to_epoch(data.get('created_at')),
+            to_epoch(data.get('updated_at')),
+            data.get('id'),
+        )
+
+    def to_dict(self):
+        """
+        Convert to a plain dict (amount in major units)
+
+        Returns:
+            dict: Payment details, e.g. for JSON responses
+        """
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['amount'] = self.amount
+        del data['amount_minor']
+        return data
+
+    def to_row(self):
+        """
+        Convert to a tuple in PAYMENT_COLUMNS order
+
+        Returns:
+            tuple: Values ready for an INSERT
+        """
+        return (
+            self.id, self.merchant_reference, self.order_tracking_id,
+            self.amount, self.currency, self.customer_name,
+            self.customer_email, self.customer_phone, self.description,
+            self.status, self.payment_method, self.confirmation_code,
+            self.created_at, self.updated_at,
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, PaymentRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return (f"PaymentRecord({self.order_tracking_id!r}, "
+                f"{self.merchant_reference!r}, amount={self.amount:.2f}, "
+                f"status={self.status!r})")
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def test_converters():
+    """Rows, API responses and dicts all produce the same record"""
+    print("\n📝 Test 1: Converters")
+
+    row = (1, 'TOUR-001', 'TRACK-001', 1500.5, 'KES', 'Jane Doe',
+           'jane@example.com', '+254712345678', 'Safari', 'Completed',
+           'M-Pesa', 'ABC123', '2026-01-15 10:30:00', '2026-01-15 10:35:00')
+    record = PaymentRecord.from_row(row)
+
+    api_record = PaymentRecord.from_api({
+        'status': '200',
+        'merchant_reference': 'TOUR-001',
+        'amount': 1500.5,
+        'currency': 'KES',
+        'payment_status_description': 'Completed',
+        'payment_method': 'M-Pesa',
+        'confirmation_code': 'ABC123',
+        'created_date': '2026-01-15T10:30:00Z',
+    }, order_tracking_id='TRACK-001')
+
+    checks = [
+        record.amount_minor == 150050,
+        record.amount == 1500.5,
+        record.created_at == 1768473000,
+        record.updated_at - record.created_at == 300,
+        api_record.amount_minor == record.amount_minor,
+        api_record.created_at == record.created_at,
+        PaymentRecord.from_dict(record.to_dict()) == record,
+        PaymentRecord.from_row(record.to_row()) == record,
+        [to_minor_units(x) for x in ('1.005', '2.675', 2.675, 0.1 + 0.2)] == [101, 268, 268, 30],
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def benchmark_memory(count=100_000):
+    """
+    Compare memory use of MockDatabase-style dicts and PaymentRecord
+
+    Args:
+        count (int): Number of payments to hold in memory
+
+    Returns:
+        tuple: (dict_bytes, record_bytes)
+    """
+    import tracemalloc
+
+    print(f"\n📝 Benchmark: {count:,} payments in memory")
+
+    def build_dicts():
+        now = datetime.now()
+        return {
+            f"TRACK-{i}": {
+                'order_tracking_id': f"TRACK-{i}",
+                'merchant_reference': f"TOUR-{i}",
+                'amount': 1500.0 + i,
+                'status': 'PENDING',
+                'created_at': datetime.now(),
+                'updated_at': now,
+            }
+            for i in range(count)
+        }
+
+    def build_records():
+        now = int(time.time())
+        return {
+            f"TRACK-{i}": PaymentRecord(
+                f"TRACK-{i}", f"TOUR-{i}", 150000 + i * 100,
+                created_at=now, updated_at=now,
+            )
+            for i in range(count)
+        }
+
+    results = []
+    for build in (build_dicts, build_records):
+        tracemalloc.start()
+        start = time.perf_counter()
+        data = build()
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del data
+        results.append(current)
+        print(f"   {build.__name__:<14} {current / 1024 / 1024:8.1f} MB "
+              f"({current / count:.0f} B/payment, {elapsed:.2f}s)")
+
+    dict_bytes, record_bytes = results
+    print(f"   PaymentRecord uses {record_bytes / dict_bytes:.0%} of the dict memory")
+    return dict_bytes, record_bytes
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PAYMENT RECORD")
+    print("=" * 60)
+
+    test_converters()
+    dict_bytes, record_bytes = benchmark_memory()
+
+    if record_bytes < dict_bytes:
+        print("✅ Benchmark passed! Records are smaller than dicts")
+    else:
+        print("❌ Benchmark failed! Records should be smaller than dicts")
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
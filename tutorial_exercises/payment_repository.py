@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+"""
+Indexed In-Memory Payment Repository
+====================================
+
+Two classes with the same interface as PaymentDatabase (Exercise 3):
+
+1. InMemoryPaymentRepository
+   - Drop-in for MockDatabase (Exercise 2) and PaymentDatabase
+   - Hash indexes on merchant_reference and customer contact
+   - Per-status sorted index on updated_at for "all pending since X" queries
+   - Optional size bound with least-recently-used eviction
+   - Thread-safe (IPNServer runs handlers in a thread pool)
+
+2. CachedPaymentDatabase
+   - Read-through / write-through cache in front of PaymentDatabase
+   - Keeps hot recent orders in memory so IPN and status lookups
+     don't touch the disk
+
+USAGE:
+    db = CachedPaymentDatabase(PaymentDatabase('payments.db'), max_size=50_000)
+    handler = IPNHandler(db, api)
+"""
+
+import bisect
+import copy
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from payment_record import PaymentRecord, to_minor_units
+
+
+def normalize_email(email):
+    """Lower-case and strip an email address for index lookups"""
+    return email.strip().lower() if email else None
+
+
+def normalize_phone(phone):
+    """Keep only digits (and a leading +) for index lookups"""
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = ''.join(ch for ch in phone if ch.isdigit())
+    return ('+' + digits) if phone.startswith('+') else digits
+
+
+class InMemoryPaymentRepository:
+    """
+    Payments held in memory with secondary indexes
+    """
+
+    def __init__(self, max_size=None):
+        """
+        Initialize repository
+
+        Args:
+            max_size (int): Maximum payments to keep (None = unbounded).
+                            The least recently used payment is evicted first.
+        """
+        self.max_size = max_size
+        self.payments = OrderedDict()       # tracking ID -> PaymentRecord
+        self._by_reference = {}             # merchant_reference -> tracking ID
+        self._by_contact = {}               # email / phone -> {tracking IDs}
+        # status -> sorted [(updated_at, tracking ID)]. Entries for payments
+        # that have since changed are left in place and skipped (deleting
+        # from the middle of a list is O(n)); _stale counts them per status
+        # so the list is swept once they pile up.
+        self._status_index = {}
+        self._stale = {}
+        self._next_id = 1
+        # Reentrant: upserts and reference lookups call other public methods
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.payments)
+
+    def __contains__(self, order_tracking_id):
+        return order_tracking_id in self.payments
+
+    # ----------------------------------------
+    # Index maintenance
+    # ----------------------------------------
+
+    def _contact_keys(self, record):
+        keys = []
+        email = normalize_email(record.customer_email)
+        phone = normalize_phone(record.customer_phone)
+        if email:
+            keys.append(email)
+        if phone:
+            keys.append(phone)
+        return keys
+
+    def _is_current(self, status, entry):
+        record = self.payments.get(entry[1])
+        return (record is not None and (record.status or '') == status
+                and (record.updated_at or 0) == entry[0])
+
+    def _index_status(self, record):
+        # Missing values would break tuple comparison inside bisect
+        entries = self._status_index.setdefault(record.status or '', [])
+        entry = (record.updated_at or 0, record.order_tracking_id)
+        if not entries or entries[-1] <= entry:
+            entries.append(entry)           # the usual case: updated just now
+        else:
+            bisect.insort(entries, entry)
+
+    def _unindex_status(self, record):
+        status = record.status or ''
+        entries = self._status_index.get(status)
+        if entries is None:
+            return
+        stale = self._stale.get(status, 0) + 1
+        if stale > 64 and stale * 2 > len(entries):
+            tracking_id = record.order_tracking_id
+            entries[:] = sorted({entry for entry in entries
+                                 if entry[1] != tracking_id and self._is_current(status, entry)})
+            stale = 0
+        self._stale[status] = stale
+
+    def _index(self, record):
+        tracking_id = record.order_tracking_id
+        self._by_reference[record.merchant_reference] = tracking_id
+        for key in self._contact_keys(record):
+            self._by_contact.setdefault(key, set()).add(tracking_id)
+        self._index_status(record)
+
+    def _unindex(self, record):
+        tracking_id = record.order_tracking_id
+        if self._by_reference.get(record.merchant_reference) == tracking_id:
+            del self._by_reference[record.merchant_reference]
+        for key in self._contact_keys(record):
+            ids = self._by_contact.get(key)
+            if ids:
+                ids.discard(tracking_id)
+                if not ids:
+                    del self._by_contact[key]
+        self._unindex_status(record)
+
+    def _evict_if_needed(self):
+        if self.max_size is None:
+            return
+        while len(self.payments) > self.max_size:
+            _, oldest = self.payments.popitem(last=False)
+            self._unindex(oldest)
+
+    # ----------------------------------------
+    # PaymentDatabase / MockDatabase interface
+    # ----------------------------------------
+
+    def add_record(self, record):
+        """
+        Insert or replace a PaymentRecord
+
+        Args:
+            record (PaymentRecord): Payment to store
+
+        Returns:
+            PaymentRecord: The stored record
+        """
+        with self._lock:
+            existing = self.payments.get(record.order_tracking_id)
+            if existing is not None:
+                self._unindex(existing)
+            if record.id is None:
+                record.id = self._next_id
+                self._next_id += 1
+            else:
+                self._next_id = max(self._next_id, record.id + 1)
+
+            self.payments[record.order_tracking_id] = record
+            self.payments.move_to_end(record.order_tracking_id)
+            self._index(record)
+            self._evict_if_needed()
+            return record
+
+    def create_payment(self, order_tracking_id=None, merchant_reference=None,
+                       amount=0, merchant_ref=None, **details):
+        """
+        Create new payment record
+
+        Accepts both call styles:
+            create_payment('TRACK-001', 'TOUR-001', 1500.0)        # MockDatabase
+            create_payment(order_tracking_id=..., amount=..., ...)  # PaymentDatabase
+
+        Returns:
+            int: Payment ID
+        """
+        now = int(time.time())
+        record = PaymentRecord(
+            order_tracking_id,
+            merchant_reference or merchant_ref,
+            to_minor_units(amount),
+            currency=details.get('currency') or 'KES',
+            customer_name=details.get('customer_name'),
+            customer_email=details.get('customer_email'),
+            customer_phone=details.get('customer_phone'),
+            description=details.get('description'),
+            created_at=now,
+            updated_at=now,
+        )
+        return self.add_record(record).id
+
+    def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
+        """
+        Update payment status
+
+        Returns:
+            bool: True if the payment exists
+        """
+        with self._lock:
+            record = self.payments.get(order_tracking_id)
+            if record is None:
+                return False
+
+            self._unindex_status(record)
+            record.apply_status(status, payment_method, confirmation_code)
+            self._index_status(record)
+            self.payments.move_to_end(order_tracking_id)
+            return True
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        """Get payment by order tracking ID (None if unknown)"""
+        with self._lock:
+            record = self.payments.get(order_tracking_id)
+            if record is not None:
+                self.payments.move_to_end(order_tracking_id)
+            return record
+
+    # MockDatabase name for the same lookup
+    get_payment = get_payment_by_tracking_id
+
+    def get_all_payments(self):
+        """Get all payments, oldest first"""
+        with self._lock:
+            records = list(self.payments.values())
+        return sorted(records, key=lambda r: (r.created_at, r.id))
+
+    def snapshot(self, limit=None):
+        """
+        Copy the most recently used payments, e.g. for a warm-start file
+
+        Args:
+            limit (int): Most recent payments to copy (None = all)
+
+        Returns:
+            list: PaymentRecord copies, least recently used first
+        """
+        with self._lock:
+            records = reversed(self.payments.values())
+            if limit is not None:
+                records = itertools.islice(records, limit)
+            copies = [copy.copy(record) for record in records]
+        copies.reverse()
+        return copies
+
+    def update_payments(self, updates):
+        """
+        Apply many status updates
+
+        Args:
+            updates (list): (order_tracking_id, status, payment_method, confirmation_code)
+
+        Returns:
+            int: Number of updates applied
+        """
+        return sum(self.update_payment(*update) for update in updates)
+
+    def upsert_payments(self, payments):
+        """
+        Insert or replace many payments, keyed by merchant_reference
+
+        Args:
+            payments (list): PaymentRecord objects (copied; the caller's
+                             objects are left untouched)
+
+        Returns:
+            int: Number of payments written
+        """
+        written = 0
+        with self._lock:
+            for record in payments:
+                record = copy.copy(record)
+                existing_id = self._by_reference.get(record.merchant_reference)
+                if existing_id is not None:
+                    existing = self.payments[existing_id]
+                    record.id = existing.id
+                    record.created_at = existing.created_at
+                    self.remove_payment(existing_id)
+                record.created_at = record.created_at or int(time.time())
+                record.updated_at = int(time.time())
+                self.add_record(record)
+                written += 1
+        return written
+
+    def remove_payment(self, order_tracking_id):
+        """
+        Drop a payment from memory (e.g. cache invalidation)
+
+        Returns:
+            bool: True if it was present
+        """
+        with self._lock:
+            record = self.payments.pop(order_tracking_id, None)
+            if record is None:
+                return False
+            self._unindex(record)
+            return True
+
+    # ----------------------------------------
+    # Secondary index lookups
+    # ----------------------------------------
+
+    def get_payment_by_merchant_reference(self, merchant_reference):
+        """Get payment by merchant reference (None if unknown)"""
+        with self._lock:
+            tracking_id = self._by_reference.get(merchant_reference)
+            return self.get_payment_by_tracking_id(tracking_id) if tracking_id else None
+
+    def find_by_customer(self, email=None, phone=None):
+        """
+        Find a customer's payments by email and/or phone
+
+        Returns:
+            list: PaymentRecord objects, newest first
+        """
+        ids = set()
+        with self._lock:
+            for key in (normalize_email(email), normalize_phone(phone)):
+                if key:
+                    ids |= self._by_contact.get(key, set())
+            records = [self.payments[i] for i in ids]
+        records.sort(key=lambda r: r.created_at, reverse=True)
+        return records
+
+    def find_by_status(self, status, updated_after=0, updated_before=None, limit=None):
+        """
+        Find payments in a status, ordered by updated_at
+
+        Args:
+            status (str): e.g. 'PENDING'
+            updated_after (int): Epoch seconds, inclusive lower bound
+            updated_before (int): Epoch seconds, exclusive upper bound
+            limit (int): Maximum results
+
+        Returns:
+            list: PaymentRecord objects, oldest update first
+        """
+        results, seen = [], set()
+        with self._lock:
+            entries = self._status_index.get(status, [])
+            for position in range(bisect.bisect_left(entries, (updated_after, '')), len(entries)):
+                entry = entries[position]
+                if updated_before is not None and entry[0] >= updated_before:
+                    break
+                # Skip entries left behind by later changes (and their
+                # duplicates, if a payment came back to this status)
+                if entry[1] in seen or not self._is_current(status, entry):
+                    continue
+                seen.add(entry[1])
+                results.append(self.payments[entry[1]])
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+
+class CachedPaymentDatabase:
+    """
+    Size-bounded read-through / write-through cache in front of a database
+
+    The backing database needs the PaymentDatabase interface:
+    create_payment(**kwargs), update_payment(...),
+    get_payment_by_tracking_id(...), get_all_payments().
+    """
+
+    def __init__(self, database, max_size=10_000):
+        """
+        Initialize cache
+
+        Args:
+            database: PaymentDatabase (or anything with the same methods)
+            max_size (int): Maximum payments held in memory
+        """
+        self.db = database
+        self.cache = InMemoryPaymentRepository(max_size=max_size)
+        self.hits = 0
+        self.misses = 0
+        # _lock guards the cache bookkeeping and is never held across
+        # database I/O, so hits don't wait behind a slow miss. Writes are
+        # serialized by _write_lock, so the cache applies them in the
+        # same order as the database.
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reads_in_flight = 0
+        self._written = set()     # tracking IDs updated while a read-through ran
+
+    def _read_through(self, read, cached):
+        """
+        Read a missed payment from the database (outside _lock) and cache it
+
+        A copy fetched while the same payment was being updated may be
+        older than that update, so it is returned but not cached; a copy
+        cached by another thread in the meantime wins.
+
+        Args:
+            read (callable): () -> payment from the database (or None)
+            cached (callable): () -> payment from the cache (or None)
+
+        Returns:
+            PaymentRecord: The payment, or None
+        """
+        with self._lock:
+            self._reads_in_flight += 1
+        payment = None
+        try:
+            payment = read()
+        finally:
+            with self._lock:
+                self._reads_in_flight -= 1
+                if isinstance(payment, dict):
+                    payment = PaymentRecord.from_dict(payment)
+                newer = cached()
+                if newer is not None:
+                    payment = newer
+                elif payment is not None and payment.order_tracking_id not in self._written:
+                    # A copy: the database may hand out its own live record
+                    payment = self.cache.add_record(copy.copy(payment))
+                if not self._reads_in_flight:
+                    self._written.clear()
+        return payment
+
+    def create_payment(self, **kwargs):
+        """Write to the database, then cache the new payment"""
+        with self._write_lock:
+            payment_id = self.db.create_payment(**kwargs)
+        now = int(time.time())
+        self.cache.add_record(PaymentRecord(
+            kwargs.get('order_tracking_id'),
+            kwargs.get('merchant_reference'),
+            to_minor_units(kwargs.get('amount')),
+            currency=kwargs.get('currency') or 'KES',
+            customer_name=kwargs.get('customer_name'),
+            customer_email=kwargs.get('customer_email'),
+            customer_phone=kwargs.get('customer_phone'),
+            description=kwargs.get('description'),
+            created_at=now,
+            updated_at=now,
+            id=payment_id,
+        ))
+        return payment_id
+
+    def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
+        """Write to the database, then update the cached copy (if any)"""
+        with self._write_lock:
+            result = self.db.update_payment(
+                order_tracking_id, status, payment_method, confirmation_code
+            )
+            with self._lock:
+                if self._reads_in_flight:
+                    self._written.add(order_tracking_id)
+                if result is False:
+                    # The database rejected it - don't let the cache disagree
+                    self.cache.remove_payment(order_tracking_id)
+                    return False
+                cached = self.cache.update_payment(
+                    order_tracking_id, status, payment_method, confirmation_code
+                )
+            if not cached:
+                # Not cached yet: read it through so the next lookup is a hit
+                self.get_payment_by_tracking_id(order_tracking_id)
+            return True if result is None else result
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        """Serve from memory, falling back to the database"""
+        with self._lock:
+            payment = self.cache.get_payment_by_tracking_id(order_tracking_id)
+            if payment is not None:
+                self.hits += 1
+                return payment
+            self.misses += 1
+        return self._read_through(
+            lambda: self.db.get_payment_by_tracking_id(order_tracking_id),
+            lambda: self.cache.get_payment_by_tracking_id(order_tracking_id))
+
+    get_payment = get_payment_by_tracking_id
+
+    def get_payment_by_merchant_reference(self, merchant_reference):
+        """Serve from memory, falling back to the database if it supports it"""
+        with self._lock:
+            payment = self.cache.get_payment_by_merchant_reference(merchant_reference)
+            if payment is not None:
+                self.hits += 1
+                return payment
+            self.misses += 1
+        lookup = getattr(self.db, 'get_payment_by_merchant_reference', None)
+        if lookup is None:
+            return None
+        return self._read_through(
+            lambda: lookup(merchant_reference),
+            lambda: self.cache.get_payment_by_merchant_reference(merchant_reference))
+
+    def get_all_payments(self):
+        """Full scans always go to the database"""
+        return self.db.get_all_payments()
+
+    def snapshot(self, limit=None):
+        """Copy the most recently used cached payments (see InMemoryPaymentRepository)"""
+        with self._lock:
+            return self.cache.snapshot(limit)
+
+    def invalidate(self, order_tracking_id=None):
+        """Drop one payment (or everything) from the cache"""
+        with self._lock:
+            if order_tracking_id is None:
+                self.cache = InMemoryPaymentRepository(max_size=self.cache.max_size)
+            else:
+                self.cache.remove_payment(order_tracking_id)
+
+    def stats(self):
+        """Cache hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _CountingDatabase(InMemoryPaymentRepository):
+    """Stands in for PaymentDatabase and counts how often it is read"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        self.reads += 1
+        return super().get_payment_by_tracking_id(order_tracking_id)
+
+
+def test_secondary_indexes():
+    """Lookups by reference, contact and status use the indexes"""
+    print("\n📝 Test 1: Secondary indexes")
+
+    repo = InMemoryPaymentRepository()
+    repo.create_payment('TRACK-001', 'TOUR-001', 1500.0)
+    repo.create_payment(
+        order_tracking_id='TRACK-002', merchant_reference='TOUR-002',
+        amount=2500, currency='KES', customer_name='Jane Doe',
+        customer_email='Jane@Example.com', customer_phone='+254 712 345 678',
+        description='Safari',
+    )
+    repo.update_payment('TRACK-001', 'Completed', 'M-Pesa', 'ABC123')
+
+    checks = [
+        repo.get_payment_by_merchant_reference('TOUR-002').order_tracking_id == 'TRACK-002',
+        [r.order_tracking_id for r in repo.find_by_customer(email='jane@example.com')] == ['TRACK-002'],
+        [r.order_tracking_id for r in repo.find_by_customer(phone='+254712345678')] == ['TRACK-002'],
+        [r.order_tracking_id for r in repo.find_by_status('Completed')] == ['TRACK-001'],
+        [r.order_tracking_id for r in repo.find_by_status('PENDING')] == ['TRACK-002'],
+        repo.update_payment('TRACK-404', 'Completed', None, None) is False,
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def test_eviction():
+    """A bounded repository evicts the least recently used payment"""
+    print("\n📝 Test 2: LRU eviction")
+
+    repo = InMemoryPaymentRepository(max_size=2)
+    repo.create_payment('TRACK-1', 'TOUR-1', 100)
+    repo.create_payment('TRACK-2', 'TOUR-2', 200)
+    repo.get_payment('TRACK-1')                      # TRACK-2 is now the oldest
+    repo.create_payment('TRACK-3', 'TOUR-3', 300)
+
+    if ('TRACK-2' not in repo and 'TRACK-1' in repo
+            and repo.get_payment_by_merchant_reference('TOUR-2') is None
+            and len(repo.find_by_status('PENDING')) == 2):
+        print("✅ Test 2 passed!")
+    else:
+        print("❌ Test 2 failed!")
+
+
+def test_read_through_cache():
+    """Repeated IPN lookups are served from memory"""
+    print("\n📝 Test 3: Read-through / write-through cache")
+
+    backing = _CountingDatabase()
+    backing.create_payment('TRACK-001', 'TOUR-001', 1500.0)
+    db = CachedPaymentDatabase(backing, max_size=100)
+
+    for _ in range(10):
+        db.get_payment_by_tracking_id('TRACK-001')
+    db.update_payment('TRACK-001', 'Completed', 'M-Pesa', 'ABC123')
+
+    cached = db.get_payment('TRACK-001')
+    stored = backing.payments['TRACK-001']
+
+    if backing.reads == 1 and cached.status == stored.status == 'Completed':
+        print(f"✅ Test 3 passed! {db.stats()}")
+    else:
+        print(f"❌ Test 3 failed! Backing reads: {backing.reads}")
+
+
+def test_concurrent_status_changes(threads=8, payments=2000):
+    """Threads updating, reading and evicting leave the indexes consistent"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    print(f"\n📝 Test 4: {threads} threads changing {payments:,} payments")
+
+    repo = InMemoryPaymentRepository(max_size=payments // 2)
+
+    def work(n):
+        for i in range(n, payments, threads):
+            repo.create_payment(f"TRACK-{i}", f"TOUR-{i}", 100)
+            repo.update_payment(f"TRACK-{i}", 'Processing', None, None)
+            repo.get_payment(f"TRACK-{i // 2}")
+            repo.update_payment(f"TRACK-{i}", 'Completed' if i % 3 else 'PENDING', 'M-Pesa', 'A')
+            repo.find_by_status('PENDING', limit=5)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(work, range(threads)))
+
+    by_status = {}
+    for record in repo.payments.values():
+        by_status.setdefault(record.status, set()).add(record.order_tracking_id)
+    indexed = {status: {r.order_tracking_id for r in repo.find_by_status(status)}
+               for status in ('PENDING', 'Processing', 'Completed')}
+
+    # Many status changes: each one appends, none shifts a long list
+    big = InMemoryPaymentRepository()
+    for i in range(50_000):
+        big.create_payment(f"T{i}", f"R{i}", 100)
+    start = time.perf_counter()
+    for i in range(50_000):
+        big.update_payment(f"T{i}", 'Completed', 'M-Pesa', 'A')
+    per_update_us = (time.perf_counter() - start) / 50_000 * 1e6
+
+    print(f"   status change: {per_update_us:.1f} µs with 50,000 pending payments")
+    if len(repo) == payments // 2 and indexed['Processing'] == set() \
+            and all(indexed[status] == by_status.get(status, set())
+                    for status in ('PENDING', 'Completed')) \
+            and len(big.find_by_status('Completed')) == 50_000 \
+            and not big.find_by_status('PENDING'):
+        print("✅ Test 4 passed!")
+    else:
+        print("❌ Test 4 failed!")
+
+
+class _SlowDatabase(InMemoryPaymentRepository):
+    """Backing database whose reads take `delay` seconds"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        time.sleep(self.delay)
+        return super().get_payment_by_tracking_id(order_tracking_id)
+
+
+def test_hits_during_slow_miss(delay=0.3):
+    """A hit doesn't wait for another thread's miss; a racing update isn't undone"""
+    print("\n📝 Test 5: Cache hits while a miss reads the database")
+
+    backing = _SlowDatabase(delay)
+    for i in range(3):
+        backing.create_payment(f"TRACK-{i}", f"TOUR-{i}", 100)
+    db = CachedPaymentDatabase(backing, max_size=100)
+    backing.delay = 0
+    db.get_payment('TRACK-0')                        # cached
+    backing.delay = delay
+
+    miss = threading.Thread(target=db.get_payment, args=('TRACK-1',))
+    miss.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    hit = db.get_payment('TRACK-0')
+    hit_ms = (time.perf_counter() - start) * 1000
+
+    # The miss read TRACK-1 before this update: its older copy must not
+    # end up in the cache over the update
+    backing.delay = 0
+    db.update_payment('TRACK-1', 'Completed', 'M-Pesa', 'ABC')
+    miss.join()
+    after = db.get_payment('TRACK-1').status
+    live = backing.payments['TRACK-1']
+    not_shared = db.cache.payments['TRACK-1'] is not live
+
+    print(f"   hit took {hit_ms:.1f} ms while a {delay * 1000:.0f} ms miss was in flight")
+    if hit is not None and hit_ms < delay * 1000 / 3 and after == 'Completed' and not_shared:
+        print("✅ Test 5 passed!")
+    else:
+        print(f"❌ Test 5 failed! hit={hit_ms:.1f} ms status={after} not_shared={not_shared}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PAYMENT REPOSITORY")
+    print("=" * 60)
+
+    test_secondary_indexes()
+    test_eviction()
+    test_read_through_cache()
+    test_concurrent_status_changes()
+    test_hits_during_slow_miss()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
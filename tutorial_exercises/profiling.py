@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Built-in Profiling Mode
+=======================
+
+Profile slow checkouts without editing code.
+
+Turn it on with environment variables:
+
+    PESAPAL_PROFILE=1             # or: cprofile | sample | both
+    PESAPAL_PROFILE_DIR=profiles  # where output files go
+    PESAPAL_PROFILE_TAIL=5        # only keep the slowest 5% of operations
+    PESAPAL_PROFILE_MEMORY=1      # also take tracemalloc snapshots
+
+or with the `--profile` flag:
+
+    python 03_complete_integration.py --profile
+    python ipn_server.py serve --profile
+
+For every profiled operation (e.g. `create_order`, `handle_ipn`) you get:
+
+    profiles/create_order-0003.pstats      # python -m pstats <file>
+    profiles/create_order-0003.collapsed   # flamegraph.pl / speedscope input
+    profiles/create_order-0003.tracemalloc # tracemalloc.Snapshot.load(<file>)
+
+Modes:
+    cprofile - deterministic (cProfile), exact call counts, more overhead
+    sample   - a background thread samples the stack every millisecond,
+               low overhead, produces the collapsed stacks
+    both     - both of the above (default for PESAPAL_PROFILE=1)
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+
+PROFILE_MODES = ('cprofile', 'sample', 'both')
+
+# cProfile can only be active in one thread at a time on newer Pythons;
+# concurrent operations fall back to stack sampling only
+_CPROFILE_LOCK = threading.Lock()
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = own_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        """Write Brendan Gregg's collapsed-stack format ('a;b;c 12')"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class OperationProfiler:
+    """
+    Wraps operations in a profiler and writes per-operation output files
+    """
+
+    def __init__(self, output_dir='profiles', mode='both', tail_percent=None,
+                 memory=False, sample_interval=0.001, warmup=20, enabled=True):
+        """
+        Initialize profiler
+
+        Args:
+            output_dir (str): Directory for .pstats/.collapsed/.tracemalloc files
+            mode (str): 'cprofile', 'sample' or 'both'
+            tail_percent (float): Only keep output for operations slower than
+                                  this percentile of recent durations
+                                  (e.g. 5 = slowest 5%). None keeps everything.
+            memory (bool): Record tracemalloc snapshots
+            sample_interval (float): Seconds between stack samples
+            warmup (int): Operations timed before tail sampling keeps anything
+            enabled (bool): False turns every wrapper into a plain call
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+
+        self.output_dir = output_dir
+        self.mode = mode
+        self.tail_percent = tail_percent
+        self.memory = memory
+        self.sample_interval = sample_interval
+        self.warmup = warmup
+        self.enabled = enabled
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._durations = defaultdict(lambda: deque(maxlen=1000))
+        self.kept = Counter()
+
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+
+    # ----------------------------------------
+    # Tail sampling
+    # ----------------------------------------
+
+    def _should_keep(self, name, duration):
+        """Record the duration and decide whether this run is in the tail"""
+        with self._lock:
+            recent = self._durations[name]
+            recent.append(duration)
+            if self.tail_percent is None:
+                return True
+            if len(recent) < self.warmup:
+                return False
+            ordered = sorted(recent)
+            cutoff_index = int(len(ordered) * (100 - self.tail_percent) / 100)
+            threshold = ordered[min(cutoff_index, len(ordered) - 1)]
+            return duration >= threshold
+
+    # ----------------------------------------
+    # Profiling
+    # ----------------------------------------
+
+    def _write(self, name, duration, profile, sampler, snapshot):
+        with self._lock:
+            self._counters[name] += 1
+            sequence = self._counters[name]
+            self.kept[name] += 1
+
+        stem = os.path.join(self.output_dir, f"{name}-{sequence:04d}")
+        if profile is not None:
+            profile.dump_stats(stem + '.pstats')
+        if sampler is not None:
+            sampler.write_collapsed(stem + '.collapsed')
+        if snapshot is not None:
+            snapshot.dump(stem + '.tracemalloc')
+        print(f"🔬 Profiled {name} ({duration * 1000:.1f} ms) -> {stem}.*")
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) under the profiler
+
+        Nested operations (e.g. create_order inside book_tour) are timed
+        as part of the outermost operation, since only one profiler can be
+        active per thread.
+        """
+        if not self.enabled or getattr(self._local, 'active', False):
+            return func(*args, **kwargs)
+
+        import cProfile
+        import tracemalloc
+
+        profile = None
+        if self.mode in ('cprofile', 'both') and _CPROFILE_LOCK.acquire(blocking=False):
+            profile = cProfile.Profile()
+        sampler = None
+        if self.mode in ('sample', 'both'):
+            sampler = StackSampler(threading.get_ident(), self.sample_interval)
+
+        started_tracemalloc = False
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            started_tracemalloc = True
+
+        self._local.active = True
+        if sampler is not None:
+            sampler.start()
+        if profile is not None:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                _CPROFILE_LOCK.release()
+            if sampler is not None:
+                sampler.stop()
+            self._local.active = False
+
+            snapshot = tracemalloc.take_snapshot() if self.memory else None
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+            if self._should_keep(name, duration):
+                self._write(name, duration, profile, sampler, snapshot)
+
+    def wrap(self, func, name=None):
+        """
+        Decorate a function so every call is profiled
+
+        Args:
+            func (callable): Function or bound method
+            name (str): Operation name (defaults to the function name)
+        """
+        name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(name, func, *args, **kwargs)
+
+        return wrapper
+
+    def instrument(self, obj, method_names):
+        """
+        Profile selected methods of one object (no code changes needed)
+
+        Args:
+            obj: e.g. a PesapalService, IPNHandler or TourBookingCLI
+            method_names (list): Method names to wrap
+
+        Returns:
+            obj (for chaining)
+        """
+        if not self.enabled:
+            return obj
+        for method_name in method_names:
+            method = getattr(obj, method_name, None)
+            if callable(method):
+                setattr(obj, method_name, self.wrap(method, method_name))
+        return obj
+
+    def report(self):
+        """Print timing for every operation seen"""
+        print("\n🔬 PROFILING SUMMARY")
+        print(f"   {'operation':<24}{'calls':>7}{'mean ms':>10}{'max ms':>10}{'kept':>6}")
+        for name, durations in sorted(self._durations.items()):
+            values = list(durations)
+            mean = sum(values) / len(values) * 1000
+            print(f"   {name:<24}{len(values):>7}{mean:>10.2f}"
+                  f"{max(values) * 1000:>10.2f}{self.kept[name]:>6}")
+        print(f"   Output: {os.path.abspath(self.output_dir)}")
+
+
+def profiler_from_env(argv=None):
+    """
+    Build a profiler from PESAPAL_PROFILE* variables or a --profile flag
+
+    Args:
+        argv (list): Command-line arguments to check for --profile
+                     (defaults to sys.argv)
+
+    Returns:
+        OperationProfiler: Disabled (zero overhead) unless profiling was asked for
+    """
+    argv = sys.argv if argv is None else argv
+    setting = os.environ.get('PESAPAL_PROFILE', '').strip().lower()
+    if '--profile' in argv and not setting:
+        setting = '1'
+
+    if setting in ('', '0', 'false', 'no', 'off'):
+        return OperationProfiler(enabled=False)
+
+    tail = os.environ.get('PESAPAL_PROFILE_TAIL')
+    return OperationProfiler(
+        output_dir=os.environ.get('PESAPAL_PROFILE_DIR', 'profiles'),
+        mode=setting if setting in PROFILE_MODES else 'both',
+        tail_percent=float(tail) if tail else None,
+        memory=os.environ.get('PESAPAL_PROFILE_MEMORY', '').lower() in ('1', 'true', 'yes'),
+    )
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _slow_operation(n):
+    """Burns a little CPU so the sampler sees something"""
+    total = 0
+    for i in range(n):
+        total += sum(range(i % 500))
+    return total
+
+
+def test_profiles_written():
+    """Each operation produces pstats, collapsed stacks and a snapshot"""
+    import pstats
+    import tempfile
+    import tracemalloc
+
+    print("\n📝 Test 1: Output files for one operation")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = OperationProfiler(output_dir=tmp, mode='both', memory=True)
+        slow = profiler.wrap(_slow_operation, 'create_order')
+        slow(5_000)
+
+        stem = os.path.join(tmp, 'create_order-0001')
+        stats = pstats.Stats(stem + '.pstats')
+        with open(stem + '.collapsed') as f:
+            collapsed = f.read()
+        snapshot = tracemalloc.Snapshot.load(stem + '.tracemalloc')
+
+    checks = [
+        any(func[2] == '_slow_operation' for func in stats.stats),
+        '_slow_operation' in collapsed,
+        snapshot is not None,
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def test_tail_sampling():
+    """Only the slowest operations are kept"""
+    import tempfile
+
+    print("\n📝 Test 2: Tail sampling (slowest 10%)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = OperationProfiler(output_dir=tmp, mode='cprofile',
+                                     tail_percent=10, warmup=20)
+        handle_ipn = profiler.wrap(time.sleep, 'handle_ipn')
+        for i in range(60):
+            handle_ipn(0.02 if i in (30, 45) else 0.0005)
+        kept = sorted(os.listdir(tmp))
+
+    if profiler.kept['handle_ipn'] <= 8 and len(kept) == profiler.kept['handle_ipn'] >= 2:
+        print(f"✅ Test 2 passed! Kept {len(kept)} of 60")
+    else:
+        print(f"❌ Test 2 failed! Kept {kept}")
+
+
+def test_disabled_overhead(calls=100_000):
+    """A disabled profiler adds almost nothing"""
+    print(f"\n📝 Test 3: Disabled overhead over {calls:,} calls")
+
+    profiler = OperationProfiler(enabled=False)
+    wrapped = profiler.wrap(len)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        len('x')
+    bare = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        wrapped('x')
+    overhead_ns = (time.perf_counter() - start - bare) / calls * 1e9
+
+    print(f"   Overhead: {overhead_ns:.0f} ns/call")
+    if overhead_ns < 5_000:
+        print("✅ Test 3 passed!")
+    else:
+        print("❌ Test 3 failed!")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING PROFILING MODE")
+    print("=" * 60)
+
+    test_profiles_written()
+    test_tail_sampling()
+    test_disabled_overhead()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Merchant Reference Generator
+============================
+
+Time-ordered, collision-free merchant references for Pesapal orders.
+
+Every reference packs 128 bits into 26 Crockford base32 characters:
+
+    | 48 bits          | 16 bits  | 64 bits                       |
+    | unix time in ms  | sequence | node (host + process + random) |
+
+- The timestamp comes first, so references sort by creation time and new
+  rows always land at the right-hand edge of the `merchant_reference` index
+  (good B-tree insert locality in SQLite).
+- The sequence allows 65,536 references per millisecond per process.
+- The node component is a hash of the hostname, process ID and random bytes,
+  so processes and hosts never need to coordinate.
+
+USAGE:
+    generator = MerchantReferenceGenerator(prefix='TOUR')
+    merchant_ref = generator.next_reference()   # 'TOUR-01J9...'
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+
+
+# Crockford base32: no I, L, O or U, and it sorts the same way as the numbers
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+TIMESTAMP_BITS = 48
+SEQUENCE_BITS = 16
+NODE_BITS = 64
+
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ENCODED_LENGTH = 26  # ceil(128 / 5)
+
+
+def encode_id(value):
+    """
+    Encode a 128-bit integer as a fixed-width Crockford base32 string
+
+    Args:
+        value (int): ID to encode
+
+    Returns:
+        str: 26 character string that sorts the same way as the integer
+    """
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        chars.append(CROCKFORD_ALPHABET[value & 0x1F])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def decode_id(text):
+    """
+    Decode a Crockford base32 string back into an integer
+
+    Args:
+        text (str): Encoded ID (with or without prefix)
+
+    Returns:
+        int: The 128-bit ID
+    """
+    value = 0
+    for char in text[-ENCODED_LENGTH:].upper():
+        value = (value << 5) | CROCKFORD_ALPHABET.index(char)
+    return value
+
+
+def split_id(value):
+    """
+    Split an ID into its components
+
+    Args:
+        value (int): 128-bit ID
+
+    Returns:
+        tuple: (timestamp_ms, sequence, node)
+    """
+    node = value & ((1 << NODE_BITS) - 1)
+    sequence = (value >> NODE_BITS) & MAX_SEQUENCE
+    timestamp_ms = value >> (NODE_BITS + SEQUENCE_BITS)
+    return timestamp_ms, sequence, node
+
+
+def make_node_id(worker_id=None):
+    """
+    Build the 64-bit node component for this process
+
+    Args:
+        worker_id (str): Optional stable worker name (e.g. 'web-3')
+
+    Returns:
+        int: Node component
+    """
+    import socket   # only needed here; keeps module import cheap
+
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(socket.gethostname().encode())
+    hasher.update(struct.pack('>Q', os.getpid()))
+    hasher.update(str(worker_id or '').encode())
+    # Random bytes cover PID reuse and containers that share a hostname
+    hasher.update(os.urandom(16))
+    return int.from_bytes(hasher.digest(), 'big')
+
+
+class MerchantReferenceGenerator:
+    """
+    Generates unique, k-sortable merchant references
+
+    Thread-safe, and safe to use after os.fork(): a child process notices
+    the PID change and picks a fresh node component.
+    """
+
+    def __init__(self, prefix='TOUR', worker_id=None, clock=None):
+        """
+        Initialize reference generator
+
+        Args:
+            prefix (str): Text placed before the encoded ID ('' for none)
+            worker_id (str): Optional worker name mixed into the node ID
+            clock (callable): Returns the time in ms (for testing)
+        """
+        self.prefix = f"{prefix}-" if prefix else ''
+        self.worker_id = worker_id
+        self.clock = clock or (lambda: time.time_ns() // 1_000_000)
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._node = make_node_id(worker_id)
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _check_fork(self):
+        """Pick a new node component if we are now in a forked child"""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._node = make_node_id(self.worker_id)
+            self._last_ms = 0
+            self._sequence = 0
+
+    def next_id(self):
+        """
+        Generate the next ID
+
+        Returns:
+            int: 128-bit ID, strictly increasing within this process
+        """
+        with self._lock:
+            self._check_fork()
+
+            now_ms = self.clock()
+
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond, or the wall clock stepped backwards:
+                # stay on the last timestamp so IDs keep increasing
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Sequence exhausted - borrow the next millisecond
+                    self._last_ms += 1
+                    self._sequence = 0
+
+            return (
+                (self._last_ms << (NODE_BITS + SEQUENCE_BITS))
+                | (self._sequence << NODE_BITS)
+                | self._node
+            )
+
+    def next_reference(self):
+        """
+        Generate the next merchant reference
+
+        Returns:
+            str: e.g. 'TOUR-01J9Z3K4M8...' (prefix + 26 characters)
+        """
+        return self.prefix + encode_id(self.next_id())
+
+    def next_batch(self, count):
+        """
+        Generate several IDs in one call (one lock acquisition per ID)
+
+        Args:
+            count (int): How many IDs to generate
+
+        Returns:
+            list: Integer IDs in increasing order
+        """
+        next_id = self.next_id
+        return [next_id() for _ in range(count)]
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _stress_worker(path, count):
+    """Generate `count` IDs in a child process and write them to `path`"""
+    generator = MerchantReferenceGenerator()
+    chunk = 50_000
+
+    with open(path, 'wb') as f:
+        remaining = count
+        while remaining:
+            n = min(chunk, remaining)
+            ids = generator.next_batch(n)
+            f.write(b''.join(i.to_bytes(16, 'big') for i in ids))
+            remaining -= n
+
+
+def _read_ids(path):
+    """Stream 16-byte IDs back from a worker file"""
+    with open(path, 'rb') as f:
+        while True:
+            raw = f.read(16)
+            if not raw:
+                return
+            yield raw
+
+
+def test_ordering():
+    """References sort in creation order, even with a frozen clock"""
+    print("\n📝 Test 1: References are k-sortable")
+
+    generator = MerchantReferenceGenerator(clock=lambda: 1_700_000_000_000)
+    refs = [generator.next_reference() for _ in range(1000)]
+
+    if refs == sorted(refs) and len(set(refs)) == len(refs):
+        print("✅ Test 1 passed!")
+    else:
+        print("❌ Test 1 failed! References are not strictly increasing")
+
+
+def test_clock_going_backwards():
+    """A clock step backwards must not produce duplicates"""
+    print("\n📝 Test 2: Clock moves backwards")
+
+    times = iter([5000, 5000, 4000, 4000, 6000])
+    generator = MerchantReferenceGenerator(clock=lambda: next(times))
+    ids = [generator.next_id() for _ in range(5)]
+
+    if ids == sorted(ids) and len(set(ids)) == 5:
+        print("✅ Test 2 passed!")
+    else:
+        print("❌ Test 2 failed!")
+
+
+def test_sequence_overflow():
+    """More than 65,536 IDs in one millisecond borrow the next millisecond"""
+    print("\n📝 Test 3: Sequence overflow")
+
+    generator = MerchantReferenceGenerator(clock=lambda: 1000)
+    ids = generator.next_batch(MAX_SEQUENCE + 10)
+    timestamp_ms, sequence, _ = split_id(ids[-1])
+
+    if len(set(ids)) == len(ids) and timestamp_ms == 1001 and sequence == 8:
+        print("✅ Test 3 passed!")
+    else:
+        print("❌ Test 3 failed!")
+
+
+def test_stress_multiprocess(processes=4, per_process=500_000):
+    """
+    Generate millions of IDs across processes and check for duplicates
+
+    Each worker writes its (already sorted) IDs to a file. The files are
+    merged with heapq, so the duplicate check runs in constant memory.
+    """
+    import heapq
+    import multiprocessing
+    import tempfile
+
+    total = processes * per_process
+    print(f"\n📝 Test 4: {processes} processes x {per_process:,} IDs")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"worker-{i}.bin") for i in range(processes)]
+
+        start = time.perf_counter()
+        workers = [
+            multiprocessing.Process(target=_stress_worker, args=(path, per_process))
+            for path in paths
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        if any(worker.exitcode != 0 for worker in workers):
+            print("❌ Test 4 failed! A worker crashed")
+            return
+
+        seen = 0
+        duplicates = 0
+        previous = None
+        for raw in heapq.merge(*(_read_ids(path) for path in paths)):
+            if raw == previous:
+                duplicates += 1
+            previous = raw
+            seen += 1
+
+    print(f"   Generated {seen:,} IDs in {elapsed:.2f}s "
+          f"({total / elapsed:,.0f} IDs/sec)")
+
+    if seen == total and duplicates == 0:
+        print("✅ Test 4 passed! No duplicates")
+    else:
+        print(f"❌ Test 4 failed! {duplicates} duplicates, {seen:,} IDs seen")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING MERCHANT REFERENCE GENERATOR")
+    print("=" * 60)
+
+    test_ordering()
+    test_clock_going_backwards()
+    test_sequence_overflow()
+    test_stress_multiprocess()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
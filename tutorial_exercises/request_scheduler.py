@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Priority-Aware Request Scheduler
+================================
+
+Keeps checkout fast while IPN verification and nightly reconciliation
+share the same Pesapal rate budget and connection pool.
+
+Three traffic classes, each with its own queue:
+
+    INTERACTIVE  create_order / checkout status checks   (weight 6)
+    WEBHOOK      IPN verification                         (weight 3)
+    BATCH        reconciliation, polling, bulk jobs       (weight 1)
+
+- Weighted fair share: when every queue is busy, workers pick jobs in
+  proportion to the weights (stride scheduling), so batch work still
+  progresses but can never starve checkout.
+- Reserved capacity: `reserved_workers` connections and `reserved_tokens`
+  of the rate budget can only be used by INTERACTIVE requests.
+- Metrics: per-class queue time (p50/p95/p99), counts and in-flight jobs.
+
+USAGE:
+    scheduler = PriorityScheduler(workers=8, rate_limiter=TokenBucket(20))
+    checkout = scheduler.bind(pesapal_client, INTERACTIVE)
+    nightly = scheduler.bind(pesapal_client, BATCH)
+    checkout.submit_order(payload)       # jumps ahead of nightly.* calls
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+INTERACTIVE = 'interactive'
+WEBHOOK = 'webhook'
+BATCH = 'batch'
+
+TRAFFIC_CLASSES = (INTERACTIVE, WEBHOOK, BATCH)
+DEFAULT_WEIGHTS = {INTERACTIVE: 6, WEBHOOK: 3, BATCH: 1}
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'kwargs', 'future', 'enqueued')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class ClassMetrics:
+    """
+    Queue-time statistics for one traffic class
+    """
+
+    def __init__(self, window=10_000):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.queue_times = deque(maxlen=window)
+
+    def snapshot(self, queued):
+        values = sorted(self.queue_times)
+
+        def pick(pct):
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000
+
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'queued': queued,
+            'in_flight': self.in_flight,
+            'queue_p50_ms': pick(50),
+            'queue_p95_ms': pick(95),
+            'queue_p99_ms': pick(99),
+        }
+
+
+class PriorityScheduler:
+    """
+    Worker pool with per-class queues, weighted fair share and reservations
+    """
+
+    def __init__(self, workers=8, weights=None, reserved_workers=1,
+                 rate_limiter=None, reserved_tokens=0):
+        """
+        Initialize scheduler
+
+        Args:
+            workers (int): Concurrent upstream calls (match the connection pool)
+            weights (dict): Share per traffic class when all queues are busy
+            reserved_workers (int): Workers only INTERACTIVE jobs may use
+            rate_limiter (TokenBucket): Shared upstream rate budget
+            reserved_tokens (float): Part of the bucket only INTERACTIVE
+                                     jobs may spend (must be below capacity)
+        """
+        if reserved_workers >= workers:
+            raise ValueError("reserved_workers must leave at least one shared worker")
+
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.workers = workers
+        self.reserved_workers = reserved_workers
+        self.rate_limiter = rate_limiter
+        self.reserved_tokens = reserved_tokens
+
+        self._queues = {name: deque() for name in TRAFFIC_CLASSES}
+        self._pass = {name: 0.0 for name in TRAFFIC_CLASSES}
+        self._metrics = {name: ClassMetrics() for name in TRAFFIC_CLASSES}
+        self._running_shared = 0  # non-interactive jobs in flight
+        self._condition = threading.Condition()
+        self._shutdown = False
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"pesapal-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ----------------------------------------
+    # Submitting work
+    # ----------------------------------------
+
+    def submit(self, traffic_class, func, *args, **kwargs):
+        """
+        Queue a call
+
+        Args:
+            traffic_class (str): INTERACTIVE, WEBHOOK or BATCH
+            func (callable): The upstream call
+
+        Returns:
+            Future: Resolves to func's return value
+        """
+        if traffic_class not in self._queues:
+            raise ValueError(f"Unknown traffic class: {traffic_class}")
+        job = _Job(func, args, kwargs)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            queue = self._queues[traffic_class]
+            if not queue:
+                # A class waking from idle must not cash in the time it
+                # spent idle - start it level with the queued classes
+                busy = [self._pass[name] for name in TRAFFIC_CLASSES if self._queues[name]]
+                if busy:
+                    self._pass[traffic_class] = max(self._pass[traffic_class], min(busy))
+            queue.append(job)
+            self._metrics[traffic_class].submitted += 1
+            self._condition.notify()
+        return job.future
+
+    def call(self, traffic_class, func, *args, **kwargs):
+        """Queue a call and wait for its result"""
+        return self.submit(traffic_class, func, *args, **kwargs).result()
+
+    def bind(self, client, traffic_class):
+        """
+        Wrap a client so every method call goes through the scheduler
+
+        Args:
+            client: e.g. PesapalService or MerchantClient
+            traffic_class (str): Class for all calls through this wrapper
+        """
+        return _ScheduledClient(self, client, traffic_class)
+
+    # ----------------------------------------
+    # Dispatching
+    # ----------------------------------------
+
+    def _eligible(self, name):
+        """Can a job of this class start right now?"""
+        if name != INTERACTIVE:
+            if self._running_shared >= self.workers - self.reserved_workers:
+                return False
+        if self.rate_limiter is not None:
+            keep = 0 if name == INTERACTIVE else self.reserved_tokens
+            return self.rate_limiter.try_acquire(1, keep=keep)
+        return True
+
+    def _next_job(self):
+        """Pick the eligible class with the lowest virtual time (caller holds the lock)"""
+        candidates = sorted(
+            (self._pass[name], index, name)
+            for index, name in enumerate(TRAFFIC_CLASSES)
+            if self._queues[name]
+        )
+        for _, _, name in candidates:
+            if self._eligible(name):
+                self._pass[name] += 1.0 / self.weights[name]
+                return name, self._queues[name].popleft()
+        return None, None
+
+    def _wait_time(self):
+        """
+        How long to sleep before re-checking queues (caller holds the lock)
+
+        None means wait to be notified: a finishing job or a new
+        submission wakes the workers, so there is nothing to poll for.
+        """
+        if not self._queues[INTERACTIVE] and \
+                self._running_shared >= self.workers - self.reserved_workers:
+            # Only shared classes queued and every shared worker busy:
+            # tokens don't matter until one of those jobs finishes
+            return None
+        if self.rate_limiter is None:
+            return None
+        # Shared classes can't start until the reserved tokens are back too
+        keep = 0 if self._queues[INTERACTIVE] else self.reserved_tokens
+        return max(0.001, self.rate_limiter.time_until(1, keep=keep))
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._shutdown and not any(self._queues.values()):
+                        return
+                    name, job = self._next_job()
+                    if job is not None:
+                        break
+                    self._condition.wait(
+                        self._wait_time() if any(self._queues.values()) else None
+                    )
+
+                metrics = self._metrics[name]
+                metrics.queue_times.append(time.perf_counter() - job.enqueued)
+                metrics.in_flight += 1
+                if name != INTERACTIVE:
+                    self._running_shared += 1
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.func(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._condition:
+                    metrics.in_flight -= 1
+                    if job.future.cancelled() or job.future.exception() is not None:
+                        metrics.failed += 1
+                    else:
+                        metrics.completed += 1
+                    if name != INTERACTIVE:
+                        self._running_shared -= 1
+                    self._condition.notify_all()
+
+    # ----------------------------------------
+    # Metrics and lifecycle
+    # ----------------------------------------
+
+    def metrics(self):
+        """
+        Per-class counters and queue-time percentiles
+
+        Returns:
+            dict: traffic class -> stats dict
+        """
+        with self._condition:
+            return {
+                name: self._metrics[name].snapshot(len(self._queues[name]))
+                for name in TRAFFIC_CLASSES
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; queued jobs still run"""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class _ScheduledClient:
+    """Proxy returned by PriorityScheduler.bind()"""
+
+    def __init__(self, scheduler, client, traffic_class):
+        self._scheduler = scheduler
+        self._client = client
+        self._traffic_class = traffic_class
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def scheduled(*args, **kwargs):
+            return self._scheduler.call(self._traffic_class, attr, *args, **kwargs)
+
+        scheduled.__name__ = name
+        return scheduled
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _fake_upstream_call(seconds=0.005):
+    """Stands in for one Pesapal round trip"""
+    time.sleep(seconds)
+    return {'status': '200'}
+
+
+def _checkout_latency_during_batch(scheduler, batch_jobs=800, checkouts=40):
+    """Flood the scheduler with batch work, then time checkouts"""
+    batch = [scheduler.submit(BATCH, _fake_upstream_call) for _ in range(batch_jobs)]
+
+    latencies = []
+    for _ in range(checkouts):
+        start = time.perf_counter()
+        scheduler.call(INTERACTIVE, _fake_upstream_call)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    for future in batch:
+        future.result()
+    latencies.sort()
+    return latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+def test_checkout_protected_from_batch():
+    """A reconciliation flood doesn't push checkout past its SLO"""
+    print("\n📝 Test 1: Checkout latency during a batch flood")
+
+    scheduler = PriorityScheduler(workers=4, reserved_workers=1)
+    p99 = _checkout_latency_during_batch(scheduler)
+    metrics = scheduler.metrics()
+    scheduler.shutdown()
+
+    # FIFO would put each checkout behind hundreds of 5 ms batch calls
+    print(f"   Checkout p99: {p99:.1f} ms, "
+          f"batch queue p99: {metrics[BATCH]['queue_p99_ms']:.0f} ms")
+
+    if p99 < 50 and metrics[BATCH]['completed'] == 800:
+        print("✅ Test 1 passed!")
+    else:
+        print("❌ Test 1 failed!")
+
+
+def test_weighted_share():
+    """With all queues full, throughput follows the weights"""
+    print("\n📝 Test 2: Weighted fair share")
+
+    order = []
+    lock = threading.Lock()
+    gate = threading.Event()
+
+    def record(name):
+        gate.wait()
+        with lock:
+            order.append(name)
+
+    scheduler = PriorityScheduler(workers=2, reserved_workers=1)
+    # Park both workers so the queues fill up before anything is picked
+    blockers = [scheduler.submit(INTERACTIVE, gate.wait) for _ in range(2)]
+    time.sleep(0.05)
+    for _ in range(100):
+        for name in TRAFFIC_CLASSES:
+            scheduler.submit(name, record, name)
+    gate.set()
+    for blocker in blockers:
+        blocker.result()
+    time.sleep(0.05)
+    scheduler.shutdown()
+
+    first = order[:60]
+    counts = {name: first.count(name) for name in TRAFFIC_CLASSES}
+    print(f"   First 60 jobs: {counts}")
+
+    if counts[INTERACTIVE] > counts[WEBHOOK] > counts[BATCH] > 0:
+        print("✅ Test 2 passed!")
+    else:
+        print("❌ Test 2 failed!")
+
+
+def test_reserved_rate_budget():
+    """Batch jobs can't spend the tokens reserved for checkout"""
+    from merchant_registry import TokenBucket
+
+    print("\n📝 Test 3: Reserved rate budget")
+
+    bucket = TokenBucket(rate=50, capacity=10)
+    scheduler = PriorityScheduler(workers=4, reserved_workers=1,
+                                  rate_limiter=bucket, reserved_tokens=5)
+    for _ in range(50):
+        scheduler.submit(BATCH, _fake_upstream_call, 0)
+    time.sleep(0.02)
+
+    start = time.perf_counter()
+    scheduler.call(INTERACTIVE, _fake_upstream_call, 0)
+    waited_ms = (time.perf_counter() - start) * 1000
+    scheduler.shutdown()
+
+    if waited_ms < 20:
+        print(f"✅ Test 3 passed! Checkout waited {waited_ms:.1f} ms")
+    else:
+        print(f"❌ Test 3 failed! Checkout waited {waited_ms:.1f} ms")
+
+
+def test_no_spin_below_reserve():
+    """Batch-only queues sleep until the reserve has refilled, not 1 ms at a time"""
+    from merchant_registry import TokenBucket
+
+    print("\n📝 Test 4: No busy-wait while tokens sit in the reserve")
+
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.tokens = 0
+    attempts = []
+    try_acquire = bucket.try_acquire
+
+    def counting_try_acquire(amount=1, keep=0):
+        attempts.append(keep)
+        return try_acquire(amount, keep)
+
+    bucket.try_acquire = counting_try_acquire
+    scheduler = PriorityScheduler(workers=2, reserved_workers=1,
+                                  rate_limiter=bucket, reserved_tokens=5)
+    scheduler.submit(BATCH, _fake_upstream_call, 0)
+    time.sleep(0.4)  # 4 tokens refill: never enough for batch (needs 1 + 5)
+    scheduler.shutdown(wait=False)
+
+    if len(attempts) < 10:
+        print(f"✅ Test 4 passed! {len(attempts)} dispatch attempts in 400 ms")
+    else:
+        print(f"❌ Test 4 failed! {len(attempts)} dispatch attempts in 400 ms")
+
+
+def test_no_spin_at_worker_cap():
+    """Queued batch jobs wait for a shared worker to finish, not 1 ms at a time"""
+    from merchant_registry import TokenBucket
+
+    print("\n📝 Test 5: No busy-wait while the shared workers are all busy")
+
+    scheduler = PriorityScheduler(workers=3, reserved_workers=1,
+                                  rate_limiter=TokenBucket(rate=1000, capacity=100))
+    checks = []
+    next_job = scheduler._next_job
+
+    def counting_next_job():
+        checks.append(None)
+        return next_job()
+
+    scheduler._next_job = counting_next_job
+    for _ in range(4):
+        scheduler.submit(BATCH, time.sleep, 0.4)   # 2 run, 2 wait (tokens plentiful)
+    time.sleep(0.3)
+    during = len(checks)
+    scheduler.shutdown()
+
+    if during < 20:
+        print(f"✅ Test 5 passed! {during} dispatch checks in 300 ms")
+    else:
+        print(f"❌ Test 5 failed! {during} dispatch checks in 300 ms")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING REQUEST SCHEDULER")
+    print("=" * 60)
+
+    test_checkout_protected_from_batch()
+    test_weighted_share()
+    test_reserved_rate_budget()
+    test_no_spin_below_reserve()
+    test_no_spin_at_worker_cap()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Streaming Settlement Reconciliation
+===================================
+
+Matches a Pesapal settlement statement (CSV, millions of lines) against
+the `payments` table without one query per line.
+
+How it works (sort-merge join, constant memory):
+1. The settlement CSV is read in chunks, each chunk sorted by
+   merchant_reference and spilled to a temporary file
+2. The chunks are merged back with heapq.merge (one line per chunk in memory)
+3. `payments` is read ORDER BY merchant_reference, which walks the
+   UNIQUE index on that column instead of sorting
+4. Both sorted streams are merged in one pass
+
+Mismatch reports (one CSV per category in the output directory):
+    missing_in_payments.csv    settled, but no payment with that reference
+    missing_in_settlement.csv  Completed payment that was never settled
+    amount_mismatch.csv        amount or currency differ
+    status_mismatch.csv        settled, but the payment is not Completed
+    reference_mismatch.csv     order_tracking_id or confirmation_code differ
+    duplicate_settlement.csv   a second settlement line for the same payment
+
+USAGE:
+    python settlement_reconciliation.py statement.csv --db payments.db --out reports/
+    python settlement_reconciliation.py --benchmark --rows 10000000
+"""
+
+import csv
+import heapq
+import os
+import sqlite3
+import tempfile
+import time
+
+from payment_record import to_minor_units
+
+
+# Settlement CSV header names this job reads
+SETTLEMENT_COLUMNS = (
+    'merchant_reference',
+    'order_tracking_id',
+    'amount',
+    'currency',
+    'confirmation_code',
+    'status',
+)
+
+MISMATCH_CATEGORIES = (
+    'missing_in_payments',
+    'missing_in_settlement',
+    'amount_mismatch',
+    'status_mismatch',
+    'reference_mismatch',
+    'duplicate_settlement',
+)
+
+REPORT_COLUMNS = (
+    'category',
+    'merchant_reference',
+    'field',
+    'settlement_value',
+    'payment_value',
+)
+
+CHUNK_ROWS = 200_000
+
+
+# ----------------------------------------
+# Sorted streams
+# ----------------------------------------
+
+def _read_settlement(csv_path):
+    """Yield settlement rows as tuples in SETTLEMENT_COLUMNS order"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        positions = [header.index(name) if name in header else None
+                     for name in SETTLEMENT_COLUMNS]
+        for row in reader:
+            if row:
+                yield tuple(row[i] if i is not None else '' for i in positions)
+
+
+def _spill(rows, tmp_dir):
+    """Sort one chunk and write it to a temporary CSV"""
+    rows.sort()
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=tmp_dir)
+    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+def _read_chunk(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            yield tuple(row)
+
+
+def sorted_settlement(csv_path, tmp_dir, chunk_rows=CHUNK_ROWS, presorted=False):
+    """
+    Stream settlement rows sorted by merchant_reference (external sort)
+
+    Args:
+        csv_path (str): Settlement statement
+        tmp_dir (str): Where sorted chunks are spilled
+        chunk_rows (int): Rows held in memory at once
+        presorted (bool): Skip sorting if the file is already ordered
+
+    Yields:
+        tuple: Settlement row in SETTLEMENT_COLUMNS order
+    """
+    if presorted:
+        yield from _read_settlement(csv_path)
+        return
+
+    chunk_paths = []
+    chunk = []
+    for row in _read_settlement(csv_path):
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            chunk_paths.append(_spill(chunk, tmp_dir))
+            chunk = []
+    if chunk:
+        chunk_paths.append(_spill(chunk, tmp_dir))
+    del chunk
+
+    yield from heapq.merge(*(_read_chunk(path) for path in chunk_paths))
+
+
+def sorted_payments(db_path, batch_size=10_000):
+    """
+    Stream payments ordered by merchant_reference
+
+    Yields:
+        tuple: (merchant_reference, order_tracking_id, amount, currency,
+                confirmation_code, status)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute('''
+            SELECT merchant_reference, order_tracking_id, amount, currency,
+                   confirmation_code, status
+            FROM payments
+            ORDER BY merchant_reference
+        ''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+# ----------------------------------------
+# Reconciliation
+# ----------------------------------------
+
+class _Reports:
+    """One streaming CSV writer per mismatch category"""
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self.counts = dict.fromkeys(MISMATCH_CATEGORIES, 0)
+        self._files = {}
+        self._writers = {}
+        for category in MISMATCH_CATEGORIES:
+            f = open(os.path.join(output_dir, f'{category}.csv'), 'w',
+                     newline='', encoding='utf-8')
+            self._files[category] = f
+            self._writers[category] = csv.writer(f)
+            self._writers[category].writerow(REPORT_COLUMNS)
+
+    def add(self, category, reference, field='', settlement_value='', payment_value=''):
+        self.counts[category] += 1
+        self._writers[category].writerow(
+            (category, reference, field, settlement_value, payment_value)
+        )
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+def _compare(settled, payment, reports):
+    reference, tracking_id, amount, currency, code, status = settled
+    _, db_tracking_id, db_amount, db_currency, db_code, db_status = payment
+
+    if to_minor_units(amount) != to_minor_units(db_amount):
+        reports.add('amount_mismatch', reference, 'amount', amount, db_amount)
+    if currency and currency != db_currency:
+        reports.add('amount_mismatch', reference, 'currency', currency, db_currency)
+
+    expected_status = status or 'Completed'
+    if (db_status or '').lower() != expected_status.lower():
+        reports.add('status_mismatch', reference, 'status', expected_status, db_status)
+
+    if tracking_id and tracking_id != db_tracking_id:
+        reports.add('reference_mismatch', reference, 'order_tracking_id',
+                    tracking_id, db_tracking_id)
+    if code and code != db_code:
+        reports.add('reference_mismatch', reference, 'confirmation_code', code, db_code)
+
+
+def reconcile(csv_path, db_path, output_dir, chunk_rows=CHUNK_ROWS, presorted=False):
+    """
+    Reconcile a settlement statement against the payments table
+
+    Args:
+        csv_path (str): Settlement CSV
+        db_path (str): SQLite database with the payments table
+        output_dir (str): Directory for the mismatch report CSVs
+        chunk_rows (int): External sort chunk size (bounds memory)
+        presorted (bool): Settlement CSV is already sorted by merchant_reference
+
+    Returns:
+        dict: settlement_rows, payment_rows, matched, per-category counts,
+              duration_s, rows_per_sec
+    """
+    start = time.perf_counter()
+    reports = _Reports(output_dir)
+    settlement_rows = payment_rows = matched = 0
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        settled_rows = sorted_settlement(csv_path, tmp_dir, chunk_rows, presorted)
+        payments = sorted_payments(db_path)
+        settled = next(settled_rows, None)
+        payment = next(payments, None)
+        payment_settled = False     # current payment already matched a line
+
+        try:
+            while settled is not None or payment is not None:
+                if payment is None or (settled is not None and settled[0] < payment[0]):
+                    settlement_rows += 1
+                    reports.add('missing_in_payments', settled[0], 'amount', settled[2], '')
+                    settled = next(settled_rows, None)
+                elif settled is None or payment[0] < settled[0]:
+                    payment_rows += 1
+                    if not payment_settled and payment[5] == 'Completed':
+                        reports.add('missing_in_settlement', payment[0], 'amount', '', payment[2])
+                    payment = next(payments, None)
+                    payment_settled = False
+                else:
+                    # Only the settlement side advances: further lines for
+                    # the same reference are duplicates, not unknown payments
+                    settlement_rows += 1
+                    if payment_settled:
+                        reports.add('duplicate_settlement', settled[0], 'amount',
+                                    settled[2], payment[2])
+                    else:
+                        matched += 1
+                        _compare(settled, payment, reports)
+                        payment_settled = True
+                    settled = next(settled_rows, None)
+        finally:
+            settled_rows.close()
+            payments.close()
+            reports.close()
+
+    duration = time.perf_counter() - start
+    summary = {
+        'settlement_rows': settlement_rows,
+        'payment_rows': payment_rows,
+        'matched': matched,
+        'duration_s': duration,
+        'rows_per_sec': (settlement_rows + payment_rows) / duration if duration else 0,
+    }
+    summary.update(reports.counts)
+    return summary
+
+
+def print_summary(summary):
+    print("\n📊 RECONCILIATION SUMMARY")
+    print(f"   Settlement rows: {summary['settlement_rows']:,}")
+    print(f"   Payment rows:    {summary['payment_rows']:,}")
+    print(f"   Matched:         {summary['matched']:,}")
+    for category in MISMATCH_CATEGORIES:
+        print(f"   {category:<24} {summary[category]:,}")
+    print(f"   Took {summary['duration_s']:.1f}s ({summary['rows_per_sec']:,.0f} rows/sec)")
+
+
+# ----------------------------------------
+# Synthetic data
+# ----------------------------------------
+
+def generate_synthetic(db_path, csv_path, rows, seed=7):
+    """
+    Build a payments table and a shuffled settlement CSV with known mismatches
+
+    Every 1000th reference gets one planted mismatch, cycling through
+    the five categories.
+
+    Returns:
+        dict: Expected count per mismatch category
+    """
+    import random
+    from payment_record import PAYMENTS_TABLE_SQL
+
+    rng = random.Random(seed)
+    expected = dict.fromkeys(MISMATCH_CATEGORIES, 0)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(PAYMENTS_TABLE_SQL)
+
+    # Settlement lines are written in random order; only the ordering
+    # keys are shuffled in memory, a few bytes each
+    order = list(range(rows))
+    rng.shuffle(order)
+
+    def payment_rows():
+        for i in range(rows):
+            planted = MISMATCH_CATEGORIES[(i // 1000) % 5] if i % 1000 == 0 else None
+            if planted == 'missing_in_payments':
+                continue
+            status = 'PENDING' if planted == 'status_mismatch' else 'Completed'
+            yield (f"TOUR-{i:09d}", f"TRACK-{i:09d}", 1500.0 + i % 7, 'KES',
+                   status, f"CODE{i:09d}")
+
+    conn.executemany('''
+        INSERT INTO payments (merchant_reference, order_tracking_id, amount,
+                              currency, status, confirmation_code)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', payment_rows())
+    conn.commit()
+    conn.close()
+
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(SETTLEMENT_COLUMNS)
+        for i in order:
+            planted = MISMATCH_CATEGORIES[(i // 1000) % 5] if i % 1000 == 0 else None
+            if planted:
+                expected[planted] += 1
+            if planted == 'missing_in_settlement':
+                continue
+            amount = 1500.0 + i % 7 + (1 if planted == 'amount_mismatch' else 0)
+            code = 'WRONG' if planted == 'reference_mismatch' else f"CODE{i:09d}"
+            writer.writerow((f"TOUR-{i:09d}", f"TRACK-{i:09d}", f"{amount:.2f}",
+                             'KES', code, ''))
+    return expected
+
+
+def benchmark(rows=10_000_000, chunk_rows=CHUNK_ROWS):
+    """Reconcile a synthetic statement and print rows/sec"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        csv_path = os.path.join(tmp, 'settlement.csv')
+
+        print(f"🏗️  Generating {rows:,} synthetic payments and settlement lines...")
+        start = time.perf_counter()
+        generate_synthetic(db_path, csv_path, rows)
+        print(f"   Generated in {time.perf_counter() - start:.1f}s")
+
+        summary = reconcile(csv_path, db_path, os.path.join(tmp, 'reports'), chunk_rows)
+        print_summary(summary)
+        return summary
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def test_planted_mismatches(rows=50_000):
+    """Every planted mismatch is found in the right category"""
+    print(f"\n📝 Test 1: Planted mismatches in {rows:,} rows")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        csv_path = os.path.join(tmp, 'settlement.csv')
+        expected = generate_synthetic(db_path, csv_path, rows)
+        summary = reconcile(csv_path, db_path, os.path.join(tmp, 'reports'),
+                            chunk_rows=7_000)
+        with open(os.path.join(tmp, 'reports', 'amount_mismatch.csv')) as f:
+            amount_report = list(csv.reader(f))
+
+    found = {category: summary[category] for category in MISMATCH_CATEGORIES}
+    print(f"   {summary['rows_per_sec']:,.0f} rows/sec")
+
+    if found == expected and len(amount_report) == expected['amount_mismatch'] + 1:
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Expected {expected}, found {found}")
+
+
+def test_constant_memory():
+    """Peak memory stays flat when the input grows 4x"""
+    import tracemalloc
+
+    print("\n📝 Test 2: Memory with 20k vs 80k rows (chunk_rows=5,000)")
+
+    peaks = []
+    for rows in (20_000, 80_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'payments.db')
+            csv_path = os.path.join(tmp, 'settlement.csv')
+            generate_synthetic(db_path, csv_path, rows)
+
+            tracemalloc.start()
+            reconcile(csv_path, db_path, os.path.join(tmp, 'reports'), chunk_rows=5_000)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    print(f"   Peak: {peaks[0] / 1024:,.0f} KB -> {peaks[1] / 1024:,.0f} KB")
+    if peaks[1] < peaks[0] * 1.5:
+        print("✅ Test 2 passed!")
+    else:
+        print("❌ Test 2 failed!")
+
+
+def test_duplicates_and_combined_mismatches():
+    """Repeated settlement lines and several differences on one line"""
+    from payment_record import PAYMENTS_TABLE_SQL
+
+    print("\n📝 Test 3: Duplicate settlement lines, amount and currency both wrong")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'payments.db')
+        csv_path = os.path.join(tmp, 'settlement.csv')
+        conn = sqlite3.connect(db_path)
+        conn.execute(PAYMENTS_TABLE_SQL)
+        conn.executemany(
+            "INSERT INTO payments (merchant_reference, order_tracking_id, amount, currency, "
+            "status, confirmation_code) VALUES (?, ?, ?, ?, 'Completed', ?)",
+            [('TOUR-1', 'TRACK-1', 100.0, 'KES', 'CODE1'),
+             ('TOUR-2', 'TRACK-2', 200.0, 'KES', 'CODE2'),
+             ('TOUR-3', 'TRACK-3', 300.0, 'KES', 'CODE3')],
+        )
+        conn.commit()
+        conn.close()
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(SETTLEMENT_COLUMNS)
+            writer.writerows([
+                ('TOUR-1', 'TRACK-1', '100.00', 'KES', 'CODE1', ''),
+                ('TOUR-1', 'TRACK-1', '100.00', 'KES', 'CODE1', ''),
+                ('TOUR-1', 'TRACK-1', '100.00', 'KES', 'CODE1', ''),
+                ('TOUR-2', 'TRACK-9', '250.00', 'USD', 'WRONG', ''),
+                ('TOUR-3', 'TRACK-3', '300.00', 'KES', 'CODE3', ''),
+            ])
+        summary = reconcile(csv_path, db_path, os.path.join(tmp, 'reports'))
+
+    expected = {
+        'missing_in_payments': 0,
+        'missing_in_settlement': 0,
+        'amount_mismatch': 2,
+        'status_mismatch': 0,
+        'reference_mismatch': 2,
+        'duplicate_settlement': 2,
+    }
+    found = {category: summary[category] for category in MISMATCH_CATEGORIES}
+
+    if found == expected and summary['matched'] == 3 and summary['settlement_rows'] == 5:
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! Expected {expected}, found {found}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reconcile a Pesapal settlement statement')
+    parser.add_argument('csv', nargs='?', help='Settlement CSV')
+    parser.add_argument('--db', default='payments.db', help='SQLite database')
+    parser.add_argument('--out', default='reconciliation', help='Report directory')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--presorted', action='store_true',
+                        help='CSV is already sorted by merchant_reference')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Reconcile a synthetic statement and report rows/sec')
+    parser.add_argument('--rows', type=int, default=10_000_000,
+                        help='Synthetic statement size for --benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.rows, args.chunk_rows)
+    elif args.csv:
+        print_summary(reconcile(args.csv, args.db, args.out, args.chunk_rows, args.presorted))
+    else:
+        print("=" * 60)
+        print("TESTING SETTLEMENT RECONCILIATION")
+        print("=" * 60)
+
+        test_planted_mismatches()
+        test_constant_memory()
+        test_duplicates_and_combined_mismatches()
+
+        print("\n" + "=" * 60)
+        print("ALL TESTS COMPLETED!")
+        print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+"""
+Soak Test: Memory Leaks and Latency Drift
+=========================================
+
+The IPN and order paths run for weeks inside long-lived workers. A leak
+of a few KB per request, or a query that gets slower as a table grows,
+won't show up in a 10-second load test. This module drives mixed
+traffic for hours against a local stub and checks that memory,
+descriptors and latency stay flat.
+
+Traffic (weights are configurable):
+- order:        create a payment + SubmitOrderRequest
+- ipn:          IPN over HTTP (keep-alive, with some reconnects) to an
+                IPNServer; the handler verifies with GetTransactionStatus
+                and updates the payment
+- status:       GetTransactionStatus + payment lookup
+- token_expiry: expire a merchant's token, forcing a RequestToken
+
+Everything runs in-process: Pesapal is replaced by StubPesapal (short
+token lifetimes, rejects expired tokens), and payments live in a
+SQLitePaymentStore in a temporary directory (or --db). Order IDs carry
+a per-run ID, so reruns against the same --db add to it instead of
+colliding with earlier runs' orders.
+
+At every interval the sampler records:
+- RSS, tracemalloc traced memory and the fastest-growing allocation sites
+- open file descriptors, sockets and threads
+- p50/p99 latency and errors per operation
+
+The report flags:
+- monotonic growth: quarter-by-quarter medians (after warm-up) never go
+  down, and the total rise exceeds the metric's threshold
+- latency drift: last-quarter p99 > first-quarter p99 * (1 + max_drift)
+  + slack
+
+USAGE:
+    python soak_test.py run --hours 4 --report soak.json
+    python soak_test.py run --minutes 10 --rate 200 --interval 10
+    python soak_test.py run --hours 8 --max-growth rss_mb=64 --max-drift 1.0
+    python soak_test.py                            # run tests
+"""
+
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+
+from merchant_registry import MerchantRegistry, TokenBucket
+
+
+# Growth (after warm-up) that counts as a leak, per metric
+GROWTH_THRESHOLDS = {
+    'rss_mb': 32.0,
+    'traced_mb': 8.0,
+    'fds': 8,
+    'sockets': 8,
+    'threads': 4,
+}
+MAX_LATENCY_DRIFT = 0.5        # last-quarter p99 may be 50% above the first ...
+LATENCY_SLACK_MS = 2.0         # ... plus this much, since small numbers are noisy
+
+OPERATION_MIX = {'order': 0.25, 'ipn': 0.45, 'status': 0.28, 'token_expiry': 0.02}
+MERCHANTS = 20
+RECENT_ORDERS = 10_000         # orders IPNs/status checks pick from (bounded)
+TOP_ALLOCATIONS = 5
+ALLOCATION_SNAPSHOTS = 8       # per run: a snapshot pauses the process ...
+SNAPSHOT_SPACING = 3           # ... so at most every 3rd sample (latency) is affected
+
+
+# ============================================
+# LOCAL STUB
+# ============================================
+
+class _StubResponse:
+    __slots__ = ('status_code', 'payload')
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}: {self.payload.get('message')}")
+
+    def json(self):
+        return self.payload
+
+
+class StubPesapal:
+    """
+    Requests-style transport answering like the Pesapal API
+
+    Tokens carry their expiry, so no per-token state accumulates here;
+    a request with a missing or expired token gets a 401.
+    """
+
+    def __init__(self, latency=0.002, token_ttl=60):
+        """
+        Args:
+            latency (float): Seconds each call takes
+            token_ttl (int): Token lifetime in seconds (must exceed the
+                             clients' 30 s refresh buffer)
+        """
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.tokens_issued = 0
+        self.rejected = 0
+
+    def request(self, method, url, params=None, json=None, headers=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if url.endswith('/api/Auth/RequestToken'):
+            self.tokens_issued += 1
+            expiry = int(time.time()) + self.token_ttl
+            return _StubResponse(200, {
+                'token': f"stub.{expiry}",
+                'expiryDate': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(expiry)),
+                'status': '200',
+            })
+
+        token = (headers or {}).get('Authorization', '').rpartition('.')[2]
+        if not token.isdigit() or int(token) <= time.time():
+            self.rejected += 1
+            return _StubResponse(401, {'status': '401', 'message': 'Invalid or expired token'})
+        if url.endswith('/api/Transactions/SubmitOrderRequest'):
+            return _StubResponse(200, {
+                'order_tracking_id': json['id'],
+                'merchant_reference': json['id'],
+                'redirect_url': f"https://pay.example/{json['id']}",
+                'status': '200',
+            })
+        if url.endswith('/api/Transactions/GetTransactionStatus'):
+            return _StubResponse(200, {
+                'payment_status_description': 'Completed',
+                'payment_method': 'M-Pesa',
+                'confirmation_code': f"SOAK{params['orderTrackingId'][-6:]}",
+                'status': '200',
+            })
+        return _StubResponse(200, {'ipn_id': 'IPN-SOAK', 'status': '200'})
+
+
+class SoakIPNHandler:
+    """
+    IPN handler doing the real work of one: look up the payment, verify
+    the status with Pesapal, update the database
+    """
+
+    def __init__(self, store, registry):
+        self.store = store
+        self.registry = registry
+
+    def handle_ipn(self, request):
+        data = json.loads(request.body) if request.method == 'POST' else request.GET
+        tracking_id = data.get('OrderTrackingId')
+        merchant_ref = data.get('OrderMerchantReference') or ''
+        response = {
+            'orderNotificationType': data.get('OrderNotificationType'),
+            'orderTrackingId': tracking_id,
+            'orderMerchantReference': merchant_ref,
+            'status': 200,
+        }
+        payment = self.store.get_payment_by_tracking_id(tracking_id) if tracking_id else None
+        if payment is None:
+            response['status'] = 500
+            return response, 500
+
+        merchant_id = merchant_ref.rsplit('-', 1)[0]
+        status = self.registry.client(merchant_id).get_transaction_status(tracking_id)
+        self.store.update_payment(tracking_id, status['payment_status_description'],
+                                  status.get('payment_method'), status.get('confirmation_code'))
+        return response, 200
+
+
+# ============================================
+# SAMPLING
+# ============================================
+
+def process_stats():
+    """
+    Resource usage of this process
+
+    Returns:
+        dict: rss_mb, fds, sockets, threads (None where the platform
+              doesn't expose a value)
+    """
+    stats = {'rss_mb': None, 'fds': None, 'sockets': None,
+             'threads': threading.active_count()}
+    try:
+        with open('/proc/self/statm') as f:
+            stats['rss_mb'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        import resource
+        # Peak, not current, RSS - but it still shows steady growth
+        # (ru_maxrss is KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats['rss_mb'] = peak / 2**20 if peak > 2**24 else peak / 1024
+        return stats
+
+    sockets = 0
+    for fd in fds:
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{fd}").startswith('socket:')
+        except OSError:
+            pass                     # closed since listdir()
+    stats['fds'] = len(fds)
+    stats['sockets'] = sockets
+    return stats
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def top_allocations(snapshot, baseline, limit=TOP_ALLOCATIONS):
+    """
+    Allocation sites that grew the most since the baseline snapshot
+
+    Returns:
+        list: {'site', 'size_kb', 'count'} dicts, largest growth first
+    """
+    # The harness itself (bounded order ring, latency lists) isn't of interest
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+              tracemalloc.Filter(False, __file__)]
+    stats = snapshot.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), 'lineno')
+    return [{'site': str(stat.traceback[0]),
+             'size_kb': round(stat.size_diff / 1024, 1),
+             'count': stat.count_diff}
+            for stat in stats[:limit] if stat.size_diff > 0]
+
+
+# ============================================
+# ANALYSIS
+# ============================================
+
+def _quarter_medians(values):
+    """Median of each quarter of a series (None if it is too short)"""
+    values = [value for value in values if value is not None]
+    if len(values) < 8:
+        return None
+    size = len(values) // 4
+    return [statistics.median(values[i * size:(i + 1) * size if i < 3 else len(values)])
+            for i in range(4)]
+
+
+def analyze(samples, thresholds=None, max_drift=MAX_LATENCY_DRIFT,
+            slack_ms=LATENCY_SLACK_MS, warmup=0.2):
+    """
+    Look for monotonic growth and latency drift
+
+    Args:
+        samples (list): Sample dicts from SoakTest.run()
+        thresholds (dict): Growth allowed per metric (default GROWTH_THRESHOLDS)
+        max_drift (float): Allowed relative p99 increase
+        slack_ms (float): Allowed absolute p99 increase on top of that
+        warmup (float): Fraction of samples ignored at the start (caches,
+                        pools and JIT-like warm-up legitimately grow)
+
+    Returns:
+        list: Findings, e.g. {'kind': 'growth', 'metric': 'rss_mb', ...}
+    """
+    thresholds = {**GROWTH_THRESHOLDS, **(thresholds or {})}
+    steady = samples[int(len(samples) * warmup):]
+    findings = []
+
+    for metric, limit in thresholds.items():
+        medians = _quarter_medians([sample.get(metric) for sample in steady])
+        if medians is None:
+            continue
+        growth = medians[-1] - medians[0]
+        monotonic = all(later >= earlier for earlier, later in zip(medians, medians[1:]))
+        if monotonic and growth > limit:
+            findings.append({'kind': 'growth', 'metric': metric,
+                             'start': round(medians[0], 2), 'end': round(medians[-1], 2),
+                             'growth': round(growth, 2), 'threshold': limit})
+
+    operations = sorted({name for sample in steady for name in sample.get('ops', {})})
+    for name in operations:
+        medians = _quarter_medians([sample['ops'][name]['p99_ms']
+                                    if sample.get('ops', {}).get(name, {}).get('count') else None
+                                    for sample in steady])
+        if medians is None:
+            continue
+        limit = medians[0] * (1 + max_drift) + slack_ms
+        if medians[-1] > limit:
+            findings.append({'kind': 'latency_drift', 'metric': f"{name}.p99_ms",
+                             'start': round(medians[0], 2), 'end': round(medians[-1], 2),
+                             'threshold': round(limit, 2)})
+    return findings
+
+
+# ============================================
+# SOAK TEST
+# ============================================
+
+class SoakTest:
+    """
+    Drives mixed traffic and samples the process at intervals
+    """
+
+    def __init__(self, duration, interval=60.0, rate=100, concurrency=8, mix=None,
+                 db_path=None, stub_latency=0.002, token_ttl=60, reconnect_rate=0.02,
+                 trace=True, handler_factory=SoakIPNHandler, seed=None, run_id=None):
+        """
+        Initialize soak test
+
+        Args:
+            duration (float): Seconds of traffic
+            interval (float): Seconds between samples
+            rate (float): Operations per second (all workers together)
+            concurrency (int): Worker threads
+            mix (dict): Operation -> weight (default OPERATION_MIX)
+            db_path (str): Payments database (default: a temporary file)
+            stub_latency (float): Seconds each stub Pesapal call takes
+            token_ttl (int): Stub token lifetime in seconds
+            reconnect_rate (float): Share of IPNs sent on a new connection
+            trace (bool): Track allocations with tracemalloc
+            handler_factory (callable): (store, registry) -> IPN handler
+            seed (int): Random seed, for repeatable traffic
+            run_id (str): Prefix for this run's order IDs (default: random),
+                          so several runs can share one database
+        """
+        self.duration = duration
+        self.interval = interval
+        self.rate = rate
+        self.concurrency = concurrency
+        self.mix = mix or OPERATION_MIX
+        self.db_path = db_path
+        self.reconnect_rate = reconnect_rate
+        self.trace = trace
+        self.seed = seed
+        self.run_id = run_id or os.urandom(4).hex()
+
+        self.stub = StubPesapal(stub_latency, token_ttl)
+        self.registry = MerchantRegistry(
+            lambda merchant_id: {'consumer_key': f"key-{merchant_id}",
+                                 'consumer_secret': f"secret-{merchant_id}"},
+            transport=self.stub)
+        self.merchants = [f"merchant{i:02d}" for i in range(MERCHANTS)]
+        self.handler_factory = handler_factory
+
+        self._lock = threading.Lock()
+        self._latencies = {name: [] for name in self.mix}
+        self._errors = {name: 0 for name in self.mix}
+        self._last_error = {}
+        self._orders = [None] * RECENT_ORDERS
+        self._order_count = 0
+        self._stop = threading.Event()
+
+    # ----------------------------------------
+    # Operations
+    # ----------------------------------------
+
+    def _random_order(self, rng):
+        known = min(self._order_count, RECENT_ORDERS)
+        if not known:
+            return None
+        return self._orders[rng.randrange(known)]
+
+    def _op_order(self, rng):
+        with self._lock:
+            number = self._order_count
+            self._order_count += 1
+        merchant_id = rng.choice(self.merchants)
+        tracking_id = f"SOAK-{self.run_id}-{number:09d}"
+        reference = f"{merchant_id}-{self.run_id}.{number}"     # merchant ID before the last '-'
+        self.store.create_payment(
+            merchant_reference=reference, order_tracking_id=tracking_id,
+            amount=float(rng.randrange(500, 50_000)), currency='KES',
+            customer_email=f"guest{number % 5000}@example.com", description='Soak test booking')
+        self.registry.client(merchant_id).submit_order({
+            'id': tracking_id, 'currency': 'KES', 'amount': 1500.0,
+            'description': 'Soak test booking', 'callback_url': 'https://example.com/cb',
+        })
+        self._orders[number % RECENT_ORDERS] = (tracking_id, reference)
+
+    def _op_ipn(self, rng):
+        order = self._random_order(rng)
+        if order is None:
+            return
+        if rng.random() < self.reconnect_rate:
+            conn = getattr(self.target._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+                self.target._local.conn = None
+        status = self.target.send(rng.choice(('GET', 'POST')), {
+            'OrderTrackingId': order[0],
+            'OrderMerchantReference': order[1],
+            'OrderNotificationType': 'IPNCHANGE',
+        })
+        if status != 200:
+            raise RuntimeError(f"IPN answered {status}")
+
+    def _op_status(self, rng):
+        order = self._random_order(rng)
+        if order is None:
+            return
+        merchant_id = order[1].rsplit('-', 1)[0]
+        self.registry.client(merchant_id).get_transaction_status(order[0])
+        self.store.get_payment_by_tracking_id(order[0])
+
+    def _op_token_expiry(self, rng):
+        context = self.registry.context(rng.choice(self.merchants))
+        context.token_expiry = 0.0
+        self.registry.token_for(context)
+
+    def _worker(self, seed):
+        rng = random.Random(seed)
+        names, weights = list(self.mix), list(self.mix.values())
+        while not self._stop.is_set():
+            if not self.rate_limiter.acquire(timeout=0.5):
+                continue
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                getattr(self, f"_op_{name}")(rng)
+                failed = False
+            except Exception as exc:
+                failed = True
+                error = f"{type(exc).__name__}: {exc}"
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._latencies[name].append(elapsed_ms)
+                if failed:
+                    self._errors[name] += 1
+                    self._last_error[name] = error
+
+    # ----------------------------------------
+    # Sampling
+    # ----------------------------------------
+
+    def _sample(self, started, baseline, snapshot):
+        with self._lock:
+            latencies, self._latencies = self._latencies, {name: [] for name in self.mix}
+            errors, self._errors = self._errors, {name: 0 for name in self.mix}
+
+        sample = {'t': round(time.monotonic() - started, 1), **process_stats(), 'ops': {}}
+        if self.trace:
+            sample['traced_mb'] = tracemalloc.get_traced_memory()[0] / 2**20
+            if snapshot and baseline is not None:
+                sample['top_allocations'] = top_allocations(tracemalloc.take_snapshot(), baseline)
+        for name, values in latencies.items():
+            values.sort()
+            sample['ops'][name] = {'count': len(values), 'errors': errors[name],
+                                   'p50_ms': round(_percentile(values, 50), 3),
+                                   'p99_ms': round(_percentile(values, 99), 3)}
+        return sample
+
+    def run(self, progress=True):
+        """
+        Run the soak test
+
+        Returns:
+            dict: config, samples, totals and the final top allocations
+        """
+        import asyncio
+        import tempfile
+
+        from ipn_replay import _HTTPTarget
+        from ipn_server import IPNServer, _new_event_loop
+        from storage_backends import SQLitePaymentStore
+
+        tmp = None
+        if self.db_path is None:
+            tmp = tempfile.TemporaryDirectory()
+            self.db_path = os.path.join(tmp.name, 'soak.db')
+        self.store = SQLitePaymentStore(self.db_path)
+        self.rate_limiter = TokenBucket(self.rate, capacity=max(1, min(self.rate, self.concurrency)))
+
+        loop = _new_event_loop()
+        server = IPNServer(self.handler_factory(self.store, self.registry))
+        loop.run_until_complete(server.start('127.0.0.1', 0))
+        server_thread = threading.Thread(target=loop.run_forever, name='soak-ipn-server',
+                                         daemon=True)
+        server_thread.start()
+        self.target = _HTTPTarget(f"http://127.0.0.1:{server.port}/ipn")
+
+        if self.trace:
+            tracemalloc.start()
+        started = time.monotonic()
+        total = max(1, round(self.duration / self.interval))
+        snapshot_every = max(SNAPSHOT_SPACING, total // ALLOCATION_SNAPSHOTS)
+        baseline = None
+        samples = []
+        seeds = [None if self.seed is None else self.seed * 1000 + i
+                 for i in range(self.concurrency)]
+        workers = [threading.Thread(target=self._worker, args=(seed,),
+                                    name=f"soak-worker-{i}", daemon=True)
+                   for i, seed in enumerate(seeds)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            # Workers keep running through the last sample, so it isn't
+            # skewed by threads and connections shutting down
+            for number in range(1, total + 1):
+                time.sleep(max(0.0, started + number * self.interval - time.monotonic()))
+                snapshot = number % snapshot_every == 0
+                sample = self._sample(started, baseline, snapshot)
+                samples.append(sample)
+                if progress:
+                    _print_sample(sample)
+                if self.trace and baseline is None and number >= total * 0.2:
+                    baseline = tracemalloc.take_snapshot()
+        except KeyboardInterrupt:
+            print("\n⏹️  Stopped early")
+        finally:
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+            final = top_allocations(tracemalloc.take_snapshot(), baseline) \
+                if self.trace and baseline is not None else []
+            if self.trace:
+                tracemalloc.stop()
+            asyncio.run_coroutine_threadsafe(server.drain(0.5), loop).result(10)
+            loop.call_soon_threadsafe(loop.stop)
+            server_thread.join(5)
+            loop.close()
+            self.store.close()
+            if tmp is not None:
+                tmp.cleanup()
+
+        totals = {name: {'count': sum(s['ops'][name]['count'] for s in samples),
+                         'errors': sum(s['ops'][name]['errors'] for s in samples)}
+                  for name in self.mix}
+        return {
+            'config': {'duration_s': self.duration, 'interval_s': self.interval,
+                       'rate': self.rate, 'concurrency': self.concurrency, 'mix': self.mix,
+                       'tracemalloc': self.trace, 'run_id': self.run_id},
+            'samples': samples,
+            'totals': totals,
+            'last_errors': dict(self._last_error),
+            'tokens_issued': self.stub.tokens_issued,
+            'tokens_rejected': self.stub.rejected,
+            'top_allocations': final,
+        }
+
+
+def _print_sample(sample):
+    ops = sum(op['count'] for op in sample['ops'].values())
+    errors = sum(op['errors'] for op in sample['ops'].values())
+    p99 = max((op['p99_ms'] for op in sample['ops'].values()), default=0.0)
+    traced = f", traced {sample['traced_mb']:.1f} MB" if 'traced_mb' in sample else ''
+    print(f"   t={sample['t']:>7.0f}s  rss {sample['rss_mb'] or 0:.1f} MB{traced}, "
+          f"fds {sample['fds']}, sockets {sample['sockets']}, threads {sample['threads']}, "
+          f"{ops:,} ops ({errors} errors), worst p99 {p99:.1f} ms")
+
+
+def print_report(report, findings):
+    """Print a soak test summary and its findings"""
+    samples = report['samples']
+    print("\n" + "=" * 60)
+    print("SOAK TEST REPORT")
+    print("=" * 60)
+    print(f"\n⏱️  {report['config']['duration_s']:,.0f}s, {len(samples)} samples, "
+          f"{report['tokens_issued']} tokens issued, "
+          f"{report['tokens_rejected']} requests with expired tokens")
+
+    print(f"\n{'Operation':<14}{'Count':>10}{'Errors':>8}{'p50 first':>11}{'p50 last':>10}"
+          f"{'p99 first':>11}{'p99 last':>10}")
+    for name, total in report['totals'].items():
+        ops = [s['ops'][name] for s in samples if s['ops'][name]['count']]
+        first, last = (ops[0], ops[-1]) if ops else ({'p50_ms': 0, 'p99_ms': 0},) * 2
+        print(f"{name:<14}{total['count']:>10,}{total['errors']:>8,}"
+              f"{first['p50_ms']:>11.2f}{last['p50_ms']:>10.2f}"
+              f"{first['p99_ms']:>11.2f}{last['p99_ms']:>10.2f}")
+    for name, error in report['last_errors'].items():
+        print(f"   last {name} error: {error}")
+
+    if samples:
+        print(f"\n{'Metric':<14}{'First':>10}{'Last':>10}")
+        for metric in ('rss_mb', 'traced_mb', 'fds', 'sockets', 'threads'):
+            if samples[0].get(metric) is not None:
+                print(f"{metric:<14}{samples[0][metric]:>10.1f}{samples[-1][metric]:>10.1f}")
+
+    if report['top_allocations']:
+        print("\n🔎 Fastest-growing allocation sites (since warm-up):")
+        for allocation in report['top_allocations']:
+            print(f"   {allocation['size_kb']:>10,.1f} KB  {allocation['count']:>+8,}  "
+                  f"{allocation['site']}")
+
+    print()
+    for finding in findings:
+        if finding['kind'] == 'growth':
+            print(f"❌ {finding['metric']} grew steadily: {finding['start']} -> "
+                  f"{finding['end']} (+{finding['growth']}, threshold {finding['threshold']})")
+        else:
+            print(f"❌ {finding['metric']} drifted: {finding['start']} -> {finding['end']} ms "
+                  f"(limit {finding['threshold']} ms)")
+    if not findings:
+        print("✅ No memory growth or latency drift")
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+def _series(values, **extra):
+    return [{'t': i, **{metric: value for metric, value in zip(values, row)}, **extra}
+            for i, row in enumerate(zip(*values.values()))]
+
+
+def test_analyze():
+    """Steady growth and latency drift are flagged; noise and warm-up are not"""
+    print("\n📝 Test 1: Growth and drift detection")
+
+    rng = random.Random(1)
+    flat = _series({'rss_mb': [80 + rng.uniform(-3, 3) for _ in range(40)],
+                    'fds': [12] * 40})
+    warming = _series({'rss_mb': [40 + min(i, 8) * 5 for i in range(40)]})
+    leaking = _series({'rss_mb': [80 + i * 1.5 for i in range(40)],
+                       'sockets': [2 + i // 2 for i in range(40)]})
+    ops = [{'ipn': {'count': 100, 'p99_ms': 5 + (i * 0.5 if i > 20 else 0)}}
+           for i in range(40)]
+    drifting = [dict(sample, ops=op) for sample, op in zip(flat, ops)]
+
+    quiet = analyze(flat) + analyze(warming)
+    leaks = {finding['metric'] for finding in analyze(leaking)}
+    drift = [finding['metric'] for finding in analyze(drifting)]
+    relaxed = analyze(leaking, thresholds={'rss_mb': 100, 'sockets': 50})
+
+    if not quiet and leaks == {'rss_mb', 'sockets'} and drift == ['ipn.p99_ms'] and not relaxed:
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! {quiet} {leaks} {drift} {relaxed}")
+
+
+class _LeakyHandler(SoakIPNHandler):
+    """Keeps every request it sees"""
+
+    def __init__(self, store, registry):
+        super().__init__(store, registry)
+        self.seen = []
+
+    def handle_ipn(self, request):
+        self.seen.append((request, bytearray(20_000)))
+        return super().handle_ipn(request)
+
+
+def test_short_soak(seconds=6.0):
+    """A short run is clean; the same run with a leaky handler is flagged"""
+    print(f"\n📝 Test 2: {seconds:.0f}s soak runs, clean and leaky")
+
+    # tracemalloc's overhead makes 0.25s p99s on a small box too noisy,
+    # so the clean run (which also checks latency) goes without it
+    clean = SoakTest(seconds, interval=0.25, rate=300, concurrency=4, token_ttl=35,
+                     trace=False, seed=1)
+    report = clean.run(progress=False)
+    findings = analyze(report['samples'], thresholds={'rss_mb': 16})
+    errors = sum(total['errors'] for total in report['totals'].values())
+    counts = {name: total['count'] for name, total in report['totals'].items()}
+
+    leaky = SoakTest(seconds, interval=0.25, rate=300, concurrency=4, seed=1,
+                     handler_factory=_LeakyHandler)
+    leaks = analyze(leaky.run(progress=False)['samples'], thresholds={'traced_mb': 4})
+
+    print(f"   clean: {counts}, {report['tokens_issued']} tokens, {errors} errors, "
+          f"findings {[f['metric'] for f in findings]}")
+    print(f"   leaky: findings {[f['metric'] for f in leaks]}")
+    if not findings and not errors and all(counts.values()) and report['tokens_issued'] > 1 \
+            and not report['tokens_rejected'] and any(f['metric'] == 'traced_mb' for f in leaks):
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! {findings} {report['last_errors']} {leaks}")
+
+
+def test_rerun_same_db(seconds=1.0):
+    """Two runs against one --db don't collide on order IDs"""
+    import sqlite3
+    import tempfile
+
+    print(f"\n📝 Test 3: Two {seconds:.0f}s runs sharing one database")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'soak.db')
+        reports = [SoakTest(seconds, interval=0.25, rate=200, concurrency=2, db_path=db_path,
+                            trace=False, seed=1).run(progress=False)
+                   for _ in range(2)]
+        conn = sqlite3.connect(db_path)
+        stored = conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+        conn.close()
+
+    orders = sum(report['totals']['order']['count'] for report in reports)
+    errors = [report['totals']['order']['errors'] for report in reports]
+    if errors == [0, 0] and stored == orders and reports[1]['totals']['order']['count']:
+        print(f"✅ Test 3 passed! ({stored} orders from two runs)")
+    else:
+        print(f"❌ Test 3 failed! errors={errors} stored={stored} orders={orders} "
+              f"{reports[1]['last_errors']}")
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Soak test the IPN/order paths')
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('run', help='Run a soak test')
+    run.add_argument('--hours', type=float, default=0)
+    run.add_argument('--minutes', type=float, default=0)
+    run.add_argument('--seconds', type=float, default=0)
+    run.add_argument('--interval', type=float, default=60, help='Seconds between samples')
+    run.add_argument('--rate', type=float, default=100, help='Operations per second')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--db', help='Payments database (default: temporary)')
+    run.add_argument('--stub-latency', type=float, default=0.002)
+    run.add_argument('--no-tracemalloc', action='store_true',
+                     help='Skip allocation tracking (it slows allocations down)')
+    run.add_argument('--max-growth', action='append', default=[], metavar='METRIC=VALUE',
+                     help=f"Override a growth threshold ({', '.join(GROWTH_THRESHOLDS)})")
+    run.add_argument('--max-drift', type=float, default=MAX_LATENCY_DRIFT)
+    run.add_argument('--drift-slack-ms', type=float, default=LATENCY_SLACK_MS)
+    run.add_argument('--report', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    if args.command != 'run':
+        print("=" * 60)
+        print("TESTING SOAK TEST")
+        print("=" * 60)
+
+        test_analyze()
+        test_short_soak()
+        test_rerun_same_db()
+
+        print("\n" + "=" * 60)
+        print("ALL TESTS COMPLETED!")
+        print("=" * 60)
+        return
+
+    thresholds = {}
+    for override in args.max_growth:
+        metric, _, value = override.partition('=')
+        if metric not in GROWTH_THRESHOLDS:
+            parser.error(f"unknown metric: {metric}")
+        thresholds[metric] = float(value)
+
+    duration = args.hours * 3600 + args.minutes * 60 + args.seconds or 3600
+    interval = min(args.interval, duration / 8)        # enough samples for quarters
+    soak = SoakTest(duration, interval, args.rate, args.concurrency, db_path=args.db,
+                    stub_latency=args.stub_latency, trace=not args.no_tracemalloc)
+    print(f"🧪 Soak test {soak.run_id}: {duration:,.0f}s at {args.rate:g} ops/s, "
+          f"sampling every {interval:g}s")
+    report = soak.run()
+    findings = analyze(report['samples'], thresholds, args.max_drift, args.drift_slack_ms)
+    print_report(report, findings)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({**report, 'findings': findings}, f, indent=2)
+        print(f"\n📝 Report written to {args.report}")
+    sys.exit(1 if findings else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Pluggable Payment Storage Backends
+==================================
+
+PaymentDatabase opens sqlite3 connections itself and keeps its SQL
+inline. This module puts the same interface in front of any DB-API
+database, so SQLite can be swapped for a PostgreSQL-style server with
+pooled connections when SQLite write locks become the bottleneck.
+
+Every backend implements the PaymentDatabase interface plus bulk
+primitives:
+
+    create_payment(**kwargs) -> id
+    update_payment(order_tracking_id, status, payment_method, confirmation_code) -> bool
+    get_payment_by_tracking_id(order_tracking_id) -> PaymentRecord | None
+    get_payment_by_merchant_reference(merchant_reference) -> PaymentRecord | None
+    get_all_payments() -> [PaymentRecord]
+    update_payments([(order_tracking_id, status, method, code), ...]) -> rows
+    upsert_payments([PaymentRecord, ...]) -> rows (keyed by merchant_reference)
+
+Backends:
+    SQLitePaymentStore(db_path)          SQLite through a small connection pool
+    SQLPaymentStore(pool, paramstyle)    any DB-API driver, e.g. psycopg
+    InMemoryPaymentRepository            in-memory stand-in (payment_repository.py)
+
+All three pass the same contract tests at the bottom of this file.
+
+USAGE:
+    store = SQLitePaymentStore('payments.db')
+    service = PesapalService(key, secret, database=store)
+
+    import psycopg
+    pool = ConnectionPool(lambda: psycopg.connect(DSN), max_size=20)
+    store = SQLPaymentStore(pool, paramstyle='format')
+    store.create_schema(POSTGRES_PAYMENTS_TABLE_SQL)
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from payment_record import PAYMENTS_TABLE_SQL, SELECT_PAYMENT_COLUMNS, PaymentRecord
+
+
+POSTGRES_PAYMENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id BIGSERIAL PRIMARY KEY,
+        merchant_reference TEXT UNIQUE NOT NULL,
+        order_tracking_id TEXT,
+        amount NUMERIC(12, 2) NOT NULL,
+        currency TEXT NOT NULL,
+        customer_name TEXT,
+        customer_email TEXT,
+        customer_phone TEXT,
+        description TEXT,
+        status TEXT DEFAULT 'PENDING',
+        payment_method TEXT,
+        confirmation_code TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Columns a caller can write (id and timestamps come from the database)
+WRITE_COLUMNS = (
+    'merchant_reference',
+    'order_tracking_id',
+    'amount',
+    'currency',
+    'customer_name',
+    'customer_email',
+    'customer_phone',
+    'description',
+    'status',
+    'payment_method',
+    'confirmation_code',
+)
+
+_INSERT_COLUMNS = ', '.join(WRITE_COLUMNS)
+_INSERT_VALUES = ', '.join('?' for _ in WRITE_COLUMNS)
+_UPSERT_SET = ', '.join(f"{name} = excluded.{name}"
+                        for name in WRITE_COLUMNS if name != 'merchant_reference')
+
+# Written once with '?' placeholders; StatementCache renders them
+# for the driver's paramstyle. SQLite (3.35+) and PostgreSQL both
+# understand RETURNING and ON CONFLICT ... DO UPDATE.
+STATEMENTS = {
+    'index_tracking_id': '''
+        CREATE INDEX IF NOT EXISTS idx_payments_tracking_id
+        ON payments (order_tracking_id)
+    ''',
+    'insert': f'''
+        INSERT INTO payments ({_INSERT_COLUMNS}, created_at, updated_at)
+        VALUES ({_INSERT_VALUES}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        RETURNING id
+    ''',
+    'upsert': f'''
+        INSERT INTO payments ({_INSERT_COLUMNS}, created_at, updated_at)
+        VALUES ({_INSERT_VALUES}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT (merchant_reference) DO UPDATE
+        SET {_UPSERT_SET}, updated_at = CURRENT_TIMESTAMP
+    ''',
+    'update_status': '''
+        UPDATE payments
+        SET status = ?, payment_method = ?, confirmation_code = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE order_tracking_id = ?
+    ''',
+    'select_by_tracking_id': f'''
+        SELECT {SELECT_PAYMENT_COLUMNS} FROM payments WHERE order_tracking_id = ?
+    ''',
+    'select_by_reference': f'''
+        SELECT {SELECT_PAYMENT_COLUMNS} FROM payments WHERE merchant_reference = ?
+    ''',
+    'select_all': f'''
+        SELECT {SELECT_PAYMENT_COLUMNS} FROM payments ORDER BY created_at, id
+    ''',
+}
+
+PLACEHOLDERS = {
+    'qmark': '?',        # sqlite3
+    'format': '%s',      # psycopg, pymysql
+    'pyformat': '%s',    # %s is valid pyformat too
+}
+
+
+class StatementCache:
+    """
+    Renders each named statement once for a driver's paramstyle
+
+    The driver's own prepared-statement cache (sqlite3's
+    cached_statements, psycopg's prepare_threshold) keys on the SQL
+    text, so handing it the identical string every time lets it reuse
+    the prepared plan.
+    """
+
+    def __init__(self, paramstyle='qmark', statements=STATEMENTS):
+        if paramstyle not in PLACEHOLDERS:
+            raise ValueError(f"Unsupported paramstyle: {paramstyle}")
+        self.placeholder = PLACEHOLDERS[paramstyle]
+        self.statements = statements
+        self._rendered = {}
+
+    def __getitem__(self, name):
+        sql = self._rendered.get(name)
+        if sql is None:
+            sql = self.statements[name].replace('?', self.placeholder)
+            self._rendered[name] = sql
+        return sql
+
+
+class ConnectionPool:
+    """
+    Thread-safe DB-API connection pool with health checks
+    """
+
+    def __init__(self, connect, max_size=10, health_check_sql='SELECT 1',
+                 check_after=30.0, acquire_timeout=10.0, clock=time.monotonic):
+        """
+        Initialize pool
+
+        Args:
+            connect (callable): Returns a new DB-API connection
+            max_size (int): Most connections open at once
+            health_check_sql (str): Query run on connections idle for check_after
+            check_after (float): Idle seconds before a connection is re-checked
+            acquire_timeout (float): Seconds to wait for a free connection
+            clock (callable): Monotonic time source for idle ages
+        """
+        self._connect = connect
+        self.max_size = max_size
+        self.health_check_sql = health_check_sql
+        self.check_after = check_after
+        self.acquire_timeout = acquire_timeout
+        self.clock = clock
+
+        self._idle = []                 # (connection, returned_at), LIFO
+        self._open = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.created = 0
+        self.health_failures = 0
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_sql)
+            cursor.fetchall()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        """
+        Take a connection (reusing an idle one when possible)
+
+        Returns:
+            A DB-API connection; give it back with release()
+
+        Raises:
+            TimeoutError: No connection became free within acquire_timeout
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    if remaining <= 0:
+                        raise TimeoutError(f"No free connection after {self.acquire_timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._open += 1
+                    conn = None
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                self.created += 1
+                return conn
+
+            if self.clock() - returned_at < self.check_after or self._healthy(conn):
+                return conn
+            self.health_failures += 1
+            self._discard(conn)
+
+    def release(self, conn, broken=False):
+        """
+        Return a connection to the pool
+
+        Args:
+            conn: Connection from acquire()
+            broken (bool): Close it instead (e.g. after a connection error)
+        """
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or self._closed:
+            self.health_failures += broken
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, self.clock()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for one unit of work
+
+        Commits on success, rolls back on error. A connection that fails
+        its health check after an error is closed rather than reused.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.release(conn, broken=not self._healthy(conn))
+            raise
+        self.release(conn)
+
+    def close(self):
+        """Close every idle connection; busy ones close when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'open': self._open,
+                'idle': len(self._idle),
+                'created': self.created,
+                'health_failures': self.health_failures,
+            }
+
+
+class SQLPaymentStore:
+    """
+    Payment storage over any DB-API driver through a ConnectionPool
+    """
+
+    def __init__(self, pool, paramstyle='format'):
+        """
+        Initialize store
+
+        Args:
+            pool (ConnectionPool): Connection pool for the database
+            paramstyle (str): Driver paramstyle ('qmark', 'format', 'pyformat')
+        """
+        self.pool = pool
+        self.sql = StatementCache(paramstyle)
+
+    def create_schema(self, table_sql=PAYMENTS_TABLE_SQL):
+        """Create the payments table and the order_tracking_id index"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(table_sql)
+            cursor.execute(self.sql['index_tracking_id'])
+
+    @staticmethod
+    def _values(payment):
+        if isinstance(payment, PaymentRecord):
+            return (
+                payment.merchant_reference, payment.order_tracking_id,
+                payment.amount, payment.currency, payment.customer_name,
+                payment.customer_email, payment.customer_phone,
+                payment.description, payment.status or 'PENDING',
+                payment.payment_method, payment.confirmation_code,
+            )
+        values = tuple(payment.get(name) for name in WRITE_COLUMNS)
+        return values[:8] + (values[8] or 'PENDING',) + values[9:]
+
+    def _fetch_one(self, statement, value):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.sql[statement], (value,))
+            row = cursor.fetchone()
+        return PaymentRecord.from_row(row) if row else None
+
+    # ----------------------------------------
+    # PaymentDatabase interface
+    # ----------------------------------------
+
+    def create_payment(self, **kwargs):
+        """
+        Create new payment record
+
+        Returns:
+            int: Payment ID
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.sql['insert'], self._values(kwargs))
+            return cursor.fetchone()[0]
+
+    def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
+        """
+        Update payment status
+
+        Returns:
+            bool: True if the payment exists
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.sql['update_status'],
+                           (status, payment_method, confirmation_code, order_tracking_id))
+            return cursor.rowcount > 0
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        """Get payment by order tracking ID (None if unknown)"""
+        return self._fetch_one('select_by_tracking_id', order_tracking_id)
+
+    def get_payment_by_merchant_reference(self, merchant_reference):
+        """Get payment by merchant reference (None if unknown)"""
+        return self._fetch_one('select_by_reference', merchant_reference)
+
+    def get_all_payments(self):
+        """Get all payments, oldest first"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.sql['select_all'])
+            return [PaymentRecord.from_row(row) for row in cursor.fetchall()]
+
+    # ----------------------------------------
+    # Bulk primitives
+    # ----------------------------------------
+
+    def update_payments(self, updates):
+        """
+        Apply many status updates in one transaction
+
+        Args:
+            updates (list): (order_tracking_id, status, payment_method, confirmation_code)
+
+        Returns:
+            int: Number of rows updated (unknown tracking IDs don't count)
+        """
+        updates = [(status, method, code, tracking_id)
+                   for tracking_id, status, method, code in updates]
+        if not updates:
+            return 0
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(self.sql['update_status'], updates)
+            # DB-API lets drivers report -1 when they can't count
+            return cursor.rowcount if cursor.rowcount >= 0 else len(updates)
+
+    def upsert_payments(self, payments):
+        """
+        Insert or update many payments in one transaction
+
+        Args:
+            payments (list): PaymentRecord objects or dicts, keyed by merchant_reference
+
+        Returns:
+            int: Number of payments written
+        """
+        rows = [self._values(payment) for payment in payments]
+        if not rows:
+            return 0
+        with self.pool.connection() as conn:
+            conn.cursor().executemany(self.sql['upsert'], rows)
+        return len(rows)
+
+    def close(self):
+        self.pool.close()
+
+
+class SQLitePaymentStore(SQLPaymentStore):
+    """
+    PaymentDatabase over a pool of sqlite3 connections
+    """
+
+    def __init__(self, db_path='payments.db', pool_size=4, cached_statements=256):
+        """
+        Initialize store
+
+        Args:
+            db_path (str): Database file
+            pool_size (int): Connections kept open
+            cached_statements (int): sqlite3 prepared-statement cache per connection
+        """
+        self.db_path = db_path
+
+        def connect():
+            conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                   cached_statements=cached_statements)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            return conn
+
+        super().__init__(ConnectionPool(connect, max_size=pool_size), paramstyle='qmark')
+        self.create_schema()
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FormatParamConnection:
+    """
+    sqlite3 behind a 'format' (%s) paramstyle, standing in for a
+    PostgreSQL driver so SQLPaymentStore's rendering is exercised
+    """
+
+    class _Cursor:
+        def __init__(self, cursor):
+            self._cursor = cursor
+
+        def execute(self, sql, params=()):
+            self._cursor.execute(sql.replace('%s', '?'), params)
+
+        def executemany(self, sql, rows):
+            self._cursor.executemany(sql.replace('%s', '?'), rows)
+
+        def __getattr__(self, name):
+            return getattr(self._cursor, name)
+
+    def __init__(self, db_path):
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+
+    def cursor(self):
+        return self._Cursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _backends(tmp):
+    import os
+    from payment_repository import InMemoryPaymentRepository
+
+    def sqlite_store():
+        return SQLitePaymentStore(os.path.join(tmp, 'sqlite.db'))
+
+    def pooled_store():
+        path = os.path.join(tmp, 'pooled.db')
+        store = SQLPaymentStore(ConnectionPool(lambda: _FormatParamConnection(path),
+                                               max_size=4), paramstyle='format')
+        store.create_schema()
+        return store
+
+    return [('SQLitePaymentStore', sqlite_store),
+            ('SQLPaymentStore (format)', pooled_store),
+            ('InMemoryPaymentRepository', InMemoryPaymentRepository)]
+
+
+def _contract(store):
+    """The behaviour every backend must share; returns failed check names"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    failures = []
+
+    def check(name, condition):
+        if not condition:
+            failures.append(name)
+
+    payment_id = store.create_payment(
+        merchant_reference='TOUR-1', order_tracking_id='TRACK-1', amount=1500.5,
+        currency='KES', customer_name='Jane', customer_email='jane@example.com',
+        customer_phone='+254712345678', description='Safari',
+    )
+    record = store.get_payment_by_tracking_id('TRACK-1')
+    check('create/get', record is not None and record.id == payment_id
+          and record.amount_minor == 150050 and record.status == 'PENDING')
+    check('get unknown', store.get_payment_by_tracking_id('NOPE') is None)
+    check('by reference', store.get_payment_by_merchant_reference('TOUR-1').order_tracking_id
+          == 'TRACK-1')
+
+    check('update', store.update_payment('TRACK-1', 'Completed', 'M-Pesa', 'ABC123'))
+    record = store.get_payment_by_tracking_id('TRACK-1')
+    check('update applied', record.status == 'Completed' and record.confirmation_code == 'ABC123')
+    check('update unknown', not store.update_payment('NOPE', 'Completed', None, None))
+
+    upserts = [PaymentRecord(f"TRACK-{i}", f"TOUR-{i}", 100 * i, description='Bulk')
+               for i in range(2, 202)]
+    check('upsert insert', store.upsert_payments(upserts) == 200)
+    upserts[1].amount_minor = 1       # the store must not share the caller's objects
+    check('upsert copies', store.get_payment_by_merchant_reference('TOUR-3').amount_minor
+          == 300)
+    changed = PaymentRecord('TRACK-2', 'TOUR-2', 999_900, description='Bulk')
+    check('upsert update', store.upsert_payments([changed]) == 1)
+    check('upsert applied', store.get_payment_by_merchant_reference('TOUR-2').amount_minor
+          == 999_900)
+
+    updates = [(f"TRACK-{i}", 'Failed', 'Card', None) for i in range(2, 202)]
+    check('bulk update', store.update_payments(updates + [('NOPE', 'Failed', None, None)])
+          == 200)
+    statuses = {p.order_tracking_id: p.status for p in store.get_all_payments()}
+    check('bulk update applied', len(statuses) == 201
+          and sum(status == 'Failed' for status in statuses.values()) == 200)
+
+    def concurrent_update(i):
+        return store.update_payment(f"TRACK-{i}", 'Reversed', 'Card', f"R{i}")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(concurrent_update, range(2, 202)))
+    check('concurrent updates', all(results))
+    return failures
+
+
+def test_contract():
+    """Every backend passes the same contract"""
+    import tempfile
+
+    print("\n📝 Test 1: Shared contract tests")
+
+    all_passed = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, make_store in _backends(tmp):
+            store = make_store()
+            failures = _contract(store)
+            if hasattr(store, 'close'):
+                store.close()
+            print(f"   {'✅' if not failures else '❌'} {label} {failures or ''}")
+            all_passed = all_passed and not failures
+
+    if all_passed:
+        print("✅ Test 1 passed!")
+    else:
+        print("❌ Test 1 failed!")
+
+
+def test_pool_health_checks():
+    """Dead idle connections are replaced; exhaustion times out"""
+    import os
+    import tempfile
+
+    print("\n📝 Test 2: Pool health checks and limits")
+
+    clock = [0.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pool.db')
+        pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False),
+                              max_size=2, check_after=5, acquire_timeout=0.05,
+                              clock=lambda: clock[0])
+        first = pool.acquire()
+        pool.release(first)
+        reused = pool.acquire() is first
+        pool.release(first)
+
+        first.close()              # the server dropped it while idle
+        clock[0] += 10
+        replacement = pool.acquire()
+        replaced = replacement is not first and pool.health_failures == 1
+
+        other = pool.acquire()
+        try:
+            pool.acquire()
+            timed_out = False
+        except TimeoutError:
+            timed_out = True
+        pool.release(replacement)
+        pool.release(other)
+        pool.close()
+
+    if reused and replaced and timed_out:
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! reused={reused} replaced={replaced} timed_out={timed_out}")
+
+
+def test_bulk_speedup(rows=5_000):
+    """Bulk updates beat one transaction per update"""
+    import os
+    import tempfile
+
+    print(f"\n📝 Test 3: {rows:,} status updates, one by one vs bulk")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLitePaymentStore(os.path.join(tmp, 'bulk.db'))
+        store.upsert_payments(PaymentRecord(f"TRACK-{i}", f"TOUR-{i}", 1000)
+                              for i in range(rows))
+
+        start = time.perf_counter()
+        for i in range(rows):
+            store.update_payment(f"TRACK-{i}", 'Processing', None, None)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.update_payments((f"TRACK-{i}", 'Completed', 'M-Pesa', None) for i in range(rows))
+        bulk = time.perf_counter() - start
+        store.close()
+
+    print(f"   One by one: {single:.2f}s, bulk: {bulk:.3f}s (x{single / bulk:.0f})")
+    if bulk < single:
+        print("✅ Test 3 passed!")
+    else:
+        print("❌ Test 3 failed!")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING STORAGE BACKENDS")
+    print("=" * 60)
+
+    test_contract()
+    test_pool_health_checks()
+    test_bulk_speedup()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
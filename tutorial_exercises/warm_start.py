@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Warm-Start Snapshots
+====================
+
+After a deploy every worker starts cold: the first request
+authenticates, the IPN id is resolved again and every cached status is
+fetched from Pesapal. The result is a latency spike and a burst of
+upstream traffic.
+
+WarmStartSnapshot saves the state that is expensive to rebuild to a
+local file, on graceful shutdown and every `interval` seconds:
+
+- Access tokens that are still valid (PesapalService and/or every
+  MerchantRegistry tenant)
+- IPN registrations (ipn_id per service / merchant)
+- The hottest entries of the payment status cache
+
+On startup the file is validated before anything is trusted:
+checksum, format version, same Pesapal environment, same consumer key
+(by fingerprint), token not about to expire. Terminal statuses
+(Completed, Failed, ...) are always restored; other statuses only when
+the snapshot is younger than `status_max_age`.
+
+The file holds bearer tokens, so it is written with 0600 permissions.
+
+USAGE:
+    snapshot = WarmStartSnapshot('/var/run/pesapal/warm_start.json')
+    report = snapshot.restore(service=service, cache=cached_db)
+    snapshot.start(service=service, cache=cached_db)   # periodic + at exit
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from merchant_registry import TOKEN_REFRESH_BUFFER
+from payment_record import PaymentRecord, TERMINAL_STATUSES
+
+
+SNAPSHOT_VERSION = 1
+
+
+def key_fingerprint(consumer_key):
+    """Short hash of a consumer key (the key itself is never written)"""
+    return hashlib.sha256((consumer_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+def _expiry_epoch(expiry):
+    """token_expiry as epoch seconds (PesapalService keeps a datetime)"""
+    if expiry is None:
+        return 0.0
+    if isinstance(expiry, datetime):
+        return expiry.timestamp()
+    return float(expiry)
+
+
+def _checksum(body):
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _status_repository(cache):
+    """The InMemoryPaymentRepository inside a cache (or the cache itself)"""
+    return getattr(cache, 'cache', cache)
+
+
+class WarmStartSnapshot:
+    """
+    Saves and restores warm state for one worker
+    """
+
+    def __init__(self, path='warm_start.json', max_status_entries=10_000,
+                 max_age=3600, status_max_age=60, token_margin=TOKEN_REFRESH_BUFFER,
+                 clock=time.time):
+        """
+        Initialize snapshot
+
+        Args:
+            path (str): Snapshot file
+            max_status_entries (int): Most recently used cache entries to keep
+            max_age (float): Ignore snapshots older than this (seconds)
+            status_max_age (float): Restore non-terminal statuses only from
+                                    snapshots younger than this
+            token_margin (float): Drop tokens expiring within this many seconds
+            clock (callable): Time source
+        """
+        self.path = path
+        self.max_status_entries = max_status_entries
+        self.max_age = max_age
+        self.status_max_age = status_max_age
+        self.token_margin = token_margin
+        self.clock = clock
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._targets = {}
+
+    # ----------------------------------------
+    # Capture / save
+    # ----------------------------------------
+
+    def capture(self, service=None, registry=None, cache=None):
+        """
+        Collect warm state
+
+        Args:
+            service: PesapalService (token, token_expiry, ipn_id, base_url)
+            registry (MerchantRegistry): Multi-merchant tokens and IPN ids
+            cache: CachedPaymentDatabase or InMemoryPaymentRepository
+
+        Returns:
+            dict: Snapshot body
+        """
+        now = self.clock()
+        body = {'service': None, 'merchants': [], 'statuses': []}
+
+        if service is not None:
+            expiry = _expiry_epoch(getattr(service, 'token_expiry', None))
+            valid = service.token and expiry > now + self.token_margin
+            body['service'] = {
+                'base_url': service.base_url,
+                'key': key_fingerprint(service.consumer_key),
+                'token': service.token if valid else None,
+                'token_expiry': expiry if valid else 0.0,
+                'ipn_id': getattr(service, 'ipn_id', None),
+            }
+
+        if registry is not None:
+            body['registry_url'] = registry.base_url
+            for context in registry.snapshot():
+                valid = context.token and context.token_expiry > now + self.token_margin
+                if not valid and not context.ipn_id:
+                    continue
+                body['merchants'].append({
+                    'merchant_id': context.merchant_id,
+                    'key': key_fingerprint(context.consumer_key),
+                    'token': context.token if valid else None,
+                    'token_expiry': context.token_expiry if valid else 0.0,
+                    'ipn_id': context.ipn_id,
+                })
+
+        if cache is not None:
+            records = cache.snapshot(self.max_status_entries)
+            body['statuses'] = [record.to_row() for record in records]
+        return body
+
+    def save(self, service=None, registry=None, cache=None):
+        """
+        Write a snapshot atomically
+
+        Returns:
+            int: Bytes written
+        """
+        body = self.capture(service, registry, cache)
+        document = {
+            'version': SNAPSHOT_VERSION,
+            'created_at': self.clock(),
+            'checksum': _checksum(body),
+            'body': body,
+        }
+        data = json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(data)
+
+    # ----------------------------------------
+    # Load / restore
+    # ----------------------------------------
+
+    def load(self):
+        """
+        Read and validate the snapshot file
+
+        Returns:
+            tuple: (document or None, reason string)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                document = json.loads(f.read())
+        except FileNotFoundError:
+            return None, 'no snapshot'
+        except ValueError:
+            return None, 'corrupt snapshot'
+
+        if not isinstance(document, dict) or document.get('version') != SNAPSHOT_VERSION:
+            return None, 'unsupported snapshot version'
+        if _checksum(document.get('body')) != document.get('checksum'):
+            return None, 'checksum mismatch'
+        age = self.clock() - document.get('created_at', 0)
+        if not 0 <= age <= self.max_age:
+            return None, f'snapshot is {age:.0f}s old'
+        return document, 'ok'
+
+    def restore(self, service=None, registry=None, cache=None):
+        """
+        Restore whatever in the snapshot is still valid
+
+        Returns:
+            dict: loaded (bool), reason, tokens, ipn_ids, statuses restored
+        """
+        start = time.perf_counter()
+        report = {'loaded': False, 'reason': '', 'tokens': 0, 'ipn_ids': 0,
+                  'statuses': 0, 'restore_ms': 0.0}
+        document, report['reason'] = self.load()
+        if document is None:
+            return report
+
+        body = document['body']
+        now = self.clock()
+        report['loaded'] = True
+
+        saved = body.get('service')
+        if service is not None and saved and saved['base_url'] == service.base_url \
+                and saved['key'] == key_fingerprint(service.consumer_key):
+            if saved['token'] and saved['token_expiry'] > now + self.token_margin:
+                service.token = saved['token']
+                service.token_expiry = datetime.fromtimestamp(saved['token_expiry'], timezone.utc)
+                report['tokens'] += 1
+            if saved['ipn_id']:
+                service.ipn_id = saved['ipn_id']
+                report['ipn_ids'] += 1
+
+        if registry is not None and body.get('registry_url') == registry.base_url:
+            for saved in body['merchants']:
+                try:
+                    context = registry.context(saved['merchant_id'])
+                except KeyError:
+                    continue
+                if saved['key'] != key_fingerprint(context.consumer_key):
+                    continue        # credentials rotated since the snapshot
+                if saved['token'] and saved['token_expiry'] > now + self.token_margin:
+                    context.token = saved['token']
+                    context.token_expiry = saved['token_expiry']
+                    report['tokens'] += 1
+                if saved['ipn_id'] and not context.ipn_id:
+                    registry.remember_ipn_id(context, saved['ipn_id'])
+                    report['ipn_ids'] += 1
+
+        if cache is not None:
+            repository = _status_repository(cache)
+            fresh = now - document['created_at'] <= self.status_max_age
+            for row in body['statuses']:
+                record = PaymentRecord.from_row(row)
+                if record.status in TERMINAL_STATUSES or fresh:
+                    repository.add_record(record)
+                    report['statuses'] += 1
+
+        report['restore_ms'] = (time.perf_counter() - start) * 1000
+        return report
+
+    # ----------------------------------------
+    # Periodic and shutdown saves
+    # ----------------------------------------
+
+    def _save_targets(self):
+        try:
+            self.save(**self._targets)
+        except Exception as e:
+            print(f"❌ Warm-start snapshot failed: {str(e)}")
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self._save_targets()
+
+    def start(self, interval=60, service=None, registry=None, cache=None):
+        """Save every `interval` seconds and once more at interpreter exit"""
+        self._targets = {'service': service, 'registry': registry, 'cache': cache}
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='warm-start-snapshot', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Graceful shutdown: stop the periodic saver and write a final snapshot"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._save_targets()
+        atexit.unregister(self.stop)
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _FakeService:
+    """The PesapalService attributes a snapshot touches"""
+
+    def __init__(self, consumer_key='key-main'):
+        self.base_url = "https://cybqa.pesapal.com/pesapalv3"
+        self.consumer_key = consumer_key
+        self.token = None
+        self.token_expiry = None
+        self.ipn_id = None
+
+
+class _SlowTransport:
+    """merchant_registry's fake transport with upstream latency"""
+
+    def __init__(self, latency=0.05):
+        from merchant_registry import _FakeTransport
+        self.inner = _FakeTransport()
+        self.latency = latency
+
+    @property
+    def requests(self):
+        return self.inner.requests
+
+    def request(self, method, url, **kwargs):
+        time.sleep(self.latency)
+        return self.inner.request(method, url, **kwargs)
+
+
+def _warm_world(transport):
+    from merchant_registry import MerchantRegistry, _load_fake_credentials
+    from payment_repository import CachedPaymentDatabase, InMemoryPaymentRepository
+
+    registry = MerchantRegistry(_load_fake_credentials, transport=transport)
+    cache = CachedPaymentDatabase(InMemoryPaymentRepository(), max_size=1_000)
+    return registry, cache
+
+
+def _first_request(registry, cache, merchant_id, order_tracking_id):
+    """What a worker does for its first status check"""
+    client = registry.client(merchant_id)
+    client.get_headers()
+    if not client.context.ipn_id:
+        client.register_ipn('https://example.com/ipn')
+    payment = cache.get_payment_by_tracking_id(order_tracking_id)
+    if payment is None:
+        client.get_transaction_status(order_tracking_id)
+    return payment
+
+
+def _seed(registry, cache, merchants=3, payments=100):
+    for m in range(merchants):
+        client = registry.client(f"merchant-{m}")
+        client.get_headers()
+        client.register_ipn('https://example.com/ipn')
+    for i in range(payments):
+        record = PaymentRecord(f"TRACK-{i}", f"TOUR-{i}", 150_000,
+                               status='Completed' if i % 2 else 'PENDING',
+                               created_at=1_700_000_000, updated_at=1_700_000_000)
+        cache.cache.add_record(record)
+
+
+def test_round_trip_and_validation():
+    """Valid state comes back; stale, tampered or foreign state does not"""
+    import tempfile
+
+    print("\n📝 Test 1: Round trip and validation")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'warm.json')
+        registry, cache = _warm_world(_SlowTransport(latency=0))
+        _seed(registry, cache)
+        service = _FakeService()
+        service.token = 'service-token'
+        service.token_expiry = datetime.fromtimestamp(time.time() + 300, timezone.utc)
+        service.ipn_id = 'IPN-MAIN'
+        WarmStartSnapshot(path).save(service=service, registry=registry, cache=cache)
+        mode = os.stat(path).st_mode & 0o777
+
+        registry2, cache2 = _warm_world(_SlowTransport(latency=0))
+        service2 = _FakeService()
+        fresh = WarmStartSnapshot(path).restore(service2, registry2, cache2)
+
+        later = WarmStartSnapshot(path, clock=lambda: time.time() + 120)
+        registry3, cache3 = _warm_world(_SlowTransport(latency=0))
+        stale_statuses = later.restore(cache=cache3)
+
+        rotated = WarmStartSnapshot(path).restore(service=_FakeService('new-key'))
+
+        with open(path) as f:
+            document = json.load(f)
+        document['body']['service']['token'] = 'forged'
+        with open(path, 'w') as f:
+            json.dump(document, f)
+        tampered = WarmStartSnapshot(path).restore(service=_FakeService())
+
+    print(f"   Fresh restore: {fresh['tokens']} tokens, {fresh['ipn_ids']} IPN ids, "
+          f"{fresh['statuses']} statuses in {fresh['restore_ms']:.1f} ms")
+    checks = [
+        mode == 0o600,
+        fresh['tokens'] == 4 and fresh['ipn_ids'] == 4 and fresh['statuses'] == 100,
+        service2.token == 'service-token' and service2.ipn_id == 'IPN-MAIN',
+        cache2.get_payment_by_tracking_id('TRACK-1').status == 'Completed',
+        stale_statuses['statuses'] == 50,
+        rotated['tokens'] == 0,
+        not tampered['loaded'] and tampered['reason'] == 'checksum mismatch',
+    ]
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def test_time_to_first_request(latency=0.05):
+    """Warm start serves the first request without upstream calls"""
+    import tempfile
+
+    print(f"\n📝 Test 2: Time to first served request ({latency * 1000:.0f} ms upstream latency)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'warm.json')
+        registry, cache = _warm_world(_SlowTransport(latency=0))
+        _seed(registry, cache)
+        WarmStartSnapshot(path).save(registry=registry, cache=cache)
+
+        timings = {}
+        for label, use_snapshot in (('cold', False), ('warm', True)):
+            transport = _SlowTransport(latency)
+            registry, cache = _warm_world(transport)
+            start = time.perf_counter()
+            if use_snapshot:
+                WarmStartSnapshot(path).restore(registry=registry, cache=cache)
+            _first_request(registry, cache, 'merchant-1', 'TRACK-7')
+            timings[label] = ((time.perf_counter() - start) * 1000, transport.requests)
+
+    for label, (ms, upstream) in timings.items():
+        print(f"   {label.capitalize()} start: {ms:6.1f} ms to first request, "
+              f"{upstream} upstream calls")
+    if timings['warm'][1] == 0 and timings['warm'][0] < timings['cold'][0]:
+        print("✅ Test 2 passed!")
+    else:
+        print("❌ Test 2 failed!")
+
+
+def test_periodic_and_shutdown_save():
+    """start() saves periodically, stop() writes a final snapshot"""
+    import tempfile
+
+    print("\n📝 Test 3: Periodic and shutdown saves")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'warm.json')
+        service = _FakeService()
+        snapshot = WarmStartSnapshot(path).start(interval=0.05, service=service)
+        time.sleep(0.2)
+        periodic = os.path.exists(path)
+        service.ipn_id = 'IPN-LATE'
+        snapshot.stop()
+        restored = _FakeService()
+        WarmStartSnapshot(path).restore(service=restored)
+
+    if periodic and restored.ipn_id == 'IPN-LATE':
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! periodic={periodic} ipn_id={restored.ipn_id}")
+
+
+def test_capture_under_load(seconds=0.5):
+    """Snapshots taken while workers authenticate, evict and update stay consistent"""
+    import random
+    from merchant_registry import MerchantRegistry, _load_fake_credentials
+    from payment_repository import CachedPaymentDatabase, InMemoryPaymentRepository
+
+    print(f"\n📝 Test 4: Capture while 4 workers churn for {seconds:.1f}s")
+
+    registry = MerchantRegistry(_load_fake_credentials, transport=_SlowTransport(latency=0),
+                                max_tenants=20)
+    cache = CachedPaymentDatabase(InMemoryPaymentRepository(), max_size=500)
+    stop = threading.Event()
+    errors = []
+
+    def churn(seed):
+        rng = random.Random(seed)
+        try:
+            while not stop.is_set():
+                registry.client(f"merchant-{rng.randrange(100)}").get_headers()
+                n = rng.randrange(2_000)
+                cache.cache.add_record(PaymentRecord(f"TRACK-{n}", f"TOUR-{n}", 100))
+                cache.update_payment(f"TRACK-{rng.randrange(2_000)}", 'Completed', 'Card', 'C')
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=churn, args=(i,)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    snapshot = WarmStartSnapshot('unused.json', max_status_entries=300)
+    captures = 0
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            body = snapshot.capture(registry=registry, cache=cache)
+            captures += 1
+            if len(body['statuses']) > 300 or len(body['merchants']) > 20:
+                errors.append(AssertionError('snapshot over its bounds'))
+    except Exception as e:
+        errors.append(e)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    copied = registry.snapshot()
+    copied[0].token = 'changed'
+    untouched = all(context.token != 'changed' for context in registry._contexts.values())
+
+    print(f"   {captures} captures, {registry.evictions} evictions")
+    if not errors and captures and untouched:
+        print("✅ Test 4 passed!")
+    else:
+        print(f"❌ Test 4 failed! {errors[:3]}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING WARM-START SNAPSHOTS")
+    print("=" * 60)
+
+    test_round_trip_and_validation()
+    test_time_to_first_request()
+    test_periodic_and_shutdown_save()
+    test_capture_under_load()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)
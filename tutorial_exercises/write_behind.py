@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Write-Behind Payment Status Updates
+===================================
+
+An order often gets several updates within seconds
+(PENDING -> Processing -> Completed), and each update_payment() call
+costs a commit. WriteBehindPaymentDatabase wraps MockDatabase,
+PaymentDatabase or anything with the same interface and:
+
+- Coalesces non-terminal updates per tracking ID: only the latest one
+  within the flush window is written
+- Flushes pending updates in one batched transaction
+- Writes terminal statuses (Completed, Failed, Reversed, Invalid)
+  synchronously, so a confirmed payment is durable before the IPN
+  response goes back to Pesapal
+- Never reorders: all writes go through one lock, and a terminal write
+  waits for any in-flight batch that might contain an older status
+- Never drops: a batch that fails to write goes back into the pending
+  set (behind any newer update for the same order) and is retried on
+  the next flush
+
+Durability modes:
+    'terminal'  (default) terminal updates sync, others within flush_interval
+    'sync'      every update written immediately (no coalescing)
+
+USAGE:
+    db = WriteBehindPaymentDatabase(PaymentDatabase(), flush_interval=0.5)
+    handler = IPNHandler(db, api)
+    ...
+    db.close()        # flush-on-shutdown (also registered with atexit)
+"""
+
+import atexit
+import copy
+import sqlite3
+import threading
+import time
+
+from payment_record import TERMINAL_STATUSES
+
+
+DURABILITY_MODES = ('terminal', 'sync')
+
+
+def sqlite_batch_update(db_path, updates):
+    """
+    Apply many status updates in one SQLite transaction
+
+    Args:
+        db_path (str): Database file
+        updates (list): (order_tracking_id, status, payment_method, confirmation_code)
+
+    Returns:
+        int: Rows updated
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            cursor = conn.executemany('''
+                UPDATE payments
+                SET status = ?, payment_method = ?, confirmation_code = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE order_tracking_id = ?
+            ''', [(status, method, code, tracking_id)
+                  for tracking_id, status, method, code in updates])
+            return cursor.rowcount
+    finally:
+        conn.close()
+
+
+class WriteBehindPaymentDatabase:
+    """
+    Coalescing write-behind layer in front of a payment database
+    """
+
+    def __init__(self, db, flush_interval=0.5, durability='terminal',
+                 max_pending=10_000, register_atexit=True):
+        """
+        Initialize write-behind layer
+
+        Args:
+            db: PaymentDatabase, MockDatabase or compatible
+            flush_interval (float): Longest a non-terminal update stays in memory
+            durability (str): 'terminal' or 'sync' (see module docstring)
+            max_pending (int): Flush early once this many orders are pending
+            register_atexit (bool): Flush automatically at interpreter exit
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+
+        self.db = db
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.max_pending = max_pending
+
+        self._pending = {}                   # tracking ID -> (status, method, code)
+        self._state_lock = threading.Lock()  # guards _pending
+        self._write_lock = threading.Lock()  # serializes writes to self.db
+        self._wake = threading.Event()
+        self._closed = False
+
+        self.updates_received = 0
+        self.rows_written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.flush_failures = 0
+        self.last_flush_error = None
+
+        self._flusher = None
+        if durability != 'sync':
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             name='payment-write-behind', daemon=True)
+            self._flusher.start()
+        if register_atexit:
+            atexit.register(self.close)
+
+    # ----------------------------------------
+    # Writing
+    # ----------------------------------------
+
+    def _write_batch(self, updates):
+        """Write a batch (caller holds _write_lock)"""
+        if not updates:
+            return
+        db_path = getattr(self.db, 'db_path', None)
+        bulk = getattr(self.db, 'update_payments', None)
+        if bulk is not None:
+            bulk(updates)
+        elif db_path is not None:
+            sqlite_batch_update(db_path, updates)
+        else:
+            for tracking_id, status, method, code in updates:
+                self.db.update_payment(tracking_id, status, method, code)
+        self.rows_written += len(updates)
+        self.batches += 1
+
+    def flush(self):
+        """
+        Write every pending update now
+
+        Returns:
+            int: Number of updates written
+        """
+        # Take the write lock before swapping, so a terminal write for the
+        # same order can't slip in between the swap and this batch
+        with self._write_lock:
+            with self._state_lock:
+                pending, self._pending = self._pending, {}
+            updates = [(tracking_id,) + values for tracking_id, values in pending.items()]
+            try:
+                self._write_batch(updates)
+            except Exception as e:
+                with self._state_lock:
+                    # Put the batch back, keeping any newer update that
+                    # arrived while it was being written
+                    pending.update(self._pending)
+                    self._pending = pending
+                self.flush_failures += 1
+                self.last_flush_error = e
+                raise
+        return len(updates)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The batch is pending again; the next pass retries it
+                print(f"❌ Write-behind flush failed: {str(e)}")
+
+    # ----------------------------------------
+    # PaymentDatabase interface
+    # ----------------------------------------
+
+    def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
+        """
+        Record a status update
+
+        Returns:
+            bool: The database's answer for synchronous writes; for
+                  write-behind updates True, or False if the order
+                  doesn't exist
+        """
+        self.updates_received += 1
+
+        if self._closed or self.durability == 'sync' or status in TERMINAL_STATUSES:
+            with self._write_lock:
+                with self._state_lock:
+                    # This update supersedes anything still pending
+                    self._pending.pop(order_tracking_id, None)
+                self.sync_writes += 1
+                self.rows_written += 1
+                result = self.db.update_payment(
+                    order_tracking_id, status, payment_method, confirmation_code
+                )
+            return True if result is None else result
+
+        with self._state_lock:
+            known = order_tracking_id in self._pending
+        if not known and self._lookup(order_tracking_id) is None:
+            return False
+
+        with self._state_lock:
+            self._pending[order_tracking_id] = (status, payment_method, confirmation_code)
+            backlog = len(self._pending)
+        if backlog >= self.max_pending:
+            self._wake.set()
+        return True
+
+    def _overlay(self, order_tracking_id, payment):
+        """Apply a pending update to a freshly read payment (read-your-writes)"""
+        with self._state_lock:
+            pending = self._pending.get(order_tracking_id)
+        if payment is None or pending is None:
+            return payment
+        # In-memory stores hand back their live record; overlaying that
+        # would skip their indexes and make the update look flushed
+        payment = copy.copy(payment)
+        status, method, code = pending
+        if isinstance(payment, dict):
+            payment.update(status=status, payment_method=method, confirmation_code=code)
+        else:
+            payment.apply_status(status, method, code)
+        return payment
+
+    def _lookup(self, order_tracking_id):
+        """Read a payment straight from the wrapped database"""
+        lookup = getattr(self.db, 'get_payment_by_tracking_id', None) or self.db.get_payment
+        return lookup(order_tracking_id)
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        return self._overlay(order_tracking_id, self._lookup(order_tracking_id))
+
+    # MockDatabase name for the same lookup
+    get_payment = get_payment_by_tracking_id
+
+    def create_payment(self, *args, **kwargs):
+        return self.db.create_payment(*args, **kwargs)
+
+    def get_all_payments(self):
+        self.flush()
+        return self.db.get_all_payments()
+
+    # ----------------------------------------
+    # Shutdown
+    # ----------------------------------------
+
+    def close(self):
+        """Flush-on-shutdown hook: stop the flusher and write everything"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ============================================
+# TEST YOUR CODE
+# ============================================
+
+class _SQLitePayments:
+    """Just enough of PaymentDatabase for the tests"""
+
+    def __init__(self, db_path):
+        from payment_record import PAYMENTS_TABLE_SQL
+        self.db_path = db_path
+        self.commits = 0
+        conn = sqlite3.connect(db_path)
+        conn.execute(PAYMENTS_TABLE_SQL)
+        conn.commit()
+        conn.close()
+
+    def create_payment(self, **kwargs):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                "INSERT INTO payments (merchant_reference, order_tracking_id, amount, currency) "
+                "VALUES (?, ?, ?, ?)",
+                (kwargs['merchant_reference'], kwargs['order_tracking_id'],
+                 kwargs['amount'], kwargs.get('currency', 'KES')),
+            )
+        conn.close()
+
+    def update_payment(self, order_tracking_id, status, payment_method, confirmation_code):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                "UPDATE payments SET status = ?, payment_method = ?, confirmation_code = ?, "
+                "updated_at = CURRENT_TIMESTAMP WHERE order_tracking_id = ?",
+                (status, payment_method, confirmation_code, order_tracking_id),
+            )
+        conn.close()
+        self.commits += 1
+
+    def get_payment_by_tracking_id(self, order_tracking_id):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT status FROM payments WHERE order_tracking_id = ?",
+                           (order_tracking_id,)).fetchone()
+        conn.close()
+        return {'status': row[0]} if row else None
+
+    def get_all_payments(self):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT order_tracking_id, status FROM payments").fetchall()
+        conn.close()
+        return rows
+
+
+def _run_workload(db, orders):
+    for i in range(orders):
+        db.create_payment(merchant_reference=f"TOUR-{i}", order_tracking_id=f"TRACK-{i}",
+                          amount=1500.0)
+    start = time.perf_counter()
+    for status in ('PENDING', 'Processing', 'Processing'):
+        for i in range(orders):
+            db.update_payment(f"TRACK-{i}", status, None, None)
+    for i in range(orders):
+        db.update_payment(f"TRACK-{i}", 'Completed', 'M-Pesa', f"CODE-{i}")
+    return time.perf_counter() - start
+
+
+def test_coalescing(orders=500):
+    """Non-terminal updates coalesce, terminal ones land in order"""
+    import os
+    import tempfile
+
+    print(f"\n📝 Test 1: {orders} orders x 4 updates")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct = _SQLitePayments(os.path.join(tmp, 'direct.db'))
+        direct_seconds = _run_workload(direct, orders)
+
+        backing = _SQLitePayments(os.path.join(tmp, 'behind.db'))
+        with WriteBehindPaymentDatabase(backing, flush_interval=5,
+                                        register_atexit=False) as db:
+            behind_seconds = _run_workload(db, orders)
+            mid_read = db.get_payment('TRACK-0')['status']
+        final = dict(backing.get_all_payments())
+
+    print(f"   Direct:       {orders * 4} commits in {direct_seconds:.2f}s")
+    print(f"   Write-behind: {db.batches} batches + {db.sync_writes} sync writes "
+          f"in {behind_seconds:.2f}s")
+
+    checks = [
+        all(status == 'Completed' for status in final.values()) and len(final) == orders,
+        db.sync_writes == orders,
+        db.rows_written < orders * 4,
+        mid_read == 'Completed',
+    ]
+
+    if all(checks):
+        print("✅ Test 1 passed!")
+    else:
+        print(f"❌ Test 1 failed! Checks: {checks}")
+
+
+def test_flush_on_shutdown():
+    """Pending updates reach the database on close()"""
+    from payment_repository import InMemoryPaymentRepository
+
+    print("\n📝 Test 2: Flush on shutdown")
+
+    backing = InMemoryPaymentRepository()
+    backing.create_payment('TRACK-1', 'TOUR-1', 100)
+    db = WriteBehindPaymentDatabase(backing, flush_interval=60, register_atexit=False)
+    db.update_payment('TRACK-1', 'Processing', None, None)
+
+    before = backing.get_payment('TRACK-1').status
+    seen = db.get_payment('TRACK-1').status
+    db.close()
+    after = backing.get_payment('TRACK-1').status
+
+    if before == 'PENDING' and seen == 'Processing' and after == 'Processing':
+        print("✅ Test 2 passed!")
+    else:
+        print(f"❌ Test 2 failed! {before} / {seen} / {after}")
+
+
+def test_no_reordering(rounds=200):
+    """A terminal write never gets overwritten by an older batched status"""
+    from payment_repository import InMemoryPaymentRepository
+
+    print(f"\n📝 Test 3: Flusher racing terminal writes ({rounds} rounds)")
+
+    backing = InMemoryPaymentRepository()
+    db = WriteBehindPaymentDatabase(backing, flush_interval=0.0005, register_atexit=False)
+    for i in range(rounds):
+        backing.create_payment(f"TRACK-{i}", f"TOUR-{i}", 100)
+        db.update_payment(f"TRACK-{i}", 'Processing', None, None)
+        db.update_payment(f"TRACK-{i}", 'Completed', 'M-Pesa', 'ABC')
+    db.close()
+
+    wrong = [r for r in backing.payments.values() if r.status != 'Completed']
+    if not wrong:
+        print("✅ Test 3 passed!")
+    else:
+        print(f"❌ Test 3 failed! {len(wrong)} payments regressed")
+
+
+class _FlakyRepository:
+    """InMemoryPaymentRepository whose batch writes fail `failures` times"""
+
+    def __init__(self, failures):
+        from payment_repository import InMemoryPaymentRepository
+        self.repo = InMemoryPaymentRepository()
+        self.failures = failures
+
+    def update_payments(self, updates):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.repo.update_payments(updates)
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+
+def test_failed_flush_retried():
+    """A failed batch is retried without losing it or overwriting newer updates"""
+    print("\n📝 Test 4: Failed flush is retried, unknown orders rejected")
+
+    backing = _FlakyRepository(failures=1)
+    for i in range(3):
+        backing.create_payment(f"TRACK-{i}", f"TOUR-{i}", 100)
+    db = WriteBehindPaymentDatabase(backing, flush_interval=60, register_atexit=False)
+    db.update_payment('TRACK-0', 'Processing', None, None)
+    db.update_payment('TRACK-1', 'Processing', None, None)
+
+    try:
+        db.flush()
+        raised = False
+    except sqlite3.OperationalError:
+        raised = True
+    db.update_payment('TRACK-1', 'Reviewing', None, None)   # newer than the failed batch
+    pending_after_failure = dict(db._pending)
+    db.flush()
+    statuses = [backing.get_payment(f"TRACK-{i}").status for i in range(3)]
+    unknown = db.update_payment('TRACK-404', 'Processing', None, None)
+    db.close()
+
+    checks = [
+        raised and db.flush_failures == 1,
+        pending_after_failure.get('TRACK-0', ('',))[0] == 'Processing',
+        pending_after_failure.get('TRACK-1', ('',))[0] == 'Reviewing',
+        statuses == ['Processing', 'Reviewing', 'PENDING'],
+        unknown is False and 'TRACK-404' not in db._pending,
+    ]
+
+    if all(checks):
+        print("✅ Test 4 passed!")
+    else:
+        print(f"❌ Test 4 failed! Checks: {checks} {statuses}")
+
+
+def test_read_leaves_store_alone():
+    """Reading a pending update doesn't write it into the backing store"""
+    from payment_repository import InMemoryPaymentRepository
+
+    print("\n📝 Test 5: Read-your-writes doesn't touch the backing record")
+
+    backing = InMemoryPaymentRepository()
+    backing.create_payment("TRACK-1", "TOUR-1", 100)
+    db = WriteBehindPaymentDatabase(backing, flush_interval=60, register_atexit=False)
+    db.update_payment('TRACK-1', 'Processing', 'MPESA', None)
+
+    seen = db.get_payment_by_tracking_id('TRACK-1').status
+    before_flush = (backing.get_payment_by_tracking_id('TRACK-1').status,
+                    len(backing.find_by_status('PENDING')),
+                    len(backing.find_by_status('Processing')))
+    db.flush()
+    after_flush = (backing.get_payment_by_tracking_id('TRACK-1').status,
+                   len(backing.find_by_status('PENDING')),
+                   len(backing.find_by_status('Processing')))
+    db.close()
+
+    checks = [
+        seen == 'Processing',
+        before_flush == ('PENDING', 1, 0),
+        after_flush == ('Processing', 0, 1),
+    ]
+
+    if all(checks):
+        print("✅ Test 5 passed!")
+    else:
+        print(f"❌ Test 5 failed! Checks: {checks} {before_flush} {after_flush}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("TESTING WRITE-BEHIND UPDATES")
+    print("=" * 60)
+
+    test_coalescing()
+    test_flush_on_shutdown()
+    test_no_reordering()
+    test_failed_flush_retried()
+    test_read_leaves_store_alone()
+
+    print("\n" + "=" * 60)
+    print("ALL TESTS COMPLETED!")
+    print("=" * 60)